@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Measures memory allocations of MessageConverter and MessageRouter per message using tracemalloc.
+
+Usage: python -m benchmarks.bench_allocations
+"""
+import gc
+import os
+import tracemalloc
+
+from deluder.common import *
+from deluder.converter import MessageConverter
+from deluder.router import MessageRouter
+
+from benchmarks.common import create_frida_message
+
+
+MESSAGES = 10000
+PAYLOAD_SIZE = 1024
+METADATA = {
+    MetadataType.SOCKET: 5,
+    MetadataType.PROTOCOL: 'tcp',
+    MetadataType.CONNECTION_ID: 'libc-5',
+    MetadataType.CONNECTION_SOURCE_IP: '127.0.0.1',
+    MetadataType.CONNECTION_SOURCE_PORT: 51234,
+    MetadataType.CONNECTION_DESTINATION_IP: '127.0.0.1',
+    MetadataType.CONNECTION_DESTINATION_PORT: 443,
+    MetadataType.MODULE: 'libc',
+}
+
+
+class NullScript:
+    """
+    Script stand-in, which does not encode the responses (so that only Deluder allocations are measured)
+    """
+    def post(self, message: dict, data: Optional[bytes]=None):
+        pass
+
+
+def measure_retained(messages: List[dict], data: bytes) -> float:
+    """
+    Measures memory retained by converted messages (per message)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    converted = [MessageConverter.convert(message, data) for message in messages]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = (current - start) / len(converted)
+    del converted
+    return retained
+
+
+def measure_peak(messages: List[dict], data: bytes) -> float:
+    """
+    Measures average peak of memory allocated while routing a single message
+    """
+    router = MessageRouter(interceptors=[])
+    process = Process(pid=1, script=NullScript())
+    gc.collect()
+    tracemalloc.start()
+    total = 0
+    for message in messages:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        router.route(process, message, data)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - current
+    tracemalloc.stop()
+    return total / len(messages)
+
+
+def measure_blocks(messages: List[dict], data: bytes) -> float:
+    """
+    Measures number of memory blocks retained by converted messages (per message)
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    converted = [MessageConverter.convert(message, data) for message in messages]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    del converted
+    return blocks / len(messages)
+
+
+def main():
+    data = os.urandom(PAYLOAD_SIZE)
+
+    def create_messages():
+        # Converter takes ownership of the payloads, so each measurement needs fresh messages
+        return [create_frida_message(MessageType.SEND, f'id-{i}', METADATA) for i in range(MESSAGES)]
+
+    print(f'Messages: {MESSAGES}, payload size: {PAYLOAD_SIZE} B')
+    print(f'Retained bytes per converted message: {measure_retained(create_messages(), data):.1f}')
+    print(f'Retained blocks per converted message: {measure_blocks(create_messages(), data):.2f}')
+    print(f'Peak bytes per routed message: {measure_peak(create_messages(), data):.1f}')
+
+
+if __name__ == '__main__':
+    main()
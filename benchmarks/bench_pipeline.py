@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Measures throughput and latency of MessageRouter with built-in interceptors on synthetic message streams.
+PETEP and proxifier strategies run against local stand-ins (PETEP echo server and echo proxy),
+scenarios with -unix use Unix domain sockets instead of TCP loopback.
+
+Usage: python -m benchmarks.bench_pipeline [--size 1024] [--messages 2000] [--connections 4] [--shards 0]
+                                           [--scenarios log,petep,...] [--output results.json]
+                                           [--baseline baseline.json] [--threshold 0.1]
+
+Exits with status 1 if any scenario regressed against the baseline by more than the threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import tempfile
+import sys
+import threading
+import time
+
+from typing import Tuple
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.interceptors import DebugMessageInterceptor, LogMessageInterceptor, PetepMessageInterceptor, ProxifierMessageInterceptor, RewriteMessageInterceptor
+from deluder.router import MessageRouter
+from deluder.stats import LatencyHistogram
+
+from benchmarks.common import create_fake_process, create_frida_message, format_rate
+from benchmarks.servers import EchoProxy, PetepStandIn, find_free_port
+
+
+SCENARIOS = [
+    'none', 'log', 'debug', 'rewrite', 'petep', 'petep-unix',
+    'proxifier-buffer', 'proxifier-suffix', 'proxifier-length', 'proxifier-asyncio-length', 'proxifier-unix-length',
+]
+DEFAULT_THRESHOLD = 0.1
+
+
+class CompletionProbe(MessageInterceptor):
+    """
+    Last interceptor in the chain, which records latency from routing of the message to the end of the interception
+    """
+    def __init__(self, expected: int):
+        super().__init__()
+        self.submitted = {}
+        self.histogram = LatencyHistogram()
+        self.expected = expected
+        self.completed = 0
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def is_read_only(self) -> bool:
+        return True
+
+    def submit(self, id: str):
+        self.submitted[id] = time.perf_counter_ns()
+
+    def intercept(self, process: Process, message: Message):
+        end = time.perf_counter_ns()
+        with self.lock:
+            self.histogram.record(end - self.submitted.pop(message.id))
+            self.completed += 1
+            if self.completed == self.expected:
+                self.done.set()
+
+
+class Scenario:
+    """
+    Interceptor setup measured by the benchmark (including stand-in servers it needs)
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.servers = []
+        self.interceptors = []
+        self.log_level = None
+
+    def start(self):
+        if self.name == 'log':
+            self.interceptors.append(LogMessageInterceptor())
+        elif self.name == 'debug':
+            self.log_level = logging.DEBUG
+            self.interceptors.append(DebugMessageInterceptor())
+        elif self.name == 'rewrite':
+            # The same find/replace rules, which would be otherwise done by PETEP or proxy behind proxifier
+            self.interceptors.append(RewriteMessageInterceptor({'rules': [
+                {'find': 'Authorization: Basic', 'replace': 'Authorization: Bearer'},
+                {'findHex': 'deadbeef', 'replaceHex': 'cafebabe'},
+                {'findRegex': r'session=\w+', 'replace': 'session=deluder'},
+            ]}))
+        elif self.name.startswith('petep'):
+            host = self._get_host('petep')
+            petep = self._start_server(PetepStandIn(host=host))
+            self.interceptors.append(PetepMessageInterceptor({'petepHost': host, 'petepPort': petep.port}))
+        elif self.name.startswith('proxifier-'):
+            server_host = self._get_host('server')
+            server_port = find_free_port()
+            proxy_host = self._get_host('proxy')
+            proxy = self._start_server(EchoProxy(target_port=server_port, target_host=server_host, host=proxy_host))
+            parts = self.name.split('-')
+            self.interceptors.append(ProxifierMessageInterceptor({
+                'proxyHost': proxy_host,
+                'proxyPort': proxy.port,
+                'serverHost': server_host,
+                'serverPort': server_port,
+                'strategy': parts[-1],
+                'engine': 'asyncio' if 'asyncio' in parts else 'threaded',
+            }))
+
+        for interceptor in self.interceptors:
+            interceptor.init()
+
+    def stop(self):
+        for interceptor in self.interceptors:
+            interceptor.destroy()
+        for server in self.servers:
+            server.stop()
+
+    def _get_host(self, name: str) -> str:
+        # Scenarios with -unix suffix use Unix domain sockets in temporary directory instead of TCP loopback
+        if 'unix' in self.name.split('-'):
+            return 'unix:' + os.path.join(tempfile.gettempdir(), f'deluder-bench-{os.getpid()}-{name}.sock')
+        return '127.0.0.1'
+
+    def _start_server(self, server):
+        server.start()
+        self.servers.append(server)
+        return server
+
+
+def create_messages(count: int, connections: int) -> List[Tuple[dict, str]]:
+    """
+    Creates synthetic stream of send/recv messages interleaved across given number of connections
+    """
+    messages = []
+    for i in range(count):
+        connection = i % connections
+        type = MessageType.SEND if (i // connections) % 2 == 0 else MessageType.RECV
+        metadata = {
+            MetadataType.CONNECTION_ID: f'bench-{connection}',
+            MetadataType.MODULE: 'libc',
+            MetadataType.PROTOCOL: 'tcp',
+            MetadataType.SOCKET: connection,
+            MetadataType.CONNECTION_SOURCE_IP: '127.0.0.1',
+            MetadataType.CONNECTION_SOURCE_PORT: 40000 + connection,
+            MetadataType.CONNECTION_DESTINATION_IP: '127.0.0.1',
+            MetadataType.CONNECTION_DESTINATION_PORT: 443,
+        }
+        id = f'id-{i}'
+        messages.append((create_frida_message(type, id, metadata), id))
+    return messages
+
+
+def run_scenario(name: str, args: argparse.Namespace) -> dict:
+    """
+    Routes the synthetic stream through interceptors of given scenario and measures throughput and latency
+    """
+    scenario = Scenario(name)
+    previous_level = logging.root.level
+    previous_streams = [handler.setStream(open(os.devnull, 'w')) for handler in logging.root.handlers]
+    try:
+        scenario.start()
+        if scenario.log_level is not None:
+            logging.root.setLevel(scenario.log_level)
+
+        probe = CompletionProbe(args.messages)
+        interceptors = scenario.interceptors + [probe]
+        router = MessageRouter(
+            interceptors=interceptors,
+            observe_only=all(interceptor.is_read_only() for interceptor in interceptors),
+            queue_size=args.messages,
+            shards=args.shards,
+        )
+        process = create_fake_process()
+        data = os.urandom(args.size)
+        messages = create_messages(args.messages, args.connections)
+
+        router.start()
+        start = time.perf_counter()
+        for message, id in messages:
+            probe.submit(id)
+            router.route(process, message, data)
+        probe.done.wait()
+        elapsed = time.perf_counter() - start
+        router.stop()
+    finally:
+        scenario.stop()
+        logging.root.setLevel(previous_level)
+        for handler, stream in zip(logging.root.handlers, previous_streams):
+            handler.setStream(stream).close()
+
+    return {
+        'messages': args.messages,
+        'bytes': args.messages * args.size,
+        'seconds': elapsed,
+        'messagesPerSecond': args.messages / elapsed,
+        'bytesPerSecond': args.messages * args.size / elapsed,
+        'latency': probe.histogram.summary(),
+    }
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Compares results with baseline results, returns descriptions of regressions over given threshold
+    """
+    regressions = []
+    for name, result in results['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(name)
+        if expected is None:
+            continue
+        if result['messagesPerSecond'] < expected['messagesPerSecond'] * (1 - threshold):
+            regressions.append(f'{name}: throughput {result["messagesPerSecond"]:.0f} msg/s < baseline {expected["messagesPerSecond"]:.0f} msg/s')
+        if result['latency']['p95'] > expected['latency']['p95'] * (1 + threshold):
+            regressions.append(f'{name}: p95 latency {result["latency"]["p95"]:.3f} ms > baseline {expected["latency"]["p95"]:.3f} ms')
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark of Deluder interceptor pipeline')
+    parser.add_argument('--size', type=int, default=1024, help='Size of each message in bytes')
+    parser.add_argument('--messages', type=int, default=2000, help='Number of messages per scenario')
+    parser.add_argument('--connections', type=int, default=4, help='Number of connections the messages are spread across')
+    parser.add_argument('--shards', type=int, default=0, help='Number of router shards (0 processes messages inline)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'Comma separated scenarios ({", ".join(SCENARIOS)})')
+    parser.add_argument('--output', help='Stores results to given JSON file')
+    parser.add_argument('--baseline', help='Compares results with given JSON file from previous run')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed relative regression against the baseline')
+    args = parser.parse_args()
+    for name in args.scenarios.split(','):
+        if name not in SCENARIOS:
+            parser.error(f'Unknown scenario {name}!')
+    return args
+
+
+def main():
+    args = parse_args()
+    results = {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'size': args.size,
+            'messages': args.messages,
+            'connections': args.connections,
+            'shards': args.shards,
+        },
+        'scenarios': {},
+    }
+
+    print(f'{"scenario":>24}  {"msg/s":>10}  {"throughput":>14}  {"p50 ms":>8}  {"p95 ms":>8}  {"p99 ms":>8}')
+    for name in args.scenarios.split(','):
+        result = results['scenarios'][name] = run_scenario(name, args)
+        latency = result['latency']
+        print(f'{name:>24}  {result["messagesPerSecond"]:>10.0f}  {format_rate(result["bytesPerSecond"]):>14}  '
+              f'{latency["p50"]:>8.3f}  {latency["p95"]:>8.3f}  {latency["p99"]:>8.3f}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('config') != results['config']:
+            print(f'WARNING baseline was measured with different config {baseline.get("config")}')
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions over {args.threshold:.0%} against {args.baseline}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Compares JSON, binary and unchanged response paths from MessageRouter to the agent for payloads of various sizes.
+
+Usage: python -m benchmarks.bench_responses
+"""
+import os
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.router import MessageRouter
+
+from benchmarks.common import create_fake_process, create_frida_message, measure, format_rate
+
+
+PAYLOAD_SIZES = [1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024]
+TOTAL_BYTES_PER_RUN = 32 * 1024 * 1024
+
+
+class SwapMessageInterceptor(MessageInterceptor):
+    """
+    Replaces the payload with prepared data of the same size (so the full response has to be sent back)
+    """
+    def __init__(self, data: bytes):
+        super().__init__()
+        self.data = data
+
+    def intercept(self, process: Process, message: Message):
+        message.data = self.data
+
+
+def run(size: int, binary_responses: bool, modify: bool) -> float:
+    interceptors = [SwapMessageInterceptor(os.urandom(size))] if modify else []
+    router = MessageRouter(interceptors=interceptors, binary_responses=binary_responses)
+    process = create_fake_process()
+    data = os.urandom(size)
+    metadata = {MetadataType.CONNECTION_ID: 'libc-1', MetadataType.MODULE: 'libc'}
+    iterations = max(TOTAL_BYTES_PER_RUN // size, 8)
+
+    def route():
+        router.route(process, create_frida_message(MessageType.SEND, 'id-1', metadata), data)
+
+    elapsed = measure(route, iterations)
+    return size * iterations / elapsed
+
+
+def main():
+    print(f'{"size":>10}  {"json":>14}  {"binary":>14}  {"unchanged":>14}  {"speedup":>8}')
+    for size in PAYLOAD_SIZES:
+        json_rate = run(size, binary_responses=False, modify=True)
+        binary_rate = run(size, binary_responses=True, modify=True)
+        unchanged_rate = run(size, binary_responses=True, modify=False)
+        print(f'{size:>10}  {format_rate(json_rate):>14}  {format_rate(binary_rate):>14}  {format_rate(unchanged_rate):>14}  {binary_rate / json_rate:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
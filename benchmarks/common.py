@@ -0,0 +1,69 @@
+import json
+import time
+
+from typing import Callable, Optional
+
+from deluder.common import *
+
+
+class FakeScript:
+    """
+    Stand-in for Frida script, which mimics the encoding done by Frida when posting messages to the agent
+    and the decoding done by the agent when it receives them
+    """
+    def __init__(self):
+        self.posted = 0
+        self.posted_bytes = 0
+
+    def post(self, message: dict, data: Optional[bytes]=None):
+        raw_message = json.dumps(message)
+        self.posted += 1
+        self.posted_bytes += len(raw_message) + (len(data) if data is not None else 0)
+
+        # Agent side: JSON.parse and rebuilding of the payload (binary data is copied by Frida once)
+        response = json.loads(raw_message)
+        if 'data' in response:
+            bytes(response['data'])
+        elif data is not None:
+            bytearray(data)
+
+
+def create_fake_process(pid: int=1) -> Process:
+    """
+    Creates process descriptor, which can be used for routing messages without Frida target
+    """
+    return Process(pid=pid, session=None, script=FakeScript())
+
+
+def create_frida_message(type: MessageType, id: str, metadata: Dict[str, any]) -> dict:
+    """
+    Creates message in the same format as it is received from Frida script
+    """
+    payload = dict(metadata)
+    payload['id'] = id
+    payload['type'] = type.value
+    return {
+        'type': 'send',
+        'payload': payload,
+    }
+
+
+def measure(function: Callable[[], None], iterations: int) -> float:
+    """
+    Runs function for given number of iterations and returns elapsed time in seconds
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return time.perf_counter() - start
+
+
+def format_rate(value: float) -> str:
+    """
+    Formats bytes/sec to human readable form
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if value < 1024:
+            return f'{value:.1f} {unit}/s'
+        value /= 1024
+    return f'{value:.1f} TiB/s'
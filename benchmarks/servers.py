@@ -0,0 +1,133 @@
+import socket
+import threading
+
+from deluder.transport import parse_endpoint
+from deluder.utils import recv_n, try_close
+from deluder.interceptors.petep.common import PetepDeluderMessageType
+
+
+RELAY_BUFFER_SIZE = 65536
+
+
+def find_free_port(host: str='127.0.0.1') -> int:
+    """
+    Finds free TCP port on given host
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+class StandInServer:
+    """
+    Base class for local servers used by benchmarks, which accept any number of connections
+    (the socket is bound in start, so clients can connect as soon as start returns;
+    host can be unix:/path endpoint)
+    """
+    host: str
+    port: int
+    server_sock: socket.socket
+
+    def __init__(self, host: str='127.0.0.1', port: int=0):
+        self.host = host
+        self.port = port
+        self.sockets = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Binds the server socket and starts accepting connections in background
+        """
+        self.endpoint = parse_endpoint(self.host, self.port)
+        self.server_sock = self.endpoint.listen(128)
+        if not self.endpoint.is_unix():
+            self.port = self.server_sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def stop(self):
+        """
+        Stops the server and closes all accepted connections
+        """
+        try_close(self.server_sock)
+        self.endpoint.remove_socket_file()
+        with self.lock:
+            for sock in self.sockets:
+                try_close(sock)
+            self.sockets.clear()
+
+    def handle(self, client_sock: socket.socket):
+        """
+        Handles accepted connection (runs in its own thread)
+        """
+        raise Exception('Not implemented!')
+
+    def _track(self, sock: socket.socket):
+        if sock.family != getattr(socket, 'AF_UNIX', None):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.lock:
+            self.sockets.append(sock)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client_sock, _ = self.server_sock.accept()
+            except OSError:
+                return
+            self._track(client_sock)
+            threading.Thread(target=self._handle_safely, args=(client_sock,), daemon=True).start()
+
+    def _handle_safely(self, client_sock: socket.socket):
+        try:
+            self.handle(client_sock)
+        except Exception:
+            pass
+        finally:
+            try_close(client_sock)
+
+
+class PetepStandIn(StandInServer):
+    """
+    PETEP stand-in, which returns all intercepted data unchanged
+    """
+    def handle(self, client_sock: socket.socket):
+        data_types = {PetepDeluderMessageType.DATA_C2S.value, PetepDeluderMessageType.DATA_S2C.value}
+        while True:
+            header = recv_n(client_sock, 5)
+            length = int.from_bytes(header[1:], 'big')
+            data = recv_n(client_sock, length)
+            if header[0] in data_types:
+                client_sock.sendall(header + data)
+
+
+class EchoProxy(StandInServer):
+    """
+    TCP proxy stand-in, which relays all data between the client and the target unchanged
+    """
+    def __init__(self, target_port: int, target_host: str='127.0.0.1', host: str='127.0.0.1', port: int=0):
+        super().__init__(host, port)
+        self.target_host = target_host
+        self.target_port = target_port
+
+    def handle(self, client_sock: socket.socket):
+        target_sock = parse_endpoint(self.target_host, self.target_port).connect()
+        self._track(target_sock)
+        relay = threading.Thread(target=self._relay, args=(target_sock, client_sock), daemon=True)
+        relay.start()
+        self._relay(client_sock, target_sock)
+        relay.join()
+
+    @staticmethod
+    def _relay(source: socket.socket, target: socket.socket):
+        try:
+            while True:
+                data = source.recv(RELAY_BUFFER_SIZE)
+                if not data:
+                    break
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try_close(target)
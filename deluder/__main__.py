@@ -2,8 +2,10 @@
 
 import argparse
 import json
+import sys
 
 from deluder.core import Deluder, create_default_config
+from deluder.replay import Replayer
 from deluder.interceptors import INTERCEPTORS_REGISTRY, AVAILABLE_INTERCEPTORS
 from deluder.script import AVAILABLE_SCRIPTS, SCRIPTS_DEFAULT_CONFIGS
 from deluder.common import *
@@ -19,6 +21,17 @@ def main():
         example_config = {
             'debug': config.debug,
             'ignoreChildProcesses': config.ignore_child_processes,
+            'binaryResponses': config.binary_responses,
+            'queueSize': config.queue_size,
+            'shards': config.shards,
+            'fanOut': config.fan_out,
+            'statsInterval': config.stats_interval,
+            'filters': config.filters,
+            'logQueueSize': config.log_queue_size,
+            'logOverflow': config.log_overflow,
+            'logFile': config.log_file,
+            'logFileMaxBytes': config.log_file_max_bytes,
+            'logFileBackups': config.log_file_backups,
             'interceptors': [],
             'scripts': [],
         }
@@ -60,6 +73,12 @@ def main():
         parser.add_argument('--ignore-child-processes', action='store_true', default=config.ignore_child_processes,
                             help=f'Disables automatic child process hooking')
 
+        parser.add_argument('--stats-interval', type=float, metavar='<seconds>',
+                            help=f'Periodically logs performance stats of Deluder in given interval')
+
+        parser.add_argument('--log-file', metavar='<path>',
+                            help=f'Writes the log also to given file')
+
 
     parser = argparse.ArgumentParser(
         prog='deluder',
@@ -82,6 +101,15 @@ def main():
     parser_attach.add_argument('pid_or_name', metavar='PID/ProcessName', type=str,
                             help='PID or process name of the target application')
 
+    parser_replay = commands.add_parser('replay', help='Replay recorded messages through interceptors without target application')
+    add_common_arguments(parser_replay)
+    parser_replay.add_argument('--pace', action='store_true', default=False,
+                               help='Replay messages at the recorded pace instead of as fast as possible')
+    parser_replay.add_argument('--speed', type=float, default=1.0, metavar='<multiplier>',
+                               help='Speed multiplier of the recorded pace (used with --pace)')
+    parser_replay.add_argument('file', metavar='<recording>', type=str,
+                               help='Path to the recording created by record interceptor')
+
     parser_example_config = commands.add_parser('config', help='Get example config with default values')
 
     # Parse arguments
@@ -109,6 +137,39 @@ def main():
 
             if 'ignoreChildProcesses' in config_dict:
                 config.ignore_child_processes = config_dict['ignoreChildProcesses']
+
+            if 'binaryResponses' in config_dict:
+                config.binary_responses = config_dict['binaryResponses']
+
+            if 'queueSize' in config_dict:
+                config.queue_size = config_dict['queueSize']
+
+            if 'shards' in config_dict:
+                config.shards = config_dict['shards']
+
+            if 'fanOut' in config_dict:
+                config.fan_out = config_dict['fanOut']
+
+            if 'statsInterval' in config_dict:
+                config.stats_interval = config_dict['statsInterval']
+
+            if 'filters' in config_dict:
+                config.filters = config_dict['filters']
+
+            if 'logQueueSize' in config_dict:
+                config.log_queue_size = config_dict['logQueueSize']
+
+            if 'logOverflow' in config_dict:
+                config.log_overflow = config_dict['logOverflow']
+
+            if 'logFile' in config_dict:
+                config.log_file = config_dict['logFile']
+
+            if 'logFileMaxBytes' in config_dict:
+                config.log_file_max_bytes = config_dict['logFileMaxBytes']
+
+            if 'logFileBackups' in config_dict:
+                config.log_file_backups = config_dict['logFileBackups']
                 
             if 'interceptors' in config_dict:
                 config.interceptors = []
@@ -138,9 +199,22 @@ def main():
     if args.ignore_child_processes:
         config.ignore_child_processes = True
 
+    if args.stats_interval is not None:
+        config.stats_interval = args.stats_interval
+
+    if args.log_file is not None:
+        config.log_file = args.log_file
+
     if args.remote:
         remote_host = args.remote
 
+    if args.command == 'replay':
+        try:
+            Replayer(args.file, config=config, paced=args.pace, speed=args.speed).replay()
+        except Exception:
+            sys.exit(1) # Error is already logged by the replayer
+        return
+
     # Create deluder
     if args.command == 'run':
         deluder = Deluder.for_new_app(app_path=args.path, remote_host=remote_host, config=config)
@@ -7,6 +7,28 @@ from typing import List, Dict, Optional
 
 VERSION = "1.2.1"
 
+DEFAULT_QUEUE_SIZE = 10000
+"""
+Default maximum number of messages waiting for background processing (in each dispatcher shard)
+"""
+
+DEFAULT_SHARDS = 0
+"""
+Default number of dispatcher shards processing messages of different connections in parallel
+(0 intercepts messages one at a time on the Frida's message thread, parallel interception is opt-in)
+"""
+
+DEFAULT_MAX_CONNECTIONS = 65536
+"""
+Maximum number of connections in the connection table of a process (the same as `connectionHandlesSize` of scripts,
+which forget the oldest connections and assign them new handles)
+"""
+
+DEFAULT_LOG_QUEUE_SIZE = 10000
+"""
+Default maximum number of log records waiting for the log thread
+"""
+
 
 @dataclass
 class Process:
@@ -16,6 +38,7 @@ class Process:
     pid: int
     session: frida.core.Session = None
     script: Optional[frida.core.Script] = None
+    connections: 'ConnectionTable' = field(default_factory=lambda: ConnectionTable())
     
     def __hash__(self):
         return hash(self.pid)
@@ -29,6 +52,7 @@ class MessageType(str, enum.Enum):
     SEND = 's'
     RECV = 'r'
     CLOSE = 'c'
+    BATCH = 'b'
 
 
 class MetadataType(str, enum.Enum):
@@ -44,6 +68,7 @@ class MetadataType(str, enum.Enum):
     CONNECTION_DESTINATION_IP = 'cdi'
     CONNECTION_DESTINATION_PORT = 'cdp'
     CONNECTION_DESTINATION_PATH = 'cdpa'
+    CONNECTION_HANDLE = 'h'
     MODULE = 'm'
 
 
@@ -51,7 +76,9 @@ class MetadataType(str, enum.Enum):
 class Message:
     """
     Base class for all Deluder message types
+    (messages are slotted, since a new message is created for each intercepted call)
     """
+    __slots__ = ('id', 'type', 'metadata')
     id: str
     type: MessageType
     metadata: Dict[str, any]
@@ -61,7 +88,9 @@ class Message:
 class DataMessage(Message):
     """
     Base class for Deluder data message types
+    (data is bytes-like object, messages received from scripts always carry bytes)
     """
+    __slots__ = ('data',)
     data: bytes
 
 
@@ -70,6 +99,8 @@ class SendMessage(DataMessage):
     """
     Message intercepted in send/encrypt library functions (representing communication from the client to the server)
     """
+    __slots__ = ()
+
     def __init__(self, id: str, data: bytes, metadata: Dict[str, any]):
         super().__init__(id=id, type=MessageType.SEND, data=data, metadata=metadata)
 
@@ -79,6 +110,8 @@ class RecvMessage(DataMessage):
     """
     Message intercepted in recv/decrypt library functions (representing communication from the server to the client)
     """
+    __slots__ = ()
+
     def __init__(self, id: str, data: bytes, metadata: Dict[str, any]):
         super().__init__(id=id, type=MessageType.RECV, data=data, metadata=metadata)
 
@@ -88,10 +121,111 @@ class CloseMessage(Message):
     """
     Message intercepted in close/shutdown library functions (representing closing of the connection)
     """
+    __slots__ = ()
+
     def __init__(self, id: str, metadata: Dict[str, any]):
         super().__init__(id=id, type=MessageType.CLOSE, metadata=metadata)
 
 
+@dataclass
+class ConnectionDescriptor:
+    """
+    Connection descriptor, which is registered once the script sends full metadata of the connection
+    (following messages of the connection only contain the connection handle)
+    """
+    handle: int
+    id: Optional[str]
+    metadata: Dict[str, any]
+    state: Dict[str, any] = field(default_factory=dict)
+    """
+    Custom per-connection state, which can be used by interceptors
+    """
+
+    @property
+    def socket(self) -> Optional[int]:
+        return self.metadata.get(MetadataType.SOCKET)
+
+    @property
+    def protocol(self) -> Optional[str]:
+        return self.metadata.get(MetadataType.PROTOCOL)
+
+    @property
+    def module(self) -> Optional[str]:
+        return self.metadata.get(MetadataType.MODULE)
+
+    @property
+    def source_ip(self) -> Optional[str]:
+        return self.metadata.get(MetadataType.CONNECTION_SOURCE_IP)
+
+    @property
+    def source_port(self) -> Optional[int]:
+        return self.metadata.get(MetadataType.CONNECTION_SOURCE_PORT)
+
+    @property
+    def source_path(self) -> Optional[str]:
+        return self.metadata.get(MetadataType.CONNECTION_SOURCE_PATH)
+
+    @property
+    def destination_ip(self) -> Optional[str]:
+        return self.metadata.get(MetadataType.CONNECTION_DESTINATION_IP)
+
+    @property
+    def destination_port(self) -> Optional[int]:
+        return self.metadata.get(MetadataType.CONNECTION_DESTINATION_PORT)
+
+    @property
+    def destination_path(self) -> Optional[str]:
+        return self.metadata.get(MetadataType.CONNECTION_DESTINATION_PATH)
+
+    @staticmethod
+    def from_metadata(metadata: Dict[str, any]) -> 'ConnectionDescriptor':
+        """
+        Creates connection descriptor from message metadata
+        """
+        return ConnectionDescriptor(
+            handle=metadata.get(MetadataType.CONNECTION_HANDLE),
+            id=metadata.get(MetadataType.CONNECTION_ID),
+            metadata=metadata
+        )
+
+
+class ConnectionTable:
+    """
+    Table of connections of a single process identified by connection handles assigned by the script
+    """
+    connections: Dict[int, ConnectionDescriptor]
+
+    def __init__(self, max_size: int=DEFAULT_MAX_CONNECTIONS):
+        self.connections = {}
+        self.max_size = max_size
+
+    def register(self, metadata: Dict[str, any]) -> ConnectionDescriptor:
+        """
+        Registers connection using full metadata containing the connection handle
+        """
+        if len(self.connections) >= self.max_size and metadata.get(MetadataType.CONNECTION_HANDLE) not in self.connections:
+            # Handles are assigned in ascending order, so the first connection is the oldest
+            del self.connections[next(iter(self.connections))]
+        connection = ConnectionDescriptor.from_metadata(dict(metadata))
+        self.connections[connection.handle] = connection
+        return connection
+
+    def get(self, handle: int) -> Optional[ConnectionDescriptor]:
+        """
+        Obtains connection by its handle
+        """
+        return self.connections.get(handle)
+
+    def release(self, handle: int) -> Optional[ConnectionDescriptor]:
+        """
+        Removes connection from the table (once the connection is closed)
+        """
+        return self.connections.pop(handle, None)
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+
 class DeluderException(Exception):
     """
     Common Deluder exception used across the Deluder components
@@ -127,6 +261,17 @@ class DeluderConfig:
     ignore_child_processes: bool
     scripts: List[DeluderScriptConfig]
     interceptors: List[DeluderInterceptorConfig]
+    binary_responses: bool = True
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    shards: int = DEFAULT_SHARDS
+    fan_out: bool = False
+    stats_interval: float = 0
+    filters: List[dict] = field(default_factory=list)
+    log_queue_size: int = DEFAULT_LOG_QUEUE_SIZE
+    log_overflow: str = 'block'
+    log_file: Optional[str] = None
+    log_file_max_bytes: int = 0
+    log_file_backups: int = 0
 
 
 def create_default_config() -> DeluderConfig:
@@ -146,4 +291,15 @@ def create_default_config() -> DeluderConfig:
         interceptors=[
             DeluderInterceptorConfig('log')
         ],
+        binary_responses=True,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        shards=DEFAULT_SHARDS,
+        fan_out=False,
+        stats_interval=0,
+        filters=[],
+        log_queue_size=DEFAULT_LOG_QUEUE_SIZE,
+        log_overflow='block',
+        log_file=None,
+        log_file_max_bytes=0,
+        log_file_backups=0,
     )
@@ -1,20 +1,31 @@
-from copy import copy
 from typing import Optional
 
 from deluder.common import *
 from deluder.log import logger
 
 
+BATCH_DATA_OFFSET = 'o'
+"""
+Key of the offset of message data in the data of the whole batch
+"""
+
+BATCH_DATA_LENGTH = 'l'
+"""
+Key of the length of message data in the data of the whole batch
+"""
+
+
 class MessageConverter:
     """
     Converter for converting Frida's dictionaries and bytes to common data classes used in Deluder
     to distinguish different intercepted messages.
     """
     @staticmethod
-    def convert(message: dict, data: Optional[bytes]) -> Optional[Message]:
+    def convert(message: dict, data: Optional[bytes], connections: Optional[ConnectionTable]=None) -> Optional[Message]:
         """
         Converts message dictionary and data bytes to common message types
-        (SendMessage, RecvMessage and CloseMessage)
+        (SendMessage, RecvMessage and CloseMessage),
+        metadata of known connections are resolved from their handles using the connection table
         """
         if message['type'] != 'send':
             if data is None:
@@ -23,12 +34,38 @@ class MessageConverter:
                 logger.info('Message received %s with data %s', message, data)
             return
 
-        id = message['payload']['id']
-        type = message['payload']['type']
+        return MessageConverter._convert_payload(message['payload'], data, connections)
+
+    @staticmethod
+    def is_batch(message: dict) -> bool:
+        """
+        Checks whether the message dictionary is a batch of multiple messages
+        """
+        return message['type'] == 'send' and message['payload'].get('type') == MessageType.BATCH
+
+    @staticmethod
+    def convert_batch(message: dict, data: Optional[bytes], connections: Optional[ConnectionTable]=None) -> List[Message]:
+        """
+        Converts batch message dictionary and data bytes of the whole batch to list of common message types
+        """
+        messages = []
+        view = memoryview(data) if data is not None else None
+        for payload in message['payload']['messages']:
+            offset = payload.pop(BATCH_DATA_OFFSET, None)
+            if offset is not None:
+                length = payload.pop(BATCH_DATA_LENGTH)
+                # Data of each message are copied from the batch once, interceptors always receive bytes
+                messages.append(MessageConverter._convert_payload(payload, bytes(view[offset:offset + length]), connections))
+            else:
+                messages.append(MessageConverter._convert_payload(payload, None, connections))
+        return messages
 
-        metadata = copy(message['payload'])
-        metadata.pop('id')
-        metadata.pop('type')
+    @staticmethod
+    def _convert_payload(payload: dict, data: Optional[bytes], connections: Optional[ConnectionTable]) -> Message:
+        # Payload is freshly decoded from JSON, so it can be used as metadata directly
+        id = payload.pop('id')
+        type = payload.pop('type')
+        metadata = MessageConverter._resolve_metadata(payload, connections)
 
         if type == MessageType.SEND:
             return SendMessage(id, data, metadata)
@@ -38,3 +75,23 @@ class MessageConverter:
             return CloseMessage(id, metadata)
         else:
             raise ValueError(f'Unsupported message type {type}!')
+
+    @staticmethod
+    def _resolve_metadata(metadata: dict, connections: Optional[ConnectionTable]) -> dict:
+        if connections is None:
+            return metadata
+
+        handle = metadata.get(MetadataType.CONNECTION_HANDLE)
+        if handle is None:
+            return metadata
+
+        if len(metadata) > 1:
+            # Full metadata are sent only with the first message of the connection
+            connections.register(metadata)
+            return metadata
+
+        connection = connections.get(handle)
+        if connection is None:
+            logger.warning('Received message for unknown connection handle %s!', handle)
+            return metadata
+        return dict(connection.metadata)
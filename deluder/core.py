@@ -9,10 +9,11 @@ from typing import Optional, Set, Union, List
 
 from deluder.common import *
 from deluder.interceptor import MessageInterceptor
-from deluder.log import logger, set_debug_level
+from deluder.log import LogPipeline, logger, set_debug_level
 from deluder.router import MessageRouter
+from deluder.stats import StatsReporter
 from deluder.script import load_scripts
-from deluder.interceptors import AVAILABLE_INTERCEPTORS, INTERCEPTORS_REGISTRY, DebugMessageInterceptor
+from deluder.interceptors import create_interceptors
 
 
 class Deluder:
@@ -25,6 +26,10 @@ class Deluder:
     script: str
     executor: ThreadPoolExecutor
     interceptors: List[MessageInterceptor]
+    observe_only: bool
+    router: MessageRouter
+    stats_reporter: Optional[StatsReporter]
+    log_pipeline: LogPipeline
     device: frida.core.Device
     
     def __init__(self, processes: Set[Process], managed: bool, device: frida.core.Device, config: Optional[DeluderConfig]=None):
@@ -88,6 +93,7 @@ class Deluder:
         Starts the Deluder core and all underlying components.
         Finishes once the target application stops or user interrupts Deluder.
         """
+        self._init_logging()
         logger.info('Starting to cause delusions...')
         try: 
             set_debug_level(self.config.debug)
@@ -95,9 +101,11 @@ class Deluder:
             self.executor = ThreadPoolExecutor(max_workers=1)
 
             self._init_interceptors()
+            self._init_observe_only()
             self._init_child_gating()
             self._init_scripts()
             self._init_router()
+            self._init_stats()
 
             for process in copy.copy(self.processes):
                 self._attach_process(process, resume=self.managed)
@@ -110,13 +118,54 @@ class Deluder:
         except Exception as e:
             logger.error('Deluder crashed!', exc_info=e)
         finally:
+            self._detach_processes()
+
             self._stop_app()
 
+            self._stop_stats()
+
+            self._stop_router()
+
             self._destroy_interceptors()
 
             self.executor.shutdown()
         logger.info('Deluder finished.')
 
+        self._stop_logging()
+
+    def stats(self) -> dict:
+        """
+        Obtains snapshot of Deluder performance stats (message and byte counters, 
+        latencies of routing and interceptors in milliseconds, dispatcher queues and stats of scripts)
+        """
+        snapshot = self.router.snapshot() if hasattr(self, 'router') else {}
+        if hasattr(self, 'log_pipeline'):
+            snapshot['log'] = self.log_pipeline.snapshot()
+        interceptor_stats = {}
+        for interceptor in getattr(self, 'interceptors', []):
+            stats = interceptor.stats()
+            if stats is not None:
+                interceptor_stats[interceptor.get_name()] = stats
+        if interceptor_stats:
+            snapshot['interceptorStats'] = interceptor_stats
+        snapshot['scripts'] = self.script_stats()
+        return snapshot
+
+    def script_stats(self) -> Dict[int, dict]:
+        """
+        Obtains statistics collected by scripts in all attached processes (mapped by PID),
+        e.g. hits and misses of the socket metadata cache
+        """
+        stats = {}
+        for process in copy.copy(self.processes):
+            if process.script is None:
+                continue
+            try:
+                stats[process.pid] = process.script.exports_sync.stats()
+            except Exception as e:
+                logger.debug('Failed to obtain script stats from process with PID %d!', process.pid, exc_info=e)
+        return stats
+
     def _resume_process(self, process: Process):
         try:
             self.device.resume(process.pid)
@@ -170,6 +219,17 @@ class Deluder:
         for process in copy.copy(self.processes):
             self._resume_process(process)
 
+    def _detach_processes(self):
+        # Batched messages are flushed by the scripts first, so that they are routed before the router stops
+        for process in copy.copy(self.processes):
+            if process.script is None:
+                continue
+            try:
+                process.script.exports_sync.flush()
+                process.session.detach()
+            except Exception as e:
+                logger.debug('Failed to detach from process with PID %d!', process.pid, exc_info=e)
+
     def _stop_app(self):
         if not self.managed:
             return
@@ -197,31 +257,63 @@ class Deluder:
         logger.info("Child process destroyed: %s", child)
 
     def _init_scripts(self):
-        self.script = load_scripts(self.config)
+        self.script = load_scripts(self.config, observe_only=self.observe_only)
         logger.info('Scripts loaded.')
 
     def _init_interceptors(self):
-        self.interceptors = []
-        
-        if self.config.debug:
-            logger.info('Loaded interceptor: debug')
-            self.interceptors.append(DebugMessageInterceptor())
-
-        for interceptor in self.config.interceptors:
-            if interceptor.type not in AVAILABLE_INTERCEPTORS:
-                raise DeluderException(f'Interceptor {interceptor.type} not found!')
-            self.interceptors.append(INTERCEPTORS_REGISTRY[interceptor.type](interceptor.config))
-            logger.info('Loaded interceptor: %s', interceptor.type)
+        self.interceptors = create_interceptors(self.config)
 
         for interceptor in self.interceptors:
             interceptor.init()
 
+    def _init_observe_only(self):
+        self.observe_only = all(interceptor.is_read_only() for interceptor in self.interceptors)
+        if self.observe_only:
+            logger.info('All interceptors are read-only, observe-only mode enabled.')
+
     def _init_router(self):
         self.router = MessageRouter(
-            interceptors=self.interceptors
+            interceptors=self.interceptors,
+            binary_responses=self.config.binary_responses,
+            observe_only=self.observe_only,
+            queue_size=self.config.queue_size,
+            shards=self.config.shards,
+            fan_out=self.config.fan_out
         )
+        self.router.start()
         logger.info('Router initialized.')
 
+    def _init_logging(self):
+        self.log_pipeline = LogPipeline(
+            queue_size=self.config.log_queue_size,
+            overflow=self.config.log_overflow,
+            file=self.config.log_file,
+            file_max_bytes=self.config.log_file_max_bytes,
+            file_backups=self.config.log_file_backups
+        )
+        self.log_pipeline.start()
+
+    def _stop_logging(self):
+        self.log_pipeline.stop()
+
+    def _init_stats(self):
+        self.stats_reporter = None
+        if not self.config.stats_interval or self.config.stats_interval <= 0:
+            return
+        self.stats_reporter = StatsReporter(self.config.stats_interval, self.router.snapshot)
+        self.stats_reporter.start()
+        logger.info('Stats will be logged every %s seconds.', self.config.stats_interval)
+
+    def _stop_stats(self):
+        if getattr(self, 'stats_reporter', None) is None:
+            return
+        self.stats_reporter.stop()
+
+    def _stop_router(self):
+        if not hasattr(self, 'router'):
+            return
+        self.router.stop()
+
     def _destroy_interceptors(self):
         if not hasattr(self, 'interceptors'):
             return
@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+from typing import Callable, Optional, Tuple
+
+from deluder.common import *
+from deluder.log import logger
+from deluder.stats import LatencyHistogram
+
+
+DROPS_LOG_INTERVAL = 5.0
+"""
+Minimal interval in seconds between two log records about dropped messages
+"""
+
+
+class DispatcherWorker:
+    """
+    Worker of the dispatcher with its own bounded queue
+    (all messages of a single connection are processed by the same worker, so their order is kept)
+    """
+    index: int
+    handler: Callable[[Process, Message], None]
+    queue: 'queue.Queue[Optional[Tuple[Process, Message, int]]]'
+    thread: Optional[threading.Thread]
+    wait: LatencyHistogram
+    """
+    Time spent by messages in the queue
+    """
+
+    def __init__(self, index: int, handler: Callable[[Process, Message], None], queue_size: int):
+        self.index = index
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.wait = LatencyHistogram()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the worker thread
+        """
+        self.thread = threading.Thread(target=self._run, name=f'DeluderDispatcher-{self.index}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the worker thread once all queued messages are processed
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def put(self, process: Process, message: Message, block: bool):
+        """
+        Puts message to the queue of the worker (raises queue.Full if the queue is full and block is False)
+        """
+        self.queue.put((process, message, time.perf_counter_ns()), block=block)
+
+    def depth(self) -> int:
+        """
+        Obtains number of messages waiting in the queue of the worker
+        """
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            process, message, queued = item
+            with self.lock:
+                self.wait.record(time.perf_counter_ns() - queued)
+            try:
+                self.handler(process, message)
+            except Exception as e:
+                logger.error('Dispatching of message %s failed!', message.id, exc_info=e)
+
+
+class MessageDispatcher:
+    """
+    Dispatcher processes messages in background workers, so that the Frida's message thread does not wait for interceptors.
+    Messages are sharded across the workers by process and connection, so that different connections are processed in parallel,
+    while messages of the same connection keep their order.
+    Each worker has a bounded queue and messages are dropped (and counted) if they are not required to be delivered.
+    """
+    workers: List[DispatcherWorker]
+    dropped: int
+
+    def __init__(self, handler: Callable[[Process, Message], None], queue_size: int, shards: int=1):
+        self.workers = [DispatcherWorker(index, handler, queue_size) for index in range(max(shards, 1))]
+        self.dropped = 0
+        self._last_drops_log = 0.0
+        self._drops_lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts all workers
+        """
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        """
+        Stops all workers once all queued messages are processed
+        """
+        for worker in self.workers:
+            worker.stop()
+        if self.dropped > 0:
+            logger.warning('Dispatcher dropped %d messages in total.', self.dropped)
+
+    def dispatch(self, process: Process, message: Message, block: bool=True) -> bool:
+        """
+        Queues message for processing, returns False if the message was dropped because of full queue
+        (messages are never dropped when block is True)
+        """
+        try:
+            self._get_worker(process, message).put(process, message, block=block)
+            return True
+        except queue.Full:
+            self._on_dropped()
+            return False
+
+    def depth(self) -> int:
+        """
+        Obtains total number of messages waiting in the queues
+        """
+        return sum(worker.depth() for worker in self.workers)
+
+    def depths(self) -> List[int]:
+        """
+        Obtains number of messages waiting in the queue of each worker
+        """
+        return [worker.depth() for worker in self.workers]
+
+    def snapshot(self) -> dict:
+        """
+        Creates snapshot of dispatcher counters (latencies are in milliseconds)
+        """
+        wait = LatencyHistogram()
+        for worker in self.workers:
+            with worker.lock:
+                wait.merge(worker.wait)
+        return {
+            'depths': self.depths(),
+            'dropped': self.dropped,
+            'wait': wait.summary(),
+        }
+
+    def _get_worker(self, process: Process, message: Message) -> DispatcherWorker:
+        if len(self.workers) == 1:
+            return self.workers[0]
+        pid = process.pid if process is not None else None
+        key = (pid, message.metadata.get(MetadataType.CONNECTION_ID))
+        return self.workers[hash(key) % len(self.workers)]
+
+    def _on_dropped(self):
+        # Messages can be dropped from multiple threads (e.g. by read-only fan-out)
+        with self._drops_lock:
+            self.dropped += 1
+            dropped = self.dropped
+            now = time.monotonic()
+            if now - self._last_drops_log < DROPS_LOG_INTERVAL:
+                return
+            self._last_drops_log = now
+        logger.warning('Dispatcher queue is full, %d messages dropped so far.', dropped)
@@ -25,6 +25,13 @@ class MessageInterceptor:
         """
         return self.__class__.__name__.replace('MessageInterceptor', '')
 
+    def is_read_only(self) -> bool:
+        """
+        Determines whether the interceptor only reads messages without modifying their data or metadata
+        (if all interceptors are read-only, scripts do not need to wait for the intercepted messages)
+        """
+        return False
+
     def init(self):
         """
         Inititializes the interceptor when Deluder starts
@@ -33,10 +40,29 @@ class MessageInterceptor:
 
     def intercept(self, process: Process, message: Message):
         """
-        Intercepts message from given process
+        Intercepts message from given process (with `shards` enabled, it is called concurrently from multiple threads
+        for different connections, so shared state of the interceptor has to be guarded by locks)
         """
         pass
 
+    def stats(self) -> Optional[dict]:
+        """
+        Obtains interceptor specific stats, which are included in Deluder stats (None if the interceptor has no stats)
+        """
+        return None
+
+    def get_connection_descriptor(self, process: Optional[Process], message: Message) -> ConnectionDescriptor:
+        """
+        Obtains descriptor of the connection, to which the message belongs
+        (from the connection table of the process or from the message metadata)
+        """
+        handle = message.metadata.get(MetadataType.CONNECTION_HANDLE)
+        if process is not None and handle is not None:
+            connection = process.connections.get(handle)
+            if connection is not None:
+                return connection
+        return ConnectionDescriptor.from_metadata(message.metadata)
+
     def destroy(self):
         """
         Destroys the interceptor when Deluder stops
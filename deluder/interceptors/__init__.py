@@ -1,13 +1,24 @@
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.log import logger
 from deluder.interceptors.debug import DebugMessageInterceptor
 from deluder.interceptors.proxifier.interceptor import ProxifierMessageInterceptor
 from deluder.interceptors.petep.interceptor import PetepMessageInterceptor
 from deluder.interceptors.log import LogMessageInterceptor
+from deluder.interceptors.pcap import PcapMessageInterceptor
+from deluder.interceptors.record import RecordMessageInterceptor
+from deluder.interceptors.rewrite import RewriteMessageInterceptor
+from deluder.interceptors.pool import ProcessPoolMessageInterceptor
 
 
 INTERCEPTORS_REGISTRY = {
     'petep': PetepMessageInterceptor,
     'proxifier': ProxifierMessageInterceptor,
     'log': LogMessageInterceptor,
+    'pcap': PcapMessageInterceptor,
+    'record': RecordMessageInterceptor,
+    'rewrite': RewriteMessageInterceptor,
+    'processPool': ProcessPoolMessageInterceptor,
 }
 """
 Contains all available interceptors, which can be loaded to Deluder mapped by their code
@@ -17,3 +28,22 @@ AVAILABLE_INTERCEPTORS = frozenset(INTERCEPTORS_REGISTRY.keys())
 """
 Contains codes of all available interceptors, which can be loaded to Deluder
 """
+
+
+def create_interceptors(config: DeluderConfig) -> List[MessageInterceptor]:
+    """
+    Creates (not initialized) interceptors configured in given Deluder config (debug interceptor is added in debug mode)
+    """
+    interceptors = []
+    
+    if config.debug:
+        logger.info('Loaded interceptor: debug')
+        interceptors.append(DebugMessageInterceptor())
+
+    for interceptor in config.interceptors:
+        if interceptor.type not in AVAILABLE_INTERCEPTORS:
+            raise DeluderException(f'Interceptor {interceptor.type} not found!')
+        interceptors.append(INTERCEPTORS_REGISTRY[interceptor.type](interceptor.config))
+        logger.info('Loaded interceptor: %s', interceptor.type)
+
+    return interceptors
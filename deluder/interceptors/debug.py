@@ -6,5 +6,8 @@ class DebugMessageInterceptor(MessageInterceptor):
     """
     Debugging interceptor, which logs the whole message as is to the standard output
     """
+    def is_read_only(self) -> bool:
+        return True
+
     def intercept(self, process: Process, message: Message):
-        self.logger.debug(f'Message [pid={process.pid}]: {message}')
+        self.logger.debug('Message [pid=%d]: %s', process.pid, message)
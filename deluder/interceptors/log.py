@@ -1,14 +1,25 @@
 from deluder.common import *
 from deluder.interceptor import MessageInterceptor
-from deluder.utils import format_bytes
+from deluder.utils import LazyFormattedBytes
 
 
 class LogMessageInterceptor(MessageInterceptor):
     """
     Basic logging interceptor, which logs messages into standard output in human readable hex table format
     """
+    @classmethod
+    def default_config(cls) -> dict:
+        return {
+            'maxBytes': 0,
+        }
+
+    def is_read_only(self) -> bool:
+        return True
+
     def intercept(self, process: Process, message: Message):
+        # Messages are formatted only if the record is emitted
         if isinstance(message, DataMessage):
-            self.logger.info(f'Message [pid={process.pid}] - {message.type.name}: {message.metadata}\n{format_bytes(message.data)}')
+            self.logger.info('Message [pid=%d] - %s: %s\n%s', process.pid, message.type.name, message.metadata,
+                             LazyFormattedBytes(message.data, self.config['maxBytes']))
         else:
-            self.logger.info(f'Message [pid={process.pid}] - {message.type.name}: {message.metadata}')
+            self.logger.info('Message [pid=%d] - %s: %s', process.pid, message.type.name, message.metadata)
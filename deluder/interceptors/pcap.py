@@ -0,0 +1,352 @@
+import ipaddress
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from typing import Tuple, Union
+
+from deluder.common import *
+from deluder.dispatcher import DROPS_LOG_INTERVAL
+from deluder.interceptor import MessageInterceptor
+
+
+PCAPNG_SECTION_HEADER_BLOCK = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION_BLOCK = 0x00000001
+PCAPNG_ENHANCED_PACKET_BLOCK = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPTION_COMMENT = 1
+PCAPNG_OPTION_END = 0
+
+LINKTYPE_RAW = 101
+"""
+Link type of raw IPv4/IPv6 packets (without link layer)
+"""
+
+IP_PROTOCOL_TCP = 6
+IP_PROTOCOL_UDP = 17
+
+TCP_FLAG_FIN = 0x01
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_PSH = 0x08
+TCP_FLAG_ACK = 0x10
+
+MAX_SEGMENT_SIZE = 65000
+"""
+Maximum size of payload in a single synthetic packet (bigger payloads are split to multiple packets)
+"""
+
+
+@dataclass
+class PcapFlow:
+    """
+    Synthetic flow of a single Deluder connection (client is the local side of the hooked socket)
+    """
+    client_ip: bytes
+    client_port: int
+    server_ip: bytes
+    server_port: int
+    ipv6: bool
+    tcp: bool
+    comment: str
+    client_seq: int = 1
+    server_seq: int = 1
+
+
+class PcapngFile:
+    """
+    PCAPNG file with single interface of raw IP packets, to which packets are written in batches
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.buffer = bytearray()
+        self.size = 0
+        self.created = time.monotonic()
+        self._append_headers()
+
+    def write_packet(self, timestamp: float, packet: bytes, comment: Optional[str]=None):
+        """
+        Appends packet to the write buffer
+        """
+        timestamp_us = int(timestamp * 1000000)
+        options = b''
+        if comment:
+            options = self._create_option(PCAPNG_OPTION_COMMENT, comment.encode()) + struct.pack('<HH', PCAPNG_OPTION_END, 0)
+        padding = b'\x00' * (-len(packet) % 4)
+        length = 32 + len(packet) + len(padding) + len(options)
+        self._append(
+            struct.pack('<IIIIIII', PCAPNG_ENHANCED_PACKET_BLOCK, length, 0, timestamp_us >> 32, timestamp_us & 0xFFFFFFFF, len(packet), len(packet)),
+            packet,
+            padding,
+            options,
+            struct.pack('<I', length)
+        )
+
+    def flush(self):
+        """
+        Writes the buffer to the file
+        """
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def _append_headers(self):
+        section_header_length = 28
+        self._append(struct.pack('<IIIHHqI', PCAPNG_SECTION_HEADER_BLOCK, section_header_length, PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1, section_header_length))
+        interface_length = 20
+        self._append(struct.pack('<IIHHII', PCAPNG_INTERFACE_DESCRIPTION_BLOCK, interface_length, LINKTYPE_RAW, 0, 0, interface_length))
+
+    def _append(self, *parts: bytes):
+        for part in parts:
+            self.buffer += part
+            self.size += len(part)
+
+    @staticmethod
+    def _create_option(code: int, value: bytes) -> bytes:
+        return struct.pack('<HH', code, len(value)) + value + b'\x00' * (-len(value) % 4)
+
+
+class PcapMessageInterceptor(MessageInterceptor):
+    """
+    PCAP interceptor writes payloads of intercepted messages to PCAPNG file as synthetic TCP/UDP flows,
+    which can be analyzed in Wireshark (packets are created and written by a background writer thread)
+    """
+    queue: queue.Queue
+    writer: threading.Thread
+    flows: Dict[Tuple[int, str], PcapFlow]
+    file: Optional[PcapngFile]
+
+    @classmethod
+    def default_config(cls) -> dict:
+        return {
+            'path': 'deluder.pcapng',
+            'maxFileSize': 0,
+            'rotateInterval': 0,
+            'flushInterval': 1,
+            'writeBufferSize': 1048576,
+            'queueSize': 10000,
+        }
+
+    def is_read_only(self) -> bool:
+        return True
+
+    def init(self):
+        self.queue = queue.Queue(self.config['queueSize'])
+        self.dropped = 0
+        self.drops_lock = threading.Lock()
+        self.last_drops_log = 0.0
+        self.flows = {}
+        self.file = None
+        self.file_index = 0
+        self.writer = threading.Thread(target=self._write_loop, name='pcap-writer', daemon=True)
+        self.writer.start()
+
+    def intercept(self, process: Process, message: Message):
+        if not isinstance(message, (DataMessage, CloseMessage)):
+            return
+        item = (time.time(), process.pid if process else 0, message.type, message.metadata.copy(), getattr(message, 'data', None))
+        if isinstance(message, CloseMessage):
+            # Close releases the flow in the writer, so it is never dropped
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._on_dropped()
+
+    def stats(self) -> dict:
+        with self.drops_lock:
+            dropped = self.dropped
+        return {'queued': self.queue.qsize(), 'dropped': dropped}
+
+    def destroy(self):
+        if hasattr(self, 'writer'):
+            self.queue.put(None)
+            self.writer.join()
+
+    def _on_dropped(self):
+        with self.drops_lock:
+            self.dropped += 1
+            dropped = self.dropped
+            now = time.monotonic()
+            if now - self.last_drops_log < DROPS_LOG_INTERVAL:
+                return
+            self.last_drops_log = now
+        self.logger.warning('PCAP queue is full, %d messages dropped so far.', dropped)
+
+    def _write_loop(self):
+        flush_interval = self.config['flushInterval']
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=flush_interval)
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                break
+            if item:
+                try:
+                    self._write_message(*item)
+                except Exception as e:
+                    self.logger.error('Writing of message to PCAP failed!', exc_info=e)
+
+            now = time.monotonic()
+            if self.file and (len(self.file.buffer) >= self.config['writeBufferSize'] or now - last_flush >= flush_interval):
+                self.file.flush()
+                last_flush = now
+
+        if self.file:
+            self.file.close()
+
+    def _write_message(self, timestamp: float, pid: int, type: MessageType, metadata: Dict[str, any], data: Optional[bytes]):
+        file = self._get_file()
+        key = (pid, metadata.get(MetadataType.CONNECTION_ID, 'default'))
+        flow = self.flows.get(key)
+
+        if type == MessageType.CLOSE:
+            if flow is not None:
+                del self.flows[key]
+                if flow.tcp:
+                    self._write_tcp_close(file, timestamp, flow)
+            return
+
+        comment = None
+        if flow is None:
+            flow = self.flows[key] = self._create_flow(pid, metadata)
+            if flow.tcp:
+                self._write_tcp_handshake(file, timestamp, flow)
+            else:
+                comment = flow.comment
+
+        from_client = type == MessageType.SEND
+        data = bytes(data)
+        for offset in range(0, max(len(data), 1), MAX_SEGMENT_SIZE):
+            segment = data[offset:offset + MAX_SEGMENT_SIZE]
+            if flow.tcp:
+                packet = self._create_tcp_packet(flow, from_client, TCP_FLAG_PSH | TCP_FLAG_ACK, segment)
+            else:
+                packet = self._create_udp_packet(flow, from_client, segment)
+            file.write_packet(timestamp, packet, comment)
+            comment = None
+
+    def _get_file(self) -> PcapngFile:
+        file = self.file
+        max_file_size = self.config['maxFileSize']
+        rotate_interval = self.config['rotateInterval']
+        if file is not None:
+            if (max_file_size <= 0 or file.size < max_file_size) \
+                    and (rotate_interval <= 0 or time.monotonic() - file.created < rotate_interval):
+                return file
+            file.close()
+            self.logger.info('PCAP file %s rotated.', file.path)
+
+        self.file_index += 1
+        self.file = PcapngFile(self._get_file_path(self.file_index))
+        self.logger.info('Writing PCAP to %s.', self.file.path)
+        return self.file
+
+    def _get_file_path(self, index: int) -> str:
+        if self.config['maxFileSize'] <= 0 and self.config['rotateInterval'] <= 0:
+            return self.config['path']
+        base, extension = os.path.splitext(self.config['path'])
+        return f'{base}-{index:05d}{extension}'
+
+    def _write_tcp_handshake(self, file: PcapngFile, timestamp: float, flow: PcapFlow):
+        file.write_packet(timestamp, self._create_tcp_packet(flow, True, TCP_FLAG_SYN, b'', consumed=1), flow.comment)
+        file.write_packet(timestamp, self._create_tcp_packet(flow, False, TCP_FLAG_SYN | TCP_FLAG_ACK, b'', consumed=1))
+        file.write_packet(timestamp, self._create_tcp_packet(flow, True, TCP_FLAG_ACK, b''))
+
+    def _write_tcp_close(self, file: PcapngFile, timestamp: float, flow: PcapFlow):
+        file.write_packet(timestamp, self._create_tcp_packet(flow, True, TCP_FLAG_FIN | TCP_FLAG_ACK, b'', consumed=1))
+        file.write_packet(timestamp, self._create_tcp_packet(flow, False, TCP_FLAG_FIN | TCP_FLAG_ACK, b'', consumed=1))
+        file.write_packet(timestamp, self._create_tcp_packet(flow, True, TCP_FLAG_ACK, b''))
+
+    def _create_tcp_packet(self, flow: PcapFlow, from_client: bool, flags: int, payload: bytes, consumed: int=0) -> bytes:
+        # Checksums of TCP/UDP are not computed (Wireshark does not validate them by default)
+        if from_client:
+            seq, ack = flow.client_seq, flow.server_seq
+            flow.client_seq = (flow.client_seq + len(payload) + consumed) & 0xFFFFFFFF
+        else:
+            seq, ack = flow.server_seq, flow.client_seq
+            flow.server_seq = (flow.server_seq + len(payload) + consumed) & 0xFFFFFFFF
+        if not flags & TCP_FLAG_ACK:
+            ack = 0
+        source_port, destination_port = (flow.client_port, flow.server_port) if from_client else (flow.server_port, flow.client_port)
+        header = struct.pack('!HHIIBBHHH', source_port, destination_port, seq, ack, 5 << 4, flags, 65535, 0, 0)
+        return self._create_ip_packet(flow, from_client, IP_PROTOCOL_TCP, header + payload)
+
+    def _create_udp_packet(self, flow: PcapFlow, from_client: bool, payload: bytes) -> bytes:
+        source_port, destination_port = (flow.client_port, flow.server_port) if from_client else (flow.server_port, flow.client_port)
+        header = struct.pack('!HHHH', source_port, destination_port, 8 + len(payload), 0)
+        return self._create_ip_packet(flow, from_client, IP_PROTOCOL_UDP, header + payload)
+
+    @staticmethod
+    def _create_ip_packet(flow: PcapFlow, from_client: bool, protocol: int, payload: bytes) -> bytes:
+        source, destination = (flow.client_ip, flow.server_ip) if from_client else (flow.server_ip, flow.client_ip)
+        if flow.ipv6:
+            return struct.pack('!IHBB16s16s', 0x60000000, len(payload), protocol, 64, source, destination) + payload
+        header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 0, 0x4000, 64, protocol, 0, source, destination)
+        checksum = PcapMessageInterceptor._ip_checksum(header)
+        return header[:10] + struct.pack('!H', checksum) + header[12:] + payload
+
+    @staticmethod
+    def _ip_checksum(header: bytes) -> int:
+        total = sum(struct.unpack(f'!{len(header) // 2}H', header))
+        while total >> 16:
+            total = (total & 0xFFFF) + (total >> 16)
+        return ~total & 0xFFFF
+
+    @staticmethod
+    def _create_flow(pid: int, metadata: Dict[str, any]) -> PcapFlow:
+        connection = ConnectionDescriptor.from_metadata(metadata)
+        protocol = connection.protocol or ''
+        tcp = not (protocol.startswith('udp') or protocol == 'unix:dgram')
+        comment = f'pid={pid} connection={connection.id} module={connection.module} protocol={connection.protocol}'
+
+        client_ip = PcapMessageInterceptor._parse_ip(connection.source_ip)
+        server_ip = PcapMessageInterceptor._parse_ip(connection.destination_ip)
+        if client_ip is None or server_ip is None:
+            # Unix sockets and connections without known addresses are mapped to stable fake endpoints
+            endpoint = connection.destination_path or connection.source_path or connection.id
+            endpoint_hash = zlib.crc32(f'{pid}/{endpoint}'.encode())
+            client_hash = zlib.crc32(f'{pid}/{connection.id}'.encode())
+            client_ip = ipaddress.IPv4Address(0x0A010000 | (client_hash & 0xFFFF))
+            server_ip = ipaddress.IPv4Address(0x0A020000 | (endpoint_hash & 0xFFFF))
+            client_port = connection.source_port or 49152 + client_hash % 16384
+            server_port = connection.destination_port or 1024 + (endpoint_hash >> 16) % 48128
+            if endpoint != connection.id:
+                comment += f' path={endpoint}'
+        else:
+            client_port = connection.source_port or 0
+            server_port = connection.destination_port or 0
+
+        if client_ip.version != server_ip.version:
+            client_ip, server_ip = (ipaddress.IPv6Address(f'::ffff:{ip}') if ip.version == 4 else ip for ip in (client_ip, server_ip))
+
+        return PcapFlow(
+            client_ip=client_ip.packed,
+            client_port=client_port,
+            server_ip=server_ip.packed,
+            server_port=server_port,
+            ipv6=client_ip.version == 6,
+            tcp=tcp,
+            comment=comment,
+        )
+
+    @staticmethod
+    def _parse_ip(ip: Optional[str]) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+        if not ip:
+            return None
+        try:
+            return ipaddress.ip_address(ip)
+        except ValueError:
+            return None
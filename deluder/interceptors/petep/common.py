@@ -1,6 +1,14 @@
+import struct
+
 from enum import Enum
 
 
+PETEP_HEADER = struct.Struct('!BI')
+"""
+Header of standard frame: type, length of payload
+"""
+
+
 class PetepDeluderMessageType(Enum):
     """
     Standard message types between Deluder and PETEP
@@ -8,3 +16,7 @@ class PetepDeluderMessageType(Enum):
     CONNECTION_INFO = 1
     DATA_C2S = 2
     DATA_S2C = 3
+    CONNECTION_CLOSE = 4
+    """Closes channel of multiplexed socket"""
+    MULTIPLEXED = 5
+    """Switches the socket to multiplexed framing: [1B type][4B channel][4B sequence][4B length][payload]"""
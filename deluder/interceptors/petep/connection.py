@@ -1,15 +1,23 @@
 import json
 import logging
+import queue
 import socket
 import threading
+import time
+
+from typing import Union
 
 from deluder.common import *
-from deluder.utils import recv_n, try_close
+from deluder.transport import parse_endpoint
+from deluder.utils import recv_n, send_all, try_close
 
 from deluder.interceptors.petep.common import *
 
 
 DEFAULT_CONNECTION_ID = 'default'
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_CONNECT_RETRIES = 3
+DEFAULT_CONNECT_BACKOFF = 0.1
 
 
 @dataclass
@@ -92,38 +100,156 @@ class ConnectionInfo:
         return f'{source}<->{destination}{self.get_name_suffix()}'
 
 
+class PetepConnector:
+    """
+    Opens sockets to PETEP (TCP or Unix domain socket) with connect timeout and retries with exponential backoff
+    """
+    def __init__(
+            self,
+            petep_host: str,
+            petep_port: int,
+            logger: logging.Logger,
+            timeout: float=DEFAULT_CONNECT_TIMEOUT,
+            retries: int=DEFAULT_CONNECT_RETRIES,
+            backoff: float=DEFAULT_CONNECT_BACKOFF
+    ):
+        self.endpoint = parse_endpoint(petep_host, petep_port)
+        self.logger = logger
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def connect(self) -> socket.socket:
+        """
+        Connects to PETEP (raises the last error if all attempts fail)
+        """
+        delay = self.backoff
+        attempt = 0
+        while True:
+            try:
+                # Timeout applies only to connecting, since PETEP can hold the data for manual interception
+                return self.endpoint.connect(timeout=self.timeout if self.timeout > 0 else None)
+            except OSError as e:
+                if attempt >= self.retries:
+                    raise DeluderException(f'Could not connect to PETEP on {self.endpoint}: {e}')
+                attempt += 1
+                self.logger.warning('Connecting to PETEP on %s failed (%s), retrying in %.2f s...', self.endpoint, e, delay)
+                time.sleep(delay)
+                delay *= 2
+
+    def get_max_connect_time(self) -> float:
+        """
+        Obtains the longest time, which connect can take with all retries
+        """
+        return (self.retries + 1) * self.timeout + self.backoff * (2 ** self.retries - 1)
+
+
+class PetepSocketPool:
+    """
+    Pool of warm sockets to PETEP, which are handed out to new connections
+    (the pool is refilled in the background, new sockets are connected directly if the pool is empty)
+    """
+    def __init__(self, connector: PetepConnector, size: int, logger: logging.Logger):
+        self.connector = connector
+        self.size = size
+        self.logger = logger
+        self.sockets = queue.Queue()
+        self.refill = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.refill.set()
+        self.thread = threading.Thread(target=self._refill_loop, name='petep-socket-pool', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.refill.set()
+        if self.thread:
+            self.thread.join()
+        while True:
+            try:
+                try_close(self.sockets.get_nowait())
+            except queue.Empty:
+                break
+
+    def connect(self) -> socket.socket:
+        """
+        Obtains warm socket from the pool or connects a new one
+        """
+        self.refill.set()
+        while True:
+            try:
+                sock = self.sockets.get_nowait()
+            except queue.Empty:
+                return self.connector.connect()
+            if self._is_alive(sock):
+                return sock
+            # PETEP could have closed the socket while it was waiting in the pool
+            self.logger.debug('Dropping closed warm socket to PETEP.')
+            try_close(sock)
+
+    @staticmethod
+    def _is_alive(sock: socket.socket) -> bool:
+        timeout = sock.gettimeout()
+        try:
+            sock.settimeout(0)
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        except (BlockingIOError, InterruptedError):
+            return True # No data and not closed
+        except OSError:
+            return False
+        finally:
+            try:
+                sock.settimeout(timeout)
+            except OSError:
+                pass
+
+    def _refill_loop(self):
+        while True:
+            self.refill.wait()
+            self.refill.clear()
+            while self.running and self.sockets.qsize() < self.size:
+                try:
+                    self.sockets.put(self.connector.connect())
+                except Exception as e:
+                    self.logger.warning('Could not pre-open socket to PETEP: %s', e)
+                    break
+            if not self.running:
+                return
+
+
 class PetepConnection:
     """
     Connection to PETEP (PETEP is the server and Deluder is the client).
     Each connection to PETEP represents a connection in Deluder (if not configured otherwise).
     """
-    petep_host: str
-    petep_port: int
-    socket: socket.socket
+    connector: Union[PetepConnector, PetepSocketPool]
+    socket: Optional[socket.socket]
     logger: logging.Logger
     lock: threading.Lock
 
     def __init__(
             self,
-            petep_host: str, 
-            petep_port: int,
+            connector: Union[PetepConnector, PetepSocketPool],
             info: ConnectionInfo,
             logger: logging.Logger
     ):
-        self.petep_host = petep_host
-        self.petep_port = petep_port
+        self.connector = connector
         self.info = info
         self.logger = logger
+        self.socket = None
+        self.lock = threading.Lock()
 
     def start(self):
         """
         Starts the connection to the PETEP and sends info about the connection
         """
         self.logger.info('Connection %s (%s) started.', self.info.id, self.info.get_name())
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        petep_address = (self.petep_host, self.petep_port)
-        self.socket.connect(petep_address)
-        self.logger.debug('Connection %s (%s) connected to PETEP on %s:%d.', self.info.id, self.info.get_name(), self.petep_host, self.petep_port)
+        self.socket = self.connector.connect()
+        self.logger.debug('Connection %s (%s) connected to PETEP.', self.info.id, self.info.get_name())
         self._send_connection_info(self.info)
     
     def stop(self):
@@ -145,23 +271,15 @@ class PetepConnection:
         return self._send_recv(PetepDeluderMessageType.DATA_S2C, data)
     
     def _send_recv(self, type: PetepDeluderMessageType, data: bytes) -> bytes:
-        payload = self._create_payload(type, data)
-        self.socket.sendall(payload)
-        
-        type_byte = recv_n(self.socket, 1)
-        length_bytes = recv_n(self.socket, 4)
-        length = int.from_bytes(length_bytes, 'big')
-        data = recv_n(self.socket, length)
+        with self.lock:
+            self._send(type, data)
+
+            _, length = PETEP_HEADER.unpack(recv_n(self.socket, PETEP_HEADER.size))
+            data = recv_n(self.socket, length)
         return data
         
     def _send_connection_info(self, info: ConnectionInfo):
-        payload = self._create_payload(PetepDeluderMessageType.CONNECTION_INFO, info.to_json().encode())
-        self.socket.sendall(payload)
-
-    def _create_payload(self, type: PetepDeluderMessageType, data: bytes) -> bytes:
-        payload = bytearray()
-        payload.append(type.value)
-        length = len(data).to_bytes(4, byteorder='big')
-        payload.extend(length)
-        payload.extend(data)
-        return payload
+        self._send(PetepDeluderMessageType.CONNECTION_INFO, info.to_json().encode())
+
+    def _send(self, type: PetepDeluderMessageType, data: bytes):
+        send_all(self.socket, PETEP_HEADER.pack(type.value, len(data)), data)
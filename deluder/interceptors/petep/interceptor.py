@@ -1,11 +1,15 @@
 import logging
 import threading
 
+from concurrent.futures import Future, TimeoutError
+from typing import Union
+
 from deluder.interceptor import MessageInterceptor
 from deluder.common import *
 
 from deluder.interceptors.petep.common import *
 from deluder.interceptors.petep.connection import *
+from deluder.interceptors.petep.multiplexed import PetepMultiplexedConnection, PetepMultiplexedTransport
 
 
 class PetepMessageInterceptor(MessageInterceptor):
@@ -15,7 +19,8 @@ class PetepMessageInterceptor(MessageInterceptor):
     [1B type][4B length][payload]
     in order to let PETEP intercept the Deluder messages in a convenient way.
     """
-    connections: Dict[str, PetepConnection]
+    connections: Dict[str, Union[PetepConnection, PetepMultiplexedConnection]]
+    ready: Dict[str, Future]
     lock: threading.Lock
 
     @classmethod
@@ -25,17 +30,43 @@ class PetepMessageInterceptor(MessageInterceptor):
             'petepPort': 8008,
             'autoCloseConnections': True,
             'multipleConnections': True,
+            'multiplexed': False,
+            'multiplexedSockets': 1,
+            'connectTimeout': DEFAULT_CONNECT_TIMEOUT,
+            'connectRetries': DEFAULT_CONNECT_RETRIES,
+            'connectBackoff': DEFAULT_CONNECT_BACKOFF,
+            'warmSockets': 0,
         }
 
     def init(self):
         self.connections = {}
+        self.ready = {}
         self.lock = threading.Lock()
+        self.transport = None
+        self.pool = None
+        self.connector = PetepConnector(
+            petep_host=self.config['petepHost'],
+            petep_port=self.config['petepPort'],
+            logger=self.logger,
+            timeout=self.config['connectTimeout'],
+            retries=self.config['connectRetries'],
+            backoff=self.config['connectBackoff']
+        )
+        if self.config['multiplexed']:
+            self.transport = PetepMultiplexedTransport(
+                connector=self.connector,
+                sockets=self.config['multiplexedSockets'],
+                logger=self.logger
+            )
+        elif self.config['warmSockets'] > 0:
+            self.pool = PetepSocketPool(self.connector, self.config['warmSockets'], self.logger)
+            self.pool.start()
 
     def intercept(self, process: Process, message: Message):
         if isinstance(message, SendMessage):
-            message.data = self._get_connection(message).c2s(message.data)
+            message.data = self._get_connection(process, message).c2s(message.data)
         elif isinstance(message, RecvMessage):
-            message.data = self._get_connection(message).s2c(message.data)
+            message.data = self._get_connection(process, message).s2c(message.data)
         elif isinstance(message, CloseMessage):
             self._handle_connection_close_message(message)
 
@@ -43,48 +74,77 @@ class PetepMessageInterceptor(MessageInterceptor):
         if hasattr(self, 'connections'):
             for connection in self.connections.values():
                 connection.stop()
+        if getattr(self, 'transport', None) is not None:
+            self.transport.stop()
+        if getattr(self, 'pool', None) is not None:
+            self.pool.stop()
 
-    def _get_connection(self, message: Message) -> PetepConnection:
-        with self.lock:
-            # Determine connection identifier
-            connection_id = self._extract_connection_id(message)
+    def _get_connection(self, process: Process, message: Message) -> Union[PetepConnection, PetepMultiplexedConnection]:
+        # Determine connection identifier
+        connection_id = self._extract_connection_id(message)
 
-            # Get connection or create a new one if it does not exist
+        with self.lock:
+            # Get connection or register a new one if it does not exist
             connection = self.connections.get(connection_id)
-            if connection is None:
-                info = self._extract_connection_info(message, connection_id)
-                connection = PetepConnection(
-                    petep_host=self.config['petepHost'],
-                    petep_port=self.config['petepPort'],
-                    info=info,
-                    logger=self.logger
-                )
+            ready = self.ready.get(connection_id)
+            owner = connection is None
+            if owner:
+                info = self._extract_connection_info(process, message, connection_id)
+                connection = self._create_connection(info)
+                ready = Future()
                 self.connections[connection_id] = connection
-                connection.start()
+                self.ready[connection_id] = ready
+
+        # Connection is set up outside of the global lock, so that slow PETEP does not block other connections
+        if owner:
+            self._start_connection(connection_id, connection, ready)
+        ready.result()
+        return connection
+
+    def _start_connection(self, connection_id: str, connection: Union[PetepConnection, PetepMultiplexedConnection], ready: Future):
+        try:
+            connection.start()
+            ready.set_result(True)
+        except Exception as e:
+            # Failed connection is forgotten, so that the following messages try to connect again
+            with self.lock:
+                if self.connections.get(connection_id) is connection:
+                    del self.connections[connection_id]
+                    del self.ready[connection_id]
+            connection.stop()
+            ready.set_exception(e)
+
+    def _create_connection(self, info: ConnectionInfo) -> Union[PetepConnection, PetepMultiplexedConnection]:
+        if self.transport is not None:
+            return PetepMultiplexedConnection(transport=self.transport, info=info, logger=self.logger)
+        return PetepConnection(
+            connector=self.pool if self.pool is not None else self.connector,
+            info=info,
+            logger=self.logger
+        )
 
-            return connection
-    
     def _extract_connection_id(self, message: Message) -> str:
         if self.config['multipleConnections'] == True:
             return message.metadata.get(MetadataType.CONNECTION_ID, DEFAULT_CONNECTION_ID) 
         return DEFAULT_CONNECTION_ID
     
-    def _extract_connection_info(self, message: Message, connection_id: str) -> str:
+    def _extract_connection_info(self, process: Process, message: Message, connection_id: str) -> ConnectionInfo:
         if connection_id == DEFAULT_CONNECTION_ID:
             return ConnectionInfo(
                 id=connection_id
             )
+        connection = self.get_connection_descriptor(process, message)
         return ConnectionInfo(
             id=connection_id,
-            protocol=message.metadata.get(MetadataType.PROTOCOL),
-            socket=message.metadata.get(MetadataType.SOCKET),
-            module=message.metadata.get(MetadataType.MODULE),
-            source_ip=message.metadata.get(MetadataType.CONNECTION_SOURCE_IP),
-            source_port=message.metadata.get(MetadataType.CONNECTION_SOURCE_PORT),
-            source_path=message.metadata.get(MetadataType.CONNECTION_SOURCE_PATH),
-            destination_ip=message.metadata.get(MetadataType.CONNECTION_DESTINATION_IP),
-            destination_port=message.metadata.get(MetadataType.CONNECTION_DESTINATION_PORT),
-            destination_path=message.metadata.get(MetadataType.CONNECTION_DESTINATION_PATH)
+            protocol=connection.protocol,
+            socket=connection.socket,
+            module=connection.module,
+            source_ip=connection.source_ip,
+            source_port=connection.source_port,
+            source_path=connection.source_path,
+            destination_ip=connection.destination_ip,
+            destination_port=connection.destination_port,
+            destination_path=connection.destination_path
         )
 
     
@@ -102,7 +162,20 @@ class PetepMessageInterceptor(MessageInterceptor):
             connection = self.connections.pop(connection_id, None)
             if connection is None:
                 return # Connection already
-            
-            self.logger.info('Connection %s (%s) is being closed due to received close event.', connection.info.id, connection.info.get_name())
-            
-            connection.stop()
+            ready = self.ready.pop(connection_id)
+
+        # Connection can still be being set up by another thread
+        timeout = self.connector.get_max_connect_time()
+        try:
+            if ready.exception(timeout) is not None:
+                return
+        except TimeoutError:
+            # Close is not blocked by the set up, the connection is stopped once it is set up
+            self.logger.warning('Connection %s (%s) is still being set up after %.2f s, it will be closed later.',
+                                connection.info.id, connection.info.get_name(), timeout)
+            ready.add_done_callback(lambda future: connection.stop() if future.exception() is None else None)
+            return
+
+        self.logger.info('Connection %s (%s) is being closed due to received close event.', connection.info.id, connection.info.get_name())
+
+        connection.stop()
@@ -0,0 +1,260 @@
+import json
+import logging
+import socket
+import struct
+import threading
+
+from concurrent.futures import Future
+
+from deluder.common import *
+from deluder.utils import recv_n, send_all, try_close
+
+from deluder.interceptors.petep.common import *
+from deluder.interceptors.petep.connection import ConnectionInfo, PetepConnector
+
+
+MULTIPLEXED_PROTOCOL_VERSION = 1
+
+MULTIPLEXED_HEADER = struct.Struct('!BIII')
+"""
+Header of multiplexed frame: type, channel, sequence, length of payload
+"""
+
+
+class PetepMultiplexedSocket:
+    """
+    Single socket to PETEP carrying frames of multiple channels,
+    responses are matched to requests by sequence numbers (so multiple requests can be in flight)
+    """
+    def __init__(self, connector: PetepConnector, logger: logging.Logger):
+        self.connector = connector
+        self.logger = logger
+        self.socket = None
+        self.pending: Dict[int, Future] = {}
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.reader = None
+        self.error = None
+
+    def start(self):
+        """
+        Connects to PETEP, switches the socket to multiplexed framing and starts reading responses
+        """
+        self.socket = self.connector.connect()
+        hello = json.dumps({'version': MULTIPLEXED_PROTOCOL_VERSION}).encode()
+        send_all(self.socket, PETEP_HEADER.pack(PetepDeluderMessageType.MULTIPLEXED.value, len(hello)), hello)
+        self.reader = threading.Thread(target=self._read_loop, name='petep-multiplexed-reader', daemon=True)
+        self.reader.start()
+        self.logger.debug('Multiplexed socket connected to PETEP on %s.', self.connector.endpoint)
+
+    def stop(self):
+        """
+        Closes the socket (pending requests fail)
+        """
+        try:
+            # Shutdown wakes up the reader blocked in recv
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        try_close(self.socket)
+        if self.reader:
+            self.reader.join()
+
+    def is_alive(self) -> bool:
+        return self.reader is not None and self.reader.is_alive()
+
+    def request(self, type: PetepDeluderMessageType, channel: int, sequence: int, data: bytes) -> Future:
+        """
+        Sends request frame and returns future, which is completed once the response with the same sequence arrives
+        """
+        future = Future()
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            self.pending[sequence] = future
+        try:
+            self.send(type, channel, sequence, data)
+        except Exception:
+            with self.lock:
+                self.pending.pop(sequence, None)
+            raise
+        return future
+
+    def send(self, type: PetepDeluderMessageType, channel: int, sequence: int, data: bytes):
+        """
+        Sends frame, for which no response is expected
+        """
+        header = MULTIPLEXED_HEADER.pack(type.value, channel, sequence, len(data))
+        with self.send_lock:
+            send_all(self.socket, header, data)
+
+    def _read_loop(self):
+        try:
+            while True:
+                type, channel, sequence, length = MULTIPLEXED_HEADER.unpack(recv_n(self.socket, MULTIPLEXED_HEADER.size))
+                data = recv_n(self.socket, length)
+                with self.lock:
+                    future = self.pending.pop(sequence, None)
+                if future is None:
+                    self.logger.warning('Received unexpected response %d for channel %d from PETEP.', sequence, channel)
+                    continue
+                future.set_result(data)
+        except Exception as e:
+            error = Exception('Multiplexed connection to PETEP lost!')
+            with self.lock:
+                self.error = error
+                pending = list(self.pending.values())
+                self.pending.clear()
+            for future in pending:
+                future.set_exception(error)
+            # Lost socket is replaced by a new one, so its descriptor is released right away
+            try_close(self.socket)
+
+
+class PetepMultiplexedTransport:
+    """
+    Small pool of multiplexed sockets to PETEP, channels are assigned to sockets by their number
+    (all frames of a single channel go through the same socket, so their order is kept)
+    """
+    def __init__(self, connector: PetepConnector, sockets: int, logger: logging.Logger):
+        self.connector = connector
+        self.logger = logger
+        self.sockets: List[Optional[PetepMultiplexedSocket]] = [None] * max(sockets, 1)
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.connecting: Dict[int, Future] = {}
+        self.channels: Dict[int, bytes] = {}
+        self.next_channel = 1
+        self.next_sequence = 1
+
+    def stop(self):
+        """
+        Closes all sockets of the transport
+        """
+        for multiplexed_socket in self.sockets:
+            if multiplexed_socket is not None:
+                multiplexed_socket.stop()
+
+    def open_channel(self, info: bytes) -> int:
+        """
+        Allocates new channel and sends info about its connection to PETEP
+        """
+        with self.lock:
+            channel = self.next_channel
+            self.next_channel = self.next_channel % 0xFFFFFFFF + 1
+        multiplexed_socket = self._get_socket(channel)
+        with self.lock:
+            self.channels[channel] = info
+        multiplexed_socket.send(PetepDeluderMessageType.CONNECTION_INFO, channel, self._next_sequence(), info)
+        return channel
+
+    def close_channel(self, channel: int):
+        """
+        Closes the channel
+        """
+        with self.lock:
+            self.channels.pop(channel, None)
+        self.send(PetepDeluderMessageType.CONNECTION_CLOSE, channel, b'')
+
+    def request(self, type: PetepDeluderMessageType, channel: int, data: bytes) -> Future:
+        """
+        Sends request through the socket of the channel
+        """
+        return self._get_socket(channel).request(type, channel, self._next_sequence(), data)
+
+    def send(self, type: PetepDeluderMessageType, channel: int, data: bytes):
+        """
+        Sends frame without response through the socket of the channel
+        """
+        self._get_socket(channel).send(type, channel, self._next_sequence(), data)
+
+    def _next_sequence(self) -> int:
+        with self.lock:
+            sequence = self.next_sequence
+            self.next_sequence = self.next_sequence % 0xFFFFFFFF + 1
+            return sequence
+
+    def _get_socket(self, channel: int) -> PetepMultiplexedSocket:
+        index = channel % len(self.sockets)
+        multiplexed_socket = self.sockets[index]
+        if multiplexed_socket is not None and multiplexed_socket.is_alive():
+            return multiplexed_socket
+
+        # Sockets are connected lazily and reconnected after failure, only one thread connects each socket
+        with self.connect_lock:
+            multiplexed_socket = self.sockets[index]
+            if multiplexed_socket is not None and multiplexed_socket.is_alive():
+                return multiplexed_socket
+            connecting = self.connecting.get(index)
+            owner = connecting is None
+            if owner:
+                connecting = self.connecting[index] = Future()
+        if not owner:
+            return connecting.result()
+
+        # Connecting (with retries) is done outside of the lock, so that slow PETEP does not block the other sockets
+        multiplexed_socket = PetepMultiplexedSocket(self.connector, self.logger)
+        try:
+            multiplexed_socket.start()
+            # Channels of reconnected socket have to be opened again
+            with self.lock:
+                channels = [(channel, info) for channel, info in self.channels.items() if channel % len(self.sockets) == index]
+            for channel, info in channels:
+                multiplexed_socket.send(PetepDeluderMessageType.CONNECTION_INFO, channel, self._next_sequence(), info)
+        except Exception as e:
+            if multiplexed_socket.socket is not None:
+                multiplexed_socket.stop()
+            with self.connect_lock:
+                del self.connecting[index]
+            connecting.set_exception(e)
+            raise
+        with self.connect_lock:
+            old_socket = self.sockets[index]
+            self.sockets[index] = multiplexed_socket
+            del self.connecting[index]
+        connecting.set_result(multiplexed_socket)
+        if old_socket is not None:
+            old_socket.stop()
+        return multiplexed_socket
+
+
+class PetepMultiplexedConnection:
+    """
+    Connection to PETEP represented by a channel in multiplexed socket
+    (has the same interface as PetepConnection)
+    """
+    def __init__(self, transport: PetepMultiplexedTransport, info: ConnectionInfo, logger: logging.Logger):
+        self.transport = transport
+        self.info = info
+        self.logger = logger
+        self.channel = None
+
+    def start(self):
+        """
+        Opens the channel by sending info about the connection
+        """
+        self.channel = self.transport.open_channel(self.info.to_json().encode())
+        self.logger.info('Connection %s (%s) started on channel %d.', self.info.id, self.info.get_name(), self.channel)
+
+    def stop(self):
+        """
+        Closes the channel
+        """
+        if self.channel is None:
+            return
+        try:
+            self.transport.close_channel(self.channel)
+        except Exception:
+            pass
+
+    def c2s(self, data: bytes) -> bytes:
+        """
+        Sends client->server data to PETEP for interception
+        """
+        return self.transport.request(PetepDeluderMessageType.DATA_C2S, self.channel, data).result()
+
+    def s2c(self, data: bytes) -> bytes:
+        """
+        Sends server->client data to PETEP for interception
+        """
+        return self.transport.request(PetepDeluderMessageType.DATA_S2C, self.channel, data).result()
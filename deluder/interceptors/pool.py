@@ -0,0 +1,365 @@
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from concurrent.futures import Future, TimeoutError
+from multiprocessing.shared_memory import SharedMemory
+from typing import Tuple, Type, Union
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+
+
+DEFAULT_SHARED_MEMORY_THRESHOLD = 65536
+"""
+Default size of data in bytes, from which data are passed to worker processes through shared memory instead of the pipe
+"""
+
+DEFAULT_POOL_TIMEOUT = 30.0
+"""
+Default time in seconds, for which the intercept waits for the worker process
+"""
+
+POOL_RESTART_INTERVAL = 1.0
+"""
+Minimum time in seconds between start of a worker process and its restart (so that crashing workers are not restarted in a loop)
+"""
+
+Payload = Union[None, bytes, Tuple[Optional[str], int]]
+"""
+Data of message passed between processes, either bytes or name and length of shared memory block
+(name is None if the response data were written to the block of the request)
+"""
+
+
+def load_interceptor_class(interceptor: str) -> Type[MessageInterceptor]:
+    """
+    Loads interceptor class by its code (e.g. `rewrite`) or path (e.g. `package.module:ClassName`)
+    """
+    from deluder.interceptors import INTERCEPTORS_REGISTRY
+    if interceptor in INTERCEPTORS_REGISTRY:
+        return INTERCEPTORS_REGISTRY[interceptor]
+
+    module_name, _, class_name = interceptor.partition(':')
+    try:
+        clazz = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise DeluderException(f'Interceptor {interceptor} cannot be loaded: {e}')
+    if not isinstance(clazz, type) or not issubclass(clazz, MessageInterceptor):
+        raise DeluderException(f'Interceptor {interceptor} is not a MessageInterceptor!')
+    return clazz
+
+
+class PoolWorker:
+    """
+    Worker process running its own instance of the pooled interceptor, requests are pipelined through a pipe
+    and responses are read by a reader thread
+    """
+    def __init__(self, context, index: int, interceptor: str, config: dict, threshold: int):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(child_connection, interceptor, config, threshold, logging.root.level),
+            name=f'DeluderPool-{index}',
+            daemon=True,
+        )
+        self.process.start()
+        self.started = time.monotonic()
+        child_connection.close()
+        self.pending: Dict[int, Future] = {}
+        self.abandoned: Dict[int, SharedMemory] = {}
+        """
+        Shared memory of timed out requests, which is released once the worker responds (or exits)
+        """
+        self.lock = threading.Lock()
+        self.alive = True
+        self.reader = threading.Thread(target=self._read, name=f'DeluderPoolReader-{index}', daemon=True)
+        self.reader.start()
+
+    def submit(self, request_id: int, request: tuple) -> Future:
+        future = Future()
+        with self.lock:
+            if not self.alive:
+                raise DeluderException('Pool worker is not running!')
+            self.pending[request_id] = future
+            self.connection.send((request_id,) + request)
+        return future
+
+    def abandon(self, request_id: int, future: Future, shared_memory: Optional[SharedMemory]):
+        """
+        Gives up waiting for the response, shared memory of the request is released once the worker is done with it
+        """
+        with self.lock:
+            if request_id in self.pending:
+                del self.pending[request_id]
+                if shared_memory is not None:
+                    self.abandoned[request_id] = shared_memory
+                return
+        # Response arrived in the meantime
+        if future.exception() is None:
+            discard_payload(future.result()[2])
+        release_shared_memory(shared_memory)
+
+    def stop(self, timeout: float):
+        with self.lock:
+            if self.alive:
+                try:
+                    self.connection.send(None)
+                except OSError:
+                    pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.reader.join()
+        self.connection.close()
+
+    def _read(self):
+        try:
+            while True:
+                response = self.connection.recv()
+                with self.lock:
+                    future = self.pending.pop(response[0], None)
+                    shared_memory = self.abandoned.pop(response[0], None) if future is None else None
+                if future is not None:
+                    future.set_result(response[1:])
+                else:
+                    discard_payload(response[3])
+                    release_shared_memory(shared_memory)
+        except (EOFError, OSError):
+            pass
+        with self.lock:
+            self.alive = False
+            pending, self.pending = self.pending, {}
+            abandoned, self.abandoned = self.abandoned, {}
+        for future in pending.values():
+            future.set_exception(DeluderException('Pool worker exited!'))
+        for shared_memory in abandoned.values():
+            release_shared_memory(shared_memory)
+
+
+class ProcessPoolMessageInterceptor(MessageInterceptor):
+    """
+    Process pool interceptor runs CPU-heavy interceptor in pool of worker processes, so that it does not hold the GIL
+    of Deluder (messages of a single connection are always intercepted by the same worker, so their order is kept)
+    """
+    workers: List[PoolWorker]
+
+    def __init__(self, config: Dict[str, any]=dict()):
+        super().__init__(config)
+        # Validates the interceptor, it is instantiated only by the workers
+        load_interceptor_class(self.config['interceptor'])
+        self.workers = []
+        self.request_ids = itertools.count()
+        self.requests = 0
+        self.shared_memory_requests = 0
+        self.stats_lock = threading.Lock()
+
+    @classmethod
+    def default_config(cls) -> dict:
+        return {
+            'interceptor': 'log',
+            'config': {},
+            'readOnly': False,
+            'workers': os.cpu_count() or 1,
+            'sharedMemoryThreshold': DEFAULT_SHARED_MEMORY_THRESHOLD,
+            'timeout': DEFAULT_POOL_TIMEOUT,
+        }
+
+    def is_read_only(self) -> bool:
+        # Read-only interceptor has to be declared in the config (the pooled interceptor lives only in the workers)
+        return self.config['readOnly']
+
+    def init(self):
+        # Forking process with Frida and Deluder threads is not safe, workers are always spawned
+        self.context = multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        self.workers = [self._create_worker(index) for index in range(self.config['workers'])]
+        self.logger.info('Started %d workers of %s.', len(self.workers), self.config['interceptor'])
+
+    def intercept(self, process: Process, message: Message):
+        pid = process.pid if process else 0
+        index = hash((pid, message.metadata.get(MetadataType.CONNECTION_ID))) % len(self.workers)
+        worker = self._get_worker(index)
+        request_id = next(self.request_ids)
+        data = message.data if isinstance(message, DataMessage) else None
+        threshold = self.config['sharedMemoryThreshold']
+
+        shared_memory = None
+        try:
+            if data is not None and threshold and len(data) >= threshold:
+                shared_memory = SharedMemory(create=True, size=len(data))
+                shared_memory.buf[:len(data)] = data
+                payload = (shared_memory.name, len(data))
+            else:
+                payload = data if data is None or isinstance(data, bytes) else bytes(data)
+            with self.stats_lock:
+                self.requests += 1
+                self.shared_memory_requests += shared_memory is not None
+
+            future = worker.submit(request_id, (pid, message.type.value, message.id, message.metadata, payload))
+            try:
+                error, metadata, result = future.result(self.config['timeout'])
+            except TimeoutError:
+                # Worker can still attach to the shared memory, it is released once the worker responds
+                worker.abandon(request_id, future, shared_memory)
+                shared_memory = None
+                raise DeluderException(f'Pool worker did not respond in {self.config["timeout"]} seconds!')
+            if error is not None:
+                raise DeluderException(f'Intercept in pool worker failed:\n{error}')
+
+            if metadata is not None:
+                message.metadata = metadata
+            if result is not None:
+                message.data = read_payload(result, shared_memory)
+        finally:
+            release_shared_memory(shared_memory)
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                'workers': sum(1 for worker in self.workers if worker.alive),
+                'requests': self.requests,
+                'sharedMemoryRequests': self.shared_memory_requests,
+            }
+
+    def destroy(self):
+        for worker in self.workers:
+            worker.stop(self.config['timeout'])
+        self.workers = []
+
+    def _get_worker(self, index: int) -> PoolWorker:
+        worker = self.workers[index]
+        if worker.alive:
+            return worker
+        with self.lock:
+            if not self.workers[index].alive:
+                if time.monotonic() - self.workers[index].started < POOL_RESTART_INTERVAL:
+                    raise DeluderException(f'Pool worker {index} is not running!')
+                self.logger.warning('Pool worker %d exited, starting new one.', index)
+                self.workers[index] = self._create_worker(index)
+            return self.workers[index]
+
+    def _create_worker(self, index: int) -> PoolWorker:
+        return PoolWorker(self.context, index, self.config['interceptor'], self.config['config'], self.config['sharedMemoryThreshold'])
+
+
+def read_payload(payload: Payload, shared_memory: Optional[SharedMemory]=None) -> bytes:
+    """
+    Reads response data passed from worker process (shared memory created by the worker is unlinked)
+    """
+    if not isinstance(payload, tuple):
+        return payload
+    name, length = payload
+    if name is None:
+        return bytes(shared_memory.buf[:length])
+    block = SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:length])
+    finally:
+        block.close()
+        block.unlink()
+
+
+def discard_payload(payload: Payload):
+    """
+    Releases shared memory created by the worker for response, which is not read
+    """
+    if isinstance(payload, tuple) and payload[0] is not None:
+        try:
+            release_shared_memory(SharedMemory(name=payload[0]))
+        except FileNotFoundError:
+            pass
+
+
+def release_shared_memory(shared_memory: Optional[SharedMemory]):
+    if shared_memory is not None:
+        shared_memory.close()
+        shared_memory.unlink()
+
+
+def write_payload(data: bytes, threshold: int, shared_memory: Optional[SharedMemory]=None, capacity: int=0) -> Payload:
+    """
+    Prepares response data, large data are written to shared memory of the request (if they fit) or to new shared memory
+    """
+    if shared_memory is not None and len(data) <= capacity:
+        shared_memory.buf[:len(data)] = data
+        return None, len(data)
+    if not threshold or len(data) < threshold:
+        return data if isinstance(data, bytes) else bytes(data)
+    block = SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    block.close()
+    return block.name, len(data)
+
+
+def run_worker(connection, interceptor: str, config: dict, threshold: int, level: int):
+    """
+    Main function of worker process, intercepts messages received through the pipe until None is received
+    """
+    from deluder.log import logger
+    logging.root.setLevel(level)
+
+    instance = load_interceptor_class(interceptor)(config)
+    instance.init()
+    processes: Dict[int, Process] = {}
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            connection.send(_handle_request(instance, processes, threshold, request))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception as e:
+        logger.error('Pool worker crashed!', exc_info=e)
+    finally:
+        instance.destroy()
+
+
+def _handle_request(interceptor: MessageInterceptor, processes: Dict[int, Process], threshold: int, request: tuple) -> tuple:
+    request_id, pid, type, id, metadata, payload = request
+    process = processes.get(pid)
+    if process is None:
+        process = processes[pid] = Process(pid=pid)
+
+    # Each worker has its own connection table, so that interceptors can keep per-connection state
+    handle = metadata.get(MetadataType.CONNECTION_HANDLE)
+    if handle is not None and process.connections.get(handle) is None:
+        process.connections.register(metadata)
+
+    shared_memory = None
+    try:
+        if isinstance(payload, tuple):
+            shared_memory = SharedMemory(name=payload[0])
+        # Data are copied, so that the shared memory can be closed even if the interceptor keeps them
+        data = bytes(shared_memory.buf[:payload[1]]) if shared_memory is not None else payload
+        if type == MessageType.SEND.value:
+            message = SendMessage(id, data, metadata)
+        elif type == MessageType.RECV.value:
+            message = RecvMessage(id, data, metadata)
+        else:
+            message = CloseMessage(id, metadata)
+        original_metadata = dict(metadata)
+
+        interceptor.intercept(process, message)
+
+        if isinstance(message, CloseMessage) and handle is not None:
+            process.connections.release(handle)
+
+        changed_metadata = message.metadata if message.metadata != original_metadata else None
+        result = None
+        if isinstance(message, DataMessage) and message.data is not data:
+            result = write_payload(message.data, threshold, shared_memory, payload[1] if shared_memory is not None else 0)
+        return request_id, None, changed_metadata, result
+    except Exception:
+        # Errors (including shared memory released by timed out request) are reported back, the worker keeps running
+        return request_id, traceback.format_exc(), None, None
+    finally:
+        if shared_memory is not None:
+            shared_memory.close()
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import threading
+
+from concurrent.futures import Future
+from typing import Awaitable, Tuple
+
+from deluder.common import *
+from deluder.transport import parse_endpoint
+
+from deluder.interceptors.proxifier.strategy import *
+from deluder.interceptors.proxifier.server import DEFAULT_ACCEPT_TIMEOUT, DEFAULT_SERVER_BACKLOG, POOL_RETRY_BACKOFF, POOL_RETRY_MAX_BACKOFF
+
+
+Streams = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncConnection:
+    """
+    Proxifier connection driven by the event loop of the asyncio engine
+    (has the same interface as Connection, but the interceptor threads only wait for their own futures)
+    """
+    id: str
+    loop: asyncio.AbstractEventLoop
+    strategy: ProxifierStrategy
+
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            client: Streams,
+            server: Streams,
+            strategy: ProxifierStrategy,
+            logger: logging.Logger
+    ):
+        self.loop = loop
+        self.client_reader, self.client_writer = client
+        self.server_reader, self.server_writer = server
+        self.strategy = strategy
+        self.logger = logger
+        self.lock = asyncio.Lock()
+
+    def start(self):
+        self.logger.info('Connection %s started.', self.id)
+
+    def stop(self):
+        try:
+            self._submit(self._close()).result()
+        except Exception:
+            pass
+        self.logger.info('Connection %s stopped.', self.id)
+
+    def c2s(self, data: bytes) -> bytes:
+        """
+        Sends the data from the client to the server and then receives the data on the server side and returns them back
+        """
+        return self._submit(self._send_recv(data, self.client_writer, self.server_reader)).result()
+
+    def s2c(self, data: bytes) -> bytes:
+        """
+        Sends the data from the server to the client and then receives the data on the client side and returns them back
+        """
+        return self._submit(self._send_recv(data, self.server_writer, self.client_reader)).result()
+
+    def set_info(self, id: str):
+        self.id = id
+
+    def _submit(self, coroutine: Awaitable) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def _send_recv(self, data: bytes, writer: asyncio.StreamWriter, reader: asyncio.StreamReader) -> bytes:
+        async with self.lock:
+            try:
+                return await self.strategy.send_recv_async(data, writer, reader)
+            except Exception as e:
+                self.logger.error(e.args)
+        return bytes()
+
+    async def _close(self):
+        self.server_writer.close()
+        self.client_writer.close()
+
+
+class AsyncServer:
+    """
+    Proxifier server of the asyncio engine, which runs accept loop, proxy client connections and strategies
+    as coroutines on dedicated event-loop thread (optionally keeps pool of pre-established stream pairs)
+    """
+    loop: asyncio.AbstractEventLoop
+    thread: threading.Thread
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            proxy_host: str,
+            proxy_port: int,
+            strategy: ProxifierStrategyType,
+            strategy_config: dict,
+            logger: logging.Logger,
+            pool_size: int=0,
+            backlog: int=DEFAULT_SERVER_BACKLOG,
+            accept_timeout: float=DEFAULT_ACCEPT_TIMEOUT
+    ):
+        self.server_endpoint = parse_endpoint(server_host, server_port)
+        self.proxy_endpoint = parse_endpoint(proxy_host, proxy_port)
+        self.strategy = strategy
+        self.strategy_config = strategy_config
+        self.logger = logger
+        self.pool_size = pool_size
+        self.backlog = backlog
+        self.accept_timeout = accept_timeout
+
+    def start(self):
+        """
+        Starts the event-loop thread and the server listening for new connections
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='proxifier-asyncio', daemon=True)
+        self.thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        except Exception:
+            self._stop_loop()
+            raise
+
+    def stop(self):
+        """
+        Stops the server and the event-loop thread
+        """
+        try:
+            asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+        finally:
+            self._stop_loop()
+
+    def connect(self) -> AsyncConnection:
+        """
+        Creates new connection to the server through the configured proxy
+        (pre-established stream pair is used if available)
+        """
+        return asyncio.run_coroutine_threadsafe(self._connect(), self.loop).result()
+
+    async def _start(self):
+        self.accepted = asyncio.Queue()
+        self.pool = asyncio.Queue()
+        self.pair_lock = asyncio.Lock()
+        self.refill = asyncio.Event()
+        self.refill_task = None
+        self.logger.info('Running server on %s.', self.server_endpoint)
+        self.server = await asyncio.start_server(self._on_accepted, sock=self.server_endpoint.listen(self.backlog))
+        if self.pool_size > 0:
+            self.refill.set()
+            self.refill_task = asyncio.ensure_future(self._refill_loop())
+
+    async def _stop(self):
+        if self.refill_task:
+            self.refill_task.cancel()
+        self.server.close()
+        self.server_endpoint.remove_socket_file()
+        while not self.pool.empty():
+            (_, client_writer), (_, server_writer) = self.pool.get_nowait()
+            client_writer.close()
+            server_writer.close()
+        while not self.accepted.empty():
+            _, server_writer = self.accepted.get_nowait()
+            server_writer.close()
+
+    def _stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _on_accepted(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await self.accepted.put((reader, writer))
+
+    async def _connect(self) -> AsyncConnection:
+        # Connection is created in the event loop, so that its lock belongs to the loop
+        if self.pool_size > 0:
+            # Pool is refilled on every connect, so that it recovers also after failed refills
+            self.refill.set()
+        if not self.pool.empty():
+            client, server = self.pool.get_nowait()
+        else:
+            client, server = await self._create_stream_pair()
+        return AsyncConnection(
+            loop=self.loop,
+            client=client,
+            server=server,
+            strategy=create_strategy(self.strategy, self.strategy_config),
+            logger=self.logger
+        )
+
+    async def _create_stream_pair(self) -> Tuple[Streams, Streams]:
+        # Proxy connects to the server from its own address, so the accepted streams can be paired
+        # with the client streams only by order (creation of pairs is therefore serialized)
+        async with self.pair_lock:
+            # Proxy can connect to the server after the accept of the previous pair timed out,
+            # such connection would be paired with the next client, so it is dropped
+            while not self.accepted.empty():
+                _, stale_writer = self.accepted.get_nowait()
+                self.logger.debug('Dropping stale connection from proxy on %s.', self.server_endpoint)
+                stale_writer.close()
+            self.logger.debug('Connecting through proxy on %s.', self.proxy_endpoint)
+            client = await self._open_connection()
+            try:
+                timeout = self.accept_timeout if self.accept_timeout > 0 else None
+                server = await asyncio.wait_for(self.accepted.get(), timeout)
+            except BaseException:
+                client[1].close()
+                raise
+            return client, server
+
+    async def _open_connection(self) -> Streams:
+        if self.proxy_endpoint.is_unix():
+            return await asyncio.open_unix_connection(self.proxy_endpoint.get_address())
+        return await asyncio.open_connection(self.proxy_endpoint.host, self.proxy_endpoint.port)
+
+    async def _refill_loop(self):
+        delay = POOL_RETRY_BACKOFF
+        while True:
+            await self.refill.wait()
+            self.refill.clear()
+            while self.pool.qsize() < self.pool_size:
+                try:
+                    self.pool.put_nowait(await self._create_stream_pair())
+                    delay = POOL_RETRY_BACKOFF
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.logger.warning('Could not pre-establish connection through proxy (%s), retrying in %.2f s...', e, delay)
+                    # Connects wake up the loop earlier
+                    try:
+                        await asyncio.wait_for(self.refill.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.refill.clear()
+                    delay = min(delay * 2, POOL_RETRY_MAX_BACKOFF)
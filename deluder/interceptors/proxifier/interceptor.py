@@ -1,19 +1,24 @@
 import threading
 
+from concurrent.futures import Future
+from typing import Union
+
 from deluder.common import *
 from deluder.interceptor import MessageInterceptor
 
 from deluder.interceptors.proxifier.strategy import * 
 from deluder.interceptors.proxifier.connection import DEFAULT_CONNECTION_ID, Connection
-from deluder.interceptors.proxifier.server import Server
+from deluder.interceptors.proxifier.server import DEFAULT_ACCEPT_TIMEOUT, DEFAULT_SERVER_BACKLOG, ProxifierEngineType, Server
+from deluder.interceptors.proxifier.aio import AsyncConnection, AsyncServer
 
 
 class ProxifierMessageInterceptor(MessageInterceptor):
     """
     Proxifier interceptor allows sending Deluder messages through TCP proxies using multiple strategies
     """
-    server: Server
-    connections: Dict[str, Connection]
+    server: Union[Server, AsyncServer]
+    connections: Dict[str, Union[Connection, AsyncConnection]]
+    pending: Dict[str, Future]
     lock: threading.Lock
 
     @classmethod
@@ -37,20 +42,30 @@ class ProxifierMessageInterceptor(MessageInterceptor):
             },
             'autoCloseConnections': True,
             'multipleConnections': True,
+            'engine': 'threaded',
+            'poolSize': 0,
+            'serverBacklog': DEFAULT_SERVER_BACKLOG,
+            'acceptTimeout': DEFAULT_ACCEPT_TIMEOUT,
         }
 
     def init(self):
-        self.server = Server(
+        engine = ProxifierEngineType(self.config['engine'])
+        server_type = AsyncServer if engine == ProxifierEngineType.asyncio else Server
+        self.server = server_type(
             server_host=self.config['serverHost'],
             server_port=self.config['serverPort'],
             proxy_host=self.config['proxyHost'],
             proxy_port=self.config['proxyPort'],
             strategy=ProxifierStrategyType(self.config['strategy']),
             strategy_config=self.config['strategies'].get(self.config['strategy'], {}),
-            logger=self.logger
+            logger=self.logger,
+            pool_size=self.config['poolSize'],
+            backlog=self.config['serverBacklog'],
+            accept_timeout=self.config['acceptTimeout']
         )
         self.server.start()
         self.connections = {}
+        self.pending = {}
         self.lock = threading.Lock()
 
     def intercept(self, process: Process, message: Message):
@@ -73,20 +88,38 @@ class ProxifierMessageInterceptor(MessageInterceptor):
             return message.metadata.get(MetadataType.CONNECTION_ID, DEFAULT_CONNECTION_ID) 
         return DEFAULT_CONNECTION_ID
 
-    def _get_connection(self, message: Message) -> Connection:
-        with self.lock:
-            # Determine connection identifier
-            connection_id = self._extract_connection_id(message)
+    def _get_connection(self, message: Message) -> Union[Connection, AsyncConnection]:
+        # Determine connection identifier
+        connection_id = self._extract_connection_id(message)
 
-            # Get connection or create a new one if it does not exist
+        with self.lock:
+            # Get connection or wait for the thread, which is creating it
             connection = self.connections.get(connection_id)
-            if connection is None:
-                connection = self.server.connect()
-                connection.set_info(connection_id)
-                connection.start()
-                self.connections[connection_id] = connection
+            if connection is not None:
+                return connection
+            pending = self.pending.get(connection_id)
+            owner = pending is None
+            if owner:
+                pending = self.pending[connection_id] = Future()
+        if not owner:
+            return pending.result()
 
-            return connection
+        # Connection is created outside of the global lock, so that slow proxy does not block other connections
+        try:
+            connection = self.server.connect()
+            connection.set_info(connection_id)
+            connection.start()
+        except Exception as e:
+            # Failed connection is forgotten, so that the following messages try to connect again
+            with self.lock:
+                del self.pending[connection_id]
+            pending.set_exception(e)
+            raise
+        with self.lock:
+            del self.pending[connection_id]
+            self.connections[connection_id] = connection
+        pending.set_result(connection)
+        return connection
     
     def _handle_connection_close_message(self, message: Message):
         if self.config['autoCloseConnections'] is False:
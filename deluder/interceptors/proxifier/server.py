@@ -1,21 +1,50 @@
 import logging
+import queue
 import threading
-import concurrent.futures
 import socket
 
+from typing import Tuple
+
 from deluder.common import *
+from deluder.transport import parse_endpoint
 from deluder.utils import try_close
 
 from deluder.interceptors.proxifier.strategy import * 
 from deluder.interceptors.proxifier.connection import Connection
 
 
+DEFAULT_SERVER_BACKLOG = 128
+DEFAULT_ACCEPT_TIMEOUT = 10.0
+
+POOL_RETRY_BACKOFF = 0.1
+"""
+Initial delay in seconds before pre-establishing of the pool is retried after failure (doubled after each failure)
+"""
+
+POOL_RETRY_MAX_BACKOFF = 5.0
+"""
+Maximum delay in seconds between retries of pre-establishing of the pool
+"""
+
+
+class ProxifierEngineType(str, Enum):
+    """
+    Engine, which drives the sockets of the proxifier
+    """
+    threaded = 'threaded'
+    """Blocking sockets used directly by the interceptor threads"""
+    asyncio = 'asyncio'
+    """Asyncio streams driven by dedicated event-loop thread"""
+
+
 class Server:
     """
     Proxifier server, which starts server sockets and allows creation of connections to it through proxy
+    (optionally keeps pool of pre-established socket pairs, which is refilled in the background)
     """
     server_sock: socket.socket
     lock: threading.Lock
+    pool: queue.Queue
 
     def __init__(
             self,
@@ -25,57 +54,132 @@ class Server:
             proxy_port: int,
             strategy: ProxifierStrategyType, 
             strategy_config: dict,
-            logger: logging.Logger
+            logger: logging.Logger,
+            pool_size: int=0,
+            backlog: int=DEFAULT_SERVER_BACKLOG,
+            accept_timeout: float=DEFAULT_ACCEPT_TIMEOUT
     ):
-        self.server_host = server_host
-        self.server_port = server_port
-        self.proxy_host = proxy_host
-        self.proxy_port = proxy_port
+        self.server_endpoint = parse_endpoint(server_host, server_port)
+        self.proxy_endpoint = parse_endpoint(proxy_host, proxy_port)
         self.strategy = strategy
         self.strategy_config = strategy_config
         self.logger = logger
+        self.pool_size = pool_size
+        self.backlog = backlog
+        self.accept_timeout = accept_timeout
 
     def start(self):
         """
         Starts the server and listens for new connections
         """
         self.lock = threading.Lock()
-        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.pool = queue.Queue()
+        self.refill = threading.Event()
+        self.running = True
+        self.logger.info('Running server on %s.', self.server_endpoint)
+        self.server_sock = self.server_endpoint.listen(self.backlog)
+        self.server_sock.settimeout(self.accept_timeout if self.accept_timeout > 0 else None)
 
-        server_address = (self.server_host, self.server_port)
-        self.logger.info('Running server on %s:%d.', self.server_host, self.server_port)
-        self.server_sock.bind(server_address)
-        self.server_sock.listen(1)
+        self.refill_thread = None
+        if self.pool_size > 0:
+            self.refill.set()
+            self.refill_thread = threading.Thread(target=self._refill_loop, name='proxifier-pool', daemon=True)
+            self.refill_thread.start()
     
     def stop(self):
         """
         Stops the server
         """
+        self.running = False
+        self.refill.set()
+        try:
+            # Shutdown wakes up the refill thread waiting in accept
+            self.server_sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        if self.refill_thread:
+            self.refill_thread.join()
+        while True:
+            try:
+                client_sock, server_sock = self.pool.get_nowait()
+            except queue.Empty:
+                break
+            try_close(client_sock)
+            try_close(server_sock)
         try_close(self.server_sock)
+        self.server_endpoint.remove_socket_file()
 
     def connect(self) -> Connection:
         """
         Creates new connection to the server through the configured proxy
+        (pre-established socket pair is used if available)
         """
+        if self.pool_size > 0:
+            # Pool is refilled on every connect, so that it recovers also after failed refills
+            self.refill.set()
+        try:
+            client_sock, server_sock = self.pool.get_nowait()
+        except queue.Empty:
+            client_sock, server_sock = self._create_socket_pair()
+        return Connection(
+            client_sock=client_sock, 
+            server_sock=server_sock,
+            strategy=create_strategy(self.strategy, self.strategy_config),
+            logger=self.logger
+        )
+
+    def _create_socket_pair(self) -> Tuple[socket.socket, socket.socket]:
+        # Proxy connects to the server from its own address, so the accepted socket can be paired
+        # with the client socket only by order (creation of pairs is therefore serialized)
         with self.lock:
-            executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
-            server_connection = executor.submit(self._server_accept)
-            client_sock = executor.submit(self._client_connect)
-            return Connection(
-                client_sock=client_sock.result(), 
-                server_sock=server_connection.result(),
-                strategy=create_strategy(self.strategy, self.strategy_config),
-                logger=self.logger
-            )
+            self._drop_stale_connections()
+            client_sock = self._client_connect()
+            try:
+                server_sock = self._server_accept()
+            except Exception:
+                try_close(client_sock)
+                raise
+            return client_sock, server_sock
+
+    def _refill_loop(self):
+        delay = POOL_RETRY_BACKOFF
+        while True:
+            self.refill.wait()
+            self.refill.clear()
+            while self.running and self.pool.qsize() < self.pool_size:
+                try:
+                    self.pool.put(self._create_socket_pair())
+                    delay = POOL_RETRY_BACKOFF
+                except Exception as e:
+                    self.logger.warning('Could not pre-establish connection through proxy (%s), retrying in %.2f s...', e, delay)
+                    # Stop and connects wake up the loop earlier
+                    self.refill.wait(delay)
+                    self.refill.clear()
+                    delay = min(delay * 2, POOL_RETRY_MAX_BACKOFF)
+            if not self.running:
+                return
+
+    def _drop_stale_connections(self):
+        # Proxy can connect to the server after the accept of the previous pair timed out,
+        # such connection would be paired with the next client, so it is dropped
+        timeout = self.server_sock.gettimeout()
+        self.server_sock.settimeout(0)
+        try:
+            while True:
+                stale_sock, _ = self.server_sock.accept()
+                self.logger.debug('Dropping stale connection from proxy on %s.', self.server_endpoint)
+                try_close(stale_sock)
+        except OSError:
+            pass
+        finally:
+            self.server_sock.settimeout(timeout)
     
-    def _server_accept(self):
-        self.logger.debug('Accepting connections on %s:%d.', self.server_host, self.server_port)
+    def _server_accept(self) -> socket.socket:
+        self.logger.debug('Accepting connections on %s.', self.server_endpoint)
         server_client_connection, _ = self.server_sock.accept()
+        server_client_connection.settimeout(None)
         return server_client_connection
 
-    def _client_connect(self):
-        client_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_address = (self.proxy_host, self.proxy_port)
-        self.logger.debug('Connecting through proxy on %s:%d.', self.proxy_host, self.proxy_port)
-        client_sock.connect(server_address)
-        return client_sock
+    def _client_connect(self) -> socket.socket:
+        self.logger.debug('Connecting through proxy on %s.', self.proxy_endpoint)
+        return self.proxy_endpoint.connect()
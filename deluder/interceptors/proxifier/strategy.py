@@ -1,8 +1,13 @@
+import asyncio
 import socket
+import struct
 
 from enum import Enum
 
-from deluder.utils import recv_n
+from deluder.utils import recv_n, recv_until, send_all
+
+
+LENGTH_HEADER = struct.Struct('!I')
 
 
 class ProxifierStrategyType(str, Enum):
@@ -31,6 +36,12 @@ class ProxifierStrategy:
         """
         raise Exception('Not implemented!')
 
+    async def send_recv_async(self, data: bytes, writer: asyncio.StreamWriter, reader: asyncio.StreamReader) -> bytes:
+        """
+        Sends data through the writer and receives them back using reader (used by asyncio engine)
+        """
+        raise Exception('Not implemented!')
+
 
 def create_strategy(strategy: ProxifierStrategyType, config: dict) -> ProxifierStrategy:
     """
@@ -50,12 +61,21 @@ class BufferStrategy(ProxifierStrategy):
     """
     def send_recv(self, data: bytes, sending_sock: socket.socket, receiving_sock: socket.socket) -> bytes:
         buffer_size = self.config['bufferSize']
-        sending_sock.sendall(data)
+        send_all(sending_sock, data)
         data = receiving_sock.recv(buffer_size)
         if len(data) == 0:
             raise Exception('Connection lost, please restart deluder!')
         return data
 
+    async def send_recv_async(self, data: bytes, writer: asyncio.StreamWriter, reader: asyncio.StreamReader) -> bytes:
+        buffer_size = self.config['bufferSize']
+        writer.write(data)
+        await writer.drain()
+        data = await reader.read(buffer_size)
+        if len(data) == 0:
+            raise Exception('Connection lost, please restart deluder!')
+        return data
+
 
 class SuffixStrategy(ProxifierStrategy):
     """
@@ -64,16 +84,24 @@ class SuffixStrategy(ProxifierStrategy):
     def send_recv(self, data: bytes, sending_sock: socket.socket, receiving_sock: socket.socket) -> bytes:
         suffix = self.config['value'].encode()
         buffer_size = self.config['bufferSize']
-        sending_sock.sendall(data + suffix)
+        send_all(sending_sock, data, suffix)
+        return recv_until(receiving_sock, suffix, buffer_size)
+
+    async def send_recv_async(self, data: bytes, writer: asyncio.StreamWriter, reader: asyncio.StreamReader) -> bytes:
+        suffix = self.config['value'].encode()
+        buffer_size = self.config['bufferSize']
+        writer.writelines((data, suffix))
+        await writer.drain()
         total_data = bytearray()
         while True:
-            data = receiving_sock.recv(buffer_size)
+            data = await reader.read(buffer_size)
             if len(data) == 0:
                 raise Exception('Connection lost, please restart deluder!')
             total_data.extend(data)
             if total_data.endswith(suffix):
                 break
-        return total_data[:-len(suffix)]
+        del total_data[-len(suffix):]
+        return total_data
 
 
 class LengthStrategy(ProxifierStrategy):
@@ -81,17 +109,17 @@ class LengthStrategy(ProxifierStrategy):
     Length strategy relies on prepended 4B length at the beginning of each intercepted message
     """
     def send_recv(self, data: bytes, sending_sock: socket.socket, receiving_sock: socket.socket) -> bytes:
-        payload = self.create_payload(data)
-        sending_sock.sendall(payload)
-        
-        length_bytes = recv_n(receiving_sock, 4)
-        length = int.from_bytes(length_bytes, 'big')
-        data = recv_n(receiving_sock, length)
-        return data
+        send_all(sending_sock, LENGTH_HEADER.pack(len(data)), data)
+
+        length, = LENGTH_HEADER.unpack(recv_n(receiving_sock, LENGTH_HEADER.size))
+        return recv_n(receiving_sock, length)
 
-    def create_payload(self, data: bytes) -> bytes:
-        payload = bytearray()
-        length = len(data).to_bytes(4, byteorder='big')
-        payload.extend(length)
-        payload.extend(data)
-        return payload
+    async def send_recv_async(self, data: bytes, writer: asyncio.StreamWriter, reader: asyncio.StreamReader) -> bytes:
+        writer.writelines((LENGTH_HEADER.pack(len(data)), data))
+        await writer.drain()
+
+        try:
+            length, = LENGTH_HEADER.unpack(await reader.readexactly(LENGTH_HEADER.size))
+            return await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise Exception('Connection lost, please restart deluder!')
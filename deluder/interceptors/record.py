@@ -0,0 +1,40 @@
+import time
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.recording import RecordingWriter
+
+
+class RecordMessageInterceptor(MessageInterceptor):
+    """
+    Record interceptor appends all messages to compact binary recording, 
+    which can be replayed later using "deluder replay" command
+    """
+    writer: RecordingWriter
+
+    @classmethod
+    def default_config(cls) -> dict:
+        return {
+            'path': 'deluder.rec',
+            'flushInterval': 1,
+        }
+
+    def is_read_only(self) -> bool:
+        return True
+
+    def init(self):
+        self.writer = RecordingWriter(self.config['path'])
+        self.last_flush = time.monotonic()
+        self.logger.info('Recording messages to %s.', self.config['path'])
+
+    def intercept(self, process: Process, message: Message):
+        self.writer.write(process.pid if process else 0, message)
+
+        now = time.monotonic()
+        if now - self.last_flush >= self.config['flushInterval']:
+            self.last_flush = now
+            self.writer.flush()
+
+    def destroy(self):
+        if hasattr(self, 'writer'):
+            self.writer.close()
@@ -0,0 +1,242 @@
+import heapq
+import ipaddress
+import re
+import threading
+
+from typing import Callable, FrozenSet, Tuple, Union
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.stats import DIRECTIONS
+
+
+RULE_DIRECTIONS = {
+    'send': MessageType.SEND,
+    'recv': MessageType.RECV,
+}
+
+
+@dataclass
+class RewriteRule:
+    """
+    Single find/replace rule with optional direction and connection conditions
+    """
+    name: str
+    literal: Optional[bytes]
+    """
+    Searched bytes of literal and hex patterns (None for regular expressions)
+    """
+    regex: Optional['re.Pattern']
+    replacement: bytes
+    directions: FrozenSet[MessageType]
+    conditions: List[Callable[[ConnectionDescriptor], bool]] = field(default_factory=list)
+    expand: bool = False
+    """
+    Whether the replacement contains group references of the regular expression
+    """
+
+    def matches_connection(self, connection: ConnectionDescriptor) -> bool:
+        return all(condition(connection) for condition in self.conditions)
+
+    def search(self, data: bytes, position: int) -> Optional[Tuple[int, int, bytes]]:
+        """
+        Finds the first match starting at given position or later, returns its start, end and replacement
+        """
+        if self.literal is not None:
+            start = data.find(self.literal, position)
+            return (start, start + len(self.literal), self.replacement) if start >= 0 else None
+        match = self.regex.search(data, position)
+        if match is None:
+            return None
+        return match.start(), match.end(), match.expand(self.replacement) if self.expand else self.replacement
+
+
+class RewriteMatcher:
+    """
+    Rules applicable to a message, which are applied in a single pass over the data (the leftmost match wins,
+    rule earlier in the config wins at the same position and replaced data are not matched again).
+    Each rule is searched by C substring or regex search, so data without matches are only scanned once per rule
+    (alternation of many patterns in a single regular expression is much slower in Python).
+    """
+    def __init__(self, rules: List[RewriteRule]):
+        self.rules = rules
+
+    def apply(self, data: bytes) -> Tuple[Optional[bytes], Dict[str, int]]:
+        """
+        Rewrites given data, returns None if nothing matched and number of hits of each rule
+        """
+        candidates = []
+        for order, rule in enumerate(self.rules):
+            match = rule.search(data, 0)
+            if match is not None:
+                candidates.append((match[0], order, match[1], match[2]))
+        if not candidates:
+            return None, {}
+
+        heapq.heapify(candidates)
+        hits = {}
+        parts = []
+        position = 0
+        while candidates:
+            start, order, end, replacement = candidates[0]
+            rule = self.rules[order]
+            if start >= position:
+                parts.append(data[position:start])
+                parts.append(replacement)
+                position = end
+                hits[rule.name] = hits.get(rule.name, 0) + 1
+            # Next match of the rule has to start after the replaced data
+            match = rule.search(data, max(position, start + 1))
+            if match is None:
+                heapq.heappop(candidates)
+            else:
+                heapq.heapreplace(candidates, (match[0], order, match[1], match[2]))
+        parts.append(data[position:])
+        return b''.join(parts), hits
+
+
+class RewriteMessageInterceptor(MessageInterceptor):
+    """
+    Rewrite interceptor replaces literal, hex and regex patterns in the data of messages directly in Deluder
+    (all matching rules are applied in a single pass over the data)
+    """
+    rules: List[RewriteRule]
+    matchers: Dict[Tuple[int, ...], Optional[RewriteMatcher]]
+    hits: Dict[str, int]
+
+    @classmethod
+    def default_config(cls) -> dict:
+        return {
+            'rules': [],
+        }
+
+    def init(self):
+        self.rules = [self._create_rule(index, rule) for index, rule in enumerate(self.config['rules'])]
+        self.connection_conditions = any(rule.conditions for rule in self.rules)
+        self.matchers = {}
+        self.hits = {rule.name: 0 for rule in self.rules}
+        self.lock = threading.Lock()
+
+    def intercept(self, process: Process, message: Message):
+        if not isinstance(message, DataMessage) or not message.data:
+            return
+
+        matcher = self._get_matcher(process, message)
+        if matcher is None:
+            return
+
+        data = message.data
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        result, hits = matcher.apply(data)
+        if result is None:
+            return
+
+        message.data = result
+        with self.lock:
+            for name, count in hits.items():
+                self.hits[name] += count
+        self.logger.debug('Rewritten %s [pid=%d]: %s', DIRECTIONS[message.type], process.pid, hits)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'hits': dict(self.hits)}
+
+    def _get_matcher(self, process: Process, message: DataMessage) -> Optional[RewriteMatcher]:
+        if self.connection_conditions:
+            connection = self.get_connection_descriptor(process, message)
+            key = tuple(index for index, rule in enumerate(self.rules)
+                        if message.type in rule.directions and rule.matches_connection(connection))
+        else:
+            key = tuple(index for index, rule in enumerate(self.rules) if message.type in rule.directions)
+
+        matcher = self.matchers.get(key, False)
+        if matcher is False:
+            # Matchers are compiled lazily for each combination of applicable rules
+            matcher = RewriteMatcher([self.rules[index] for index in key]) if key else None
+            self.matchers[key] = matcher
+        return matcher
+
+    @staticmethod
+    def _create_rule(index: int, config: dict) -> RewriteRule:
+        name = config.get('name', f'rule-{index + 1}')
+        regex = None
+        literal = None
+        if 'find' in config:
+            literal = config['find'].encode()
+        elif 'findHex' in config:
+            literal = bytes.fromhex(config['findHex'])
+        elif 'findRegex' in config:
+            regex = re.compile(config['findRegex'].encode())
+            if regex.match(b'') is not None:
+                raise DeluderException(f'Rewrite rule {name} matches empty data!')
+        else:
+            raise DeluderException(f'Rewrite rule {name} has no find, findHex or findRegex!')
+        if literal is not None and not literal:
+            raise DeluderException(f'Rewrite rule {name} has empty pattern!')
+
+        if 'replaceHex' in config:
+            replacement = bytes.fromhex(config['replaceHex'])
+        else:
+            replacement = config.get('replace', '').encode()
+
+        directions = config.get('directions', list(RULE_DIRECTIONS.keys()))
+        unknown = [direction for direction in directions if direction not in RULE_DIRECTIONS]
+        if unknown:
+            raise DeluderException(f'Rewrite rule {name} has unknown directions {unknown}!')
+
+        return RewriteRule(
+            name=name,
+            literal=literal,
+            regex=regex,
+            replacement=replacement,
+            directions=frozenset(RULE_DIRECTIONS[direction] for direction in directions),
+            conditions=RewriteMessageInterceptor._create_conditions(config),
+            expand=regex is not None and b'\\' in replacement,
+        )
+
+    @staticmethod
+    def _create_conditions(config: dict) -> List[Callable[[ConnectionDescriptor], bool]]:
+        conditions = []
+        if 'modules' in config:
+            modules = set(config['modules'])
+            conditions.append(lambda connection: connection.module in modules)
+        if 'protocols' in config:
+            protocols = set(config['protocols'])
+            conditions.append(lambda connection: connection.protocol in protocols)
+        if 'ips' in config:
+            networks = [ipaddress.ip_network(ip, strict=False) for ip in config['ips']]
+            conditions.append(lambda connection: any(_ip_in_networks(ip, networks)
+                                                     for ip in (connection.source_ip, connection.destination_ip)))
+        if 'ports' in config:
+            ranges = [_parse_port_range(port) for port in config['ports']]
+            conditions.append(lambda connection: any(port is not None and any(low <= port <= high for low, high in ranges)
+                                                     for port in (connection.source_port, connection.destination_port)))
+        if 'paths' in config:
+            paths = config['paths']
+            conditions.append(lambda connection: any(_path_matches(path, paths)
+                                                     for path in (connection.source_path, connection.destination_path)))
+        return conditions
+
+
+def _ip_in_networks(ip: Optional[str], networks: list) -> bool:
+    if not ip:
+        return False
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def _parse_port_range(port: Union[int, str]) -> Tuple[int, int]:
+    if isinstance(port, int):
+        return port, port
+    low, _, high = port.partition('-')
+    return int(low), int(high or low)
+
+
+def _path_matches(path: Optional[str], patterns: List[str]) -> bool:
+    if not path:
+        return False
+    return any(path.startswith(pattern[:-1]) if pattern.endswith('*') else path == pattern for pattern in patterns)
@@ -1,15 +1,198 @@
+import copy
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 
+from enum import Enum
+from typing import List, Optional
+
+from deluder.common import DEFAULT_LOG_QUEUE_SIZE, DataMessage, Message
+from deluder.utils import LazyFormattedBytes
+
+
+LOG_FORMAT = '%(asctime)s.%(msecs)03dZ [%(levelname)s] (%(name)s) %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
 logging.basicConfig(
-    format='%(asctime)s.%(msecs)03dZ [%(levelname)s] (%(name)s) %(message)s',
-    datefmt='%Y-%m-%dT%H:%M:%S'
+    format=LOG_FORMAT,
+    datefmt=LOG_DATE_FORMAT
 )
 logging.root.setLevel(logging.INFO)
 
 logger = logging.getLogger('Deluder')
 
 
+LOG_FILE_FLUSH_INTERVAL = 1.0
+"""
+Maximum time in seconds, for which records written to the log file stay in the buffer (while logging continues)
+"""
+
+
+class LogOverflowPolicy(str, Enum):
+    """
+    Behaviour of the log pipeline when its queue is full
+    """
+    block = 'block'
+    """Waits until there is space in the queue"""
+    drop_oldest = 'drop-oldest'
+    """Drops the oldest waiting record"""
+    drop_new = 'drop-new'
+    """Drops the new record"""
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler with bounded queue and overflow policy, which defers formatting of records to the log thread
+    """
+    dropped: int
+
+    def __init__(self, log_queue: queue.Queue, overflow: LogOverflowPolicy):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments are kept, so that the message is formatted only in the log thread
+        # (mutable arguments are snapshotted, since they can be modified by following interceptors)
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if isinstance(record.args, tuple):
+            record.args = tuple(self._snapshot(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: self._snapshot(arg) for key, arg in record.args.items()}
+        return record
+
+    @staticmethod
+    def _snapshot(arg):
+        if isinstance(arg, dict):
+            return copy.copy(arg)
+        if isinstance(arg, bytearray):
+            return bytes(arg)
+        if isinstance(arg, LazyFormattedBytes) and not isinstance(arg.data, bytes):
+            return LazyFormattedBytes(bytes(arg.data), arg.max_bytes)
+        if isinstance(arg, Message):
+            message = copy.copy(arg)
+            message.metadata = copy.copy(arg.metadata)
+            if isinstance(arg, DataMessage) and isinstance(arg.data, bytearray):
+                message.data = bytes(arg.data)
+            return message
+        return arg
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.overflow == LogOverflowPolicy.block:
+            self.queue.put(record)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == LogOverflowPolicy.drop_new:
+                    self._on_dropped()
+                    return
+            try:
+                self.queue.get_nowait()
+                self._on_dropped()
+            except queue.Empty:
+                pass
+
+    def _on_dropped(self):
+        with self.dropped_lock:
+            self.dropped += 1
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotating file handler, which does not flush the file after each record
+    """
+    def __init__(self, filename: str, max_bytes: int=0, backup_count: int=0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self.last_flush >= LOG_FILE_FLUSH_INTERVAL:
+            super().flush()
+            self.last_flush = now
+
+    def close(self):
+        super().flush()
+        super().close()
+
+
+class LogPipeline:
+    """
+    Asynchronous log pipeline, in which the records are put to bounded queue and handled by the log thread
+    (so that slow terminal or file does not block the threads processing the messages)
+    """
+    handler: BoundedQueueHandler
+    listener: logging.handlers.QueueListener
+    handlers: List[logging.Handler]
+    file_handler: Optional[BufferedRotatingFileHandler]
+
+    def __init__(
+            self,
+            queue_size: int=DEFAULT_LOG_QUEUE_SIZE,
+            overflow: LogOverflowPolicy=LogOverflowPolicy.block,
+            file: Optional[str]=None,
+            file_max_bytes: int=0,
+            file_backups: int=0
+    ):
+        self.queue_size = queue_size
+        self.overflow = LogOverflowPolicy(overflow)
+        self.file = file
+        self.file_max_bytes = file_max_bytes
+        self.file_backups = file_backups
+
+    def start(self):
+        """
+        Replaces handlers of the root logger by the queue handler and starts the log thread
+        """
+        self.handlers = list(logging.root.handlers)
+        self.file_handler = None
+        target_handlers = list(self.handlers)
+        if self.file:
+            self.file_handler = BufferedRotatingFileHandler(self.file, self.file_max_bytes, self.file_backups)
+            self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+            target_handlers.append(self.file_handler)
+
+        self.handler = BoundedQueueHandler(queue.Queue(self.queue_size), self.overflow)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *target_handlers, respect_handler_level=True)
+        self.listener.start()
+
+        for handler in self.handlers:
+            logging.root.removeHandler(handler)
+        logging.root.addHandler(self.handler)
+
+    def stop(self):
+        """
+        Handles all waiting records and restores the original handlers of the root logger
+        """
+        for handler in self.handlers:
+            logging.root.addHandler(handler)
+        logging.root.removeHandler(self.handler)
+        self.listener.stop()
+        if self.file_handler:
+            self.file_handler.close()
+        if self.handler.dropped > 0:
+            logger.warning('Log pipeline dropped %d records in total.', self.handler.dropped)
+
+    def snapshot(self) -> dict:
+        """
+        Creates snapshot of the log pipeline counters
+        """
+        return {
+            'depth': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+        }
+
+
 def create_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
 
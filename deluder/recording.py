@@ -0,0 +1,234 @@
+import json
+import mmap
+import struct
+import threading
+import time
+
+from typing import Iterator, Tuple
+
+from deluder.common import *
+
+
+RECORDING_MAGIC = b'DLDREC\x00\x01'
+INDEX_MAGIC = b'DLDIDX\x00\x01'
+INDEX_EXTENSION = '.idx'
+
+DEFAULT_RECORDING_CONNECTION_ID = 'default'
+
+RECORD_HEADER = struct.Struct('<IdIcBI')
+"""
+Header of record: length of the rest of the record, timestamp, pid, message type, flags, connection number
+"""
+
+RECORD_METADATA_LENGTH = struct.Struct('<I')
+
+INDEX_ENTRY = struct.Struct('<dQQI4x')
+"""
+Entry of the index: timestamp, offset of the record, offset of the record with metadata, connection number
+"""
+
+RECORD_FLAG_METADATA = 0x01
+"""
+Record contains metadata (metadata are stored only if they changed since the last record of the connection)
+"""
+
+
+@dataclass
+class RecordedMessage:
+    """
+    Message stored in the recording
+    """
+    timestamp: float
+    pid: int
+    type: MessageType
+    connection_id: str
+    metadata: Dict[str, any]
+    data: Optional[bytes]
+
+
+class RecordingWriter:
+    """
+    Writer of compact binary recording of messages (with index file for fast lookup by time and connection)
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'wb', buffering=1048576)
+        self.index_file = open(path + INDEX_EXTENSION, 'wb', buffering=262144)
+        self.file.write(RECORDING_MAGIC)
+        self.index_file.write(INDEX_MAGIC)
+        self.offset = len(RECORDING_MAGIC)
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def write(self, pid: int, message: Message, timestamp: Optional[float]=None):
+        """
+        Appends message to the recording (timestamps of messages without given timestamp are taken in order of writing)
+        """
+        metadata = {str(key.value if isinstance(key, MetadataType) else key): value
+                    for key, value in message.metadata.items() if key != MetadataType.CONNECTION_HANDLE}
+        key = (pid, metadata.get(MetadataType.CONNECTION_ID.value, DEFAULT_RECORDING_CONNECTION_ID))
+        data = message.data if isinstance(message, DataMessage) and message.data is not None else b''
+
+        with self.lock:
+            if timestamp is None:
+                timestamp = time.time()
+            connection = self.connections.get(key)
+            if connection is None:
+                connection = self.connections[key] = [len(self.connections), None, 0]
+            number, last_metadata, metadata_offset = connection
+
+            flags = 0
+            raw_metadata = b''
+            if metadata != last_metadata:
+                flags |= RECORD_FLAG_METADATA
+                raw_metadata = json.dumps(metadata, separators=(',', ':')).encode()
+                connection[1] = metadata
+                connection[2] = metadata_offset = self.offset
+
+            length = RECORD_HEADER.size - 4 + len(data)
+            if flags & RECORD_FLAG_METADATA:
+                length += RECORD_METADATA_LENGTH.size + len(raw_metadata)
+
+            self.file.write(RECORD_HEADER.pack(length, timestamp, pid, message.type.value.encode(), flags, number))
+            if flags & RECORD_FLAG_METADATA:
+                self.file.write(RECORD_METADATA_LENGTH.pack(len(raw_metadata)))
+                self.file.write(raw_metadata)
+            self.file.write(data)
+            self.index_file.write(INDEX_ENTRY.pack(timestamp, self.offset, metadata_offset, number))
+            self.offset += 4 + length
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index_file.close()
+
+
+class RecordingReader:
+    """
+    Reader of recording, which memory-maps the recording and its index
+    (messages can be read sequentially or searched by time and connection)
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.index_file = open(path + INDEX_EXTENSION, 'rb')
+        self.data = self._map(self.file, RECORDING_MAGIC)
+        self.index = self._map(self.index_file, INDEX_MAGIC)
+        self.count = (len(self.index) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+        self.connection_ids = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[RecordedMessage]:
+        return self.iter_range(0, self.count)
+
+    def __enter__(self) -> 'RecordingReader':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+        self.file.close()
+        self.index_file.close()
+
+    def read(self, index: int) -> RecordedMessage:
+        """
+        Reads message with given index
+        """
+        _, offset, metadata_offset, _ = self._read_index_entry(index)
+        return self._read_record(offset, metadata_offset)
+
+    def iter_range(self, start: int, end: int) -> Iterator[RecordedMessage]:
+        """
+        Iterates over messages with indexes in given range
+        """
+        for index in range(start, min(end, self.count)):
+            yield self.read(index)
+
+    def find_time(self, timestamp: float) -> int:
+        """
+        Finds index of the first message recorded at or after given timestamp (binary search in the index)
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._read_index_entry(middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def iter_time(self, start: float, end: float) -> Iterator[RecordedMessage]:
+        """
+        Iterates over messages recorded in given time range [start, end)
+        """
+        return self.iter_range(self.find_time(start), self.find_time(end))
+
+    def iter_connection(self, connection_id: str, pid: Optional[int]=None) -> Iterator[RecordedMessage]:
+        """
+        Iterates over messages of given connection (optionally only in given process)
+        """
+        numbers = {number for number, (number_pid, number_id) in self.connections().items()
+                   if number_id == connection_id and (pid is None or number_pid == pid)}
+        for index in range(self.count):
+            _, offset, metadata_offset, number = self._read_index_entry(index)
+            if number in numbers:
+                yield self._read_record(offset, metadata_offset)
+
+    def connections(self) -> Dict[int, Tuple[int, str]]:
+        """
+        Obtains all connections in the recording as map of connection number to pid and connection id
+        """
+        if self.connection_ids is None:
+            self.connection_ids = {}
+            for index in range(self.count):
+                _, offset, metadata_offset, number = self._read_index_entry(index)
+                if number not in self.connection_ids:
+                    message = self._read_record(offset, metadata_offset, with_data=False)
+                    self.connection_ids[number] = (message.pid, message.connection_id)
+        return self.connection_ids
+
+    def _read_index_entry(self, index: int) -> Tuple[float, int, int, int]:
+        if index < 0 or index >= self.count:
+            raise IndexError(f'Message {index} is not in the recording!')
+        return INDEX_ENTRY.unpack_from(self.index, len(INDEX_MAGIC) + index * INDEX_ENTRY.size)
+
+    def _read_record(self, offset: int, metadata_offset: int, with_data: bool=True) -> RecordedMessage:
+        length, timestamp, pid, type, flags, _ = RECORD_HEADER.unpack_from(self.data, offset)
+        end = offset + 4 + length
+        position = offset + RECORD_HEADER.size
+        if flags & RECORD_FLAG_METADATA:
+            metadata_length = RECORD_METADATA_LENGTH.unpack_from(self.data, position)[0]
+            position += RECORD_METADATA_LENGTH.size + metadata_length
+        metadata = self._read_metadata(metadata_offset)
+        return RecordedMessage(
+            timestamp=timestamp,
+            pid=pid,
+            type=MessageType(type.decode()),
+            connection_id=metadata.get(MetadataType.CONNECTION_ID.value, DEFAULT_RECORDING_CONNECTION_ID),
+            metadata=metadata,
+            data=self.data[position:end] if with_data else None
+        )
+
+    def _read_metadata(self, offset: int) -> Dict[str, any]:
+        position = offset + RECORD_HEADER.size
+        metadata_length = RECORD_METADATA_LENGTH.unpack_from(self.data, position)[0]
+        position += RECORD_METADATA_LENGTH.size
+        return json.loads(self.data[position:position + metadata_length])
+
+    @staticmethod
+    def _map(file, magic: bytes) -> mmap.mmap:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(magic)] != magic:
+            data.close()
+            raise DeluderException(f'File {file.name} is not a Deluder recording!')
+        return data
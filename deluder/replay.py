@@ -0,0 +1,126 @@
+import threading
+import time
+
+from deluder.common import *
+from deluder.interceptors import create_interceptors
+from deluder.log import LogPipeline, logger, set_debug_level
+from deluder.recording import RecordingReader
+from deluder.router import MessageRouter
+from deluder.stats import StatsReporter
+
+
+class ReplayScript:
+    """
+    Stand-in for Frida script of replayed process, which only counts the responses
+    """
+    def __init__(self):
+        self.responses = 0
+        self.lock = threading.Lock()
+
+    def post(self, message: dict, data: Optional[bytes]=None):
+        with self.lock:
+            self.responses += 1
+
+
+class Replayer:
+    """
+    Replayer feeds messages from the recording through configured interceptors without any Frida target
+    (as fast as possible or at the recorded pace)
+    """
+    path: str
+    config: DeluderConfig
+    paced: bool
+    speed: float
+
+    def __init__(self, path: str, config: Optional[DeluderConfig]=None, paced: bool=False, speed: float=1.0):
+        self.path = path
+        self.config = config if config is not None else create_default_config()
+        self.paced = paced
+        self.speed = speed
+
+    def replay(self) -> dict:
+        """
+        Replays the recording and returns snapshot of router stats (errors are logged and raised)
+        """
+        log_pipeline = LogPipeline(
+            queue_size=self.config.log_queue_size,
+            overflow=self.config.log_overflow,
+            file=self.config.log_file,
+            file_max_bytes=self.config.log_file_max_bytes,
+            file_backups=self.config.log_file_backups
+        )
+        log_pipeline.start()
+        set_debug_level(self.config.debug)
+        interceptors = []
+        router = None
+        router_stopped = False
+        stats_reporter = None
+        snapshot = {}
+        try:
+            interceptors = create_interceptors(self.config)
+            for interceptor in interceptors:
+                interceptor.init()
+
+            router = MessageRouter(
+                interceptors=interceptors,
+                binary_responses=self.config.binary_responses,
+                observe_only=all(interceptor.is_read_only() for interceptor in interceptors),
+                queue_size=self.config.queue_size,
+                shards=self.config.shards,
+                fan_out=self.config.fan_out
+            )
+            router.start()
+
+            if self.config.stats_interval > 0:
+                stats_reporter = StatsReporter(self.config.stats_interval, router.snapshot)
+                stats_reporter.start()
+
+            with RecordingReader(self.path) as reader:
+                logger.info('Replaying %d messages from %s...', len(reader), self.path)
+                start = time.monotonic()
+                count = self._replay_messages(reader, router)
+                router.stop()
+                router_stopped = True
+                elapsed = time.monotonic() - start
+
+            snapshot = router.snapshot()
+            logger.info('Replayed %d messages in %.3f seconds (%.0f messages/s).', count, elapsed, count / elapsed if elapsed > 0 else 0)
+        except DeluderException as e:
+            logger.error(f'Replay failed with an error: {e.message}')
+            raise
+        except Exception as e:
+            logger.error('Replay crashed!', exc_info=e)
+            raise
+        finally:
+            if stats_reporter:
+                stats_reporter.stop()
+            if router and not router_stopped:
+                router.stop()
+            for interceptor in interceptors:
+                interceptor.destroy()
+            log_pipeline.stop()
+        return snapshot
+
+    def _replay_messages(self, reader: RecordingReader, router: MessageRouter) -> int:
+        processes = {}
+        first_timestamp = None
+        start = time.monotonic()
+        count = 0
+        for message in reader:
+            if self.paced:
+                if first_timestamp is None:
+                    first_timestamp = message.timestamp
+                delay = (message.timestamp - first_timestamp) / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            process = processes.get(message.pid)
+            if process is None:
+                process = processes[message.pid] = Process(pid=message.pid, script=ReplayScript())
+
+            payload = dict(message.metadata)
+            payload['id'] = f'replay-{count}'
+            payload['type'] = message.type.value
+            router.route(process, {'type': 'send', 'payload': payload}, message.data if message.type != MessageType.CLOSE else None)
+            count += 1
+        return count
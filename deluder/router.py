@@ -1,40 +1,292 @@
-from typing import Optional
+import threading
+import time
+
+from copy import copy
+from functools import partial
+from typing import Optional, Tuple
 
 from deluder.common import *
 from deluder.interceptor import MessageInterceptor
 from deluder.converter import MessageConverter
+from deluder.dispatcher import MessageDispatcher
 from deluder.log import logger
+from deluder.stats import RouterStats
+
+
+class ReadOnlyFanOut:
+    """
+    Fan-out runs read-only interceptors of the chain in background, so that the response is sent
+    as soon as the modifying interceptors finish.
+    Each read-only interceptor has its own worker with bounded queue (so it sees messages in order) and gets snapshot
+    of the message taken at its position in the chain, if a modifying interceptor follows it.
+    Messages are dropped (and counted) if the queue of the interceptor is full.
+    """
+    dispatchers: Dict[int, MessageDispatcher]
+    """
+    Dispatchers of read-only interceptors by their position in the chain
+    """
+
+    def __init__(self, interceptors: List[Tuple[int, MessageInterceptor, str]], stats: RouterStats, queue_size: int, snapshot_positions: List[int]):
+        self.names = {position: name for position, _, name in interceptors}
+        self.dispatchers = {
+            position: MessageDispatcher(partial(self._handle, interceptor, name), queue_size)
+            for position, interceptor, name in interceptors
+        }
+        self.snapshot_positions = set(snapshot_positions)
+        self.stats = stats
+        self.releases = {}
+        self.lock = threading.Lock()
+
+    def is_background(self, position: int) -> bool:
+        return position in self.dispatchers
+
+    def start(self):
+        for dispatcher in self.dispatchers.values():
+            dispatcher.start()
+
+    def stop(self):
+        """
+        Stops the workers once all queued messages are processed
+        """
+        for dispatcher in self.dispatchers.values():
+            dispatcher.stop()
+
+    def snapshot(self) -> dict:
+        return {self.names[position]: dispatcher.snapshot() for position, dispatcher in self.dispatchers.items()}
+
+    def dispatch(self, position: int, process: Process, message: Message):
+        """
+        Queues message for read-only interceptor at given position
+        """
+        if position in self.snapshot_positions:
+            message = self._snapshot(message)
+        # Close releases state of the connection in interceptors, so it is never dropped
+        if not self.dispatchers[position].dispatch(process, message, block=isinstance(message, CloseMessage)):
+            self._on_handled(process, message)
+
+    def expect_close(self, message: CloseMessage):
+        """
+        Defers release of the connection until all read-only interceptors handle (or drop) the close message
+        """
+        with self.lock:
+            self.releases[message.id] = self.releases.get(message.id, 0) + len(self.dispatchers)
+
+    def _handle(self, interceptor: MessageInterceptor, name: str, process: Process, message: Message):
+        start = time.perf_counter_ns()
+        try:
+            interceptor.intercept(process, message)
+        except Exception as e:
+            logger.error('Intercept in %s failed!', interceptor.get_name(), exc_info=e)
+        self.stats.record_interceptor(name, process.pid, message, time.perf_counter_ns() - start)
+        self._on_handled(process, message)
+
+    def _on_handled(self, process: Process, message: Message):
+        if not isinstance(message, CloseMessage):
+            return
+        with self.lock:
+            self.releases[message.id] -= 1
+            if self.releases[message.id] > 0:
+                return
+            del self.releases[message.id]
+        MessageRouter._release_connection(process, message)
+
+    @staticmethod
+    def _snapshot(message: Message) -> Message:
+        snapshot = copy(message)
+        snapshot.metadata = copy(message.metadata)
+        if isinstance(message, DataMessage) and not isinstance(message.data, bytes):
+            snapshot.data = bytes(message.data)
+        return snapshot
 
 
 class MessageRouter:
     """
     Router lets messages go through interceptors and routes them back to the originating process script.
+    Messages are processed by sharded background workers (or inline on the Frida's message thread if there are no shards).
+    In observe-only mode, the scripts do not wait for the response and messages are always processed in background.
+    With fan-out, read-only interceptors of mixed chains run in background and the scripts wait only for the modifying ones.
     """
-    def __init__(self, interceptors: List[MessageInterceptor]):
+    dispatcher: Optional[MessageDispatcher]
+    fan_out: Optional[ReadOnlyFanOut]
+    stats: RouterStats
+
+    def __init__(
+            self,
+            interceptors: List[MessageInterceptor],
+            binary_responses: bool=True,
+            observe_only: bool=False,
+            queue_size: int=DEFAULT_QUEUE_SIZE,
+            shards: int=0,
+            fan_out: bool=False
+    ):
         self.interceptors = interceptors
+        self.interceptor_names = self._create_interceptor_names(interceptors)
+        self.binary_responses = binary_responses
+        self.observe_only = observe_only
+        self.stats = RouterStats()
+        self.fan_out = self._create_fan_out(queue_size) if fan_out and not observe_only else None
+        if observe_only:
+            self.dispatcher = MessageDispatcher(self._observe, queue_size, shards)
+        elif shards > 0:
+            self.dispatcher = MessageDispatcher(self._intercept, queue_size, shards)
+        else:
+            self.dispatcher = None
+
+    def start(self):
+        """
+        Starts background processing of messages (if needed)
+        """
+        if self.fan_out:
+            self.fan_out.start()
+        if self.dispatcher:
+            self.dispatcher.start()
+
+    def stop(self):
+        """
+        Stops background processing of messages (if needed)
+        """
+        if self.dispatcher:
+            self.dispatcher.stop()
+        if self.fan_out:
+            self.fan_out.stop()
+
+    def snapshot(self) -> dict:
+        """
+        Creates snapshot of router performance counters
+        """
+        snapshot = self.stats.snapshot()
+        if self.dispatcher:
+            snapshot['dispatcher'] = self.dispatcher.snapshot()
+        if self.fan_out:
+            snapshot['fanOut'] = self.fan_out.snapshot()
+        return snapshot
 
     def route(self, process: Process, message: dict, data: Optional[bytes]):
         """
         Routes given message and data through interceptors and back to the originating script.
         """
-        message = MessageConverter.convert(message, data)
+        if MessageConverter.is_batch(message):
+            self.route_batch(process, message, data)
+            return
+
+        message = MessageConverter.convert(message, data, process.connections)
         if not message:
             return
+
+        self._route_message(process, message)
+
+    def route_batch(self, process: Process, message: dict, data: Optional[bytes]):
+        """
+        Routes all messages contained in given batch message (data contains data of all messages in the batch).
+        """
+        for message in MessageConverter.convert_batch(message, data, process.connections):
+            self._route_message(process, message)
+
+    def _route_message(self, process: Process, message: Message):
+        self.stats.record_message(process.pid, message)
+
+        if self.dispatcher:
+            # Messages, for which the script waits, cannot be dropped and close releases state of the connection,
+            # so only data messages are dropped in observe-only mode
+            block = not self.observe_only or isinstance(message, CloseMessage)
+            self.dispatcher.dispatch(process, message, block=block)
+            return
         
-        for interceptor in self.interceptors:
-            try:
-                interceptor.intercept(process, message)
-            except Exception as e:
-                logger.error('Intercept in %s failed!', interceptor.get_name(), exc_info=e)
+        self._intercept(process, message)
 
+    def _intercept(self, process: Process, message: Message):
+        start = time.perf_counter_ns()
         if isinstance(message, DataMessage):
-            response = self._create_data_message_response(message)
-            process.script.post(response)
+            original_data = message.data
+            original_metadata = copy(message.metadata)
+
+        self._run_interceptors(process, message)
+        self.stats.record_route(process.pid, message, time.perf_counter_ns() - start)
+
+        if isinstance(message, DataMessage):
+            if self._is_unchanged(message, original_data, original_metadata):
+                process.script.post(self._create_unchanged_message_response(message))
+            elif self.binary_responses:
+                response = self._create_binary_data_message_response(message)
+                process.script.post(response, self._get_response_data(message))
+            else:
+                response = self._create_data_message_response(message)
+                process.script.post(response)
         elif isinstance(message, CloseMessage):
-            pass # No action needed
+            if not self.fan_out:
+                self._release_connection(process, message)
         else:
             raise ValueError(f'Unsupported message {message}!')
 
+    def _observe(self, process: Process, message: Message):
+        # Script does not wait for any response in observe-only mode
+        start = time.perf_counter_ns()
+        self._run_interceptors(process, message)
+        self.stats.record_route(process.pid, message, time.perf_counter_ns() - start)
+        if isinstance(message, CloseMessage):
+            self._release_connection(process, message)
+
+    def _run_interceptors(self, process: Process, message: Message):
+        if self.fan_out and isinstance(message, CloseMessage):
+            self.fan_out.expect_close(message)
+        for position, (interceptor, name) in enumerate(zip(self.interceptors, self.interceptor_names)):
+            if self.fan_out and self.fan_out.is_background(position):
+                self.fan_out.dispatch(position, process, message)
+                continue
+            start = time.perf_counter_ns()
+            try:
+                interceptor.intercept(process, message)
+            except Exception as e:
+                logger.error('Intercept in %s failed!', interceptor.get_name(), exc_info=e)
+            self.stats.record_interceptor(name, process.pid, message, time.perf_counter_ns() - start)
+
+    def _create_fan_out(self, queue_size: int) -> Optional[ReadOnlyFanOut]:
+        read_only = [(position, interceptor, name)
+                     for position, (interceptor, name) in enumerate(zip(self.interceptors, self.interceptor_names))
+                     if interceptor.is_read_only()]
+        if not read_only or len(read_only) == len(self.interceptors):
+            return None # Fan-out is useful only for mixed chains
+        # Snapshot is needed only if a modifying interceptor can change the message later
+        last_modifying = max(position for position, interceptor in enumerate(self.interceptors) if not interceptor.is_read_only())
+        snapshot_positions = [position for position, _, _ in read_only if position < last_modifying]
+        return ReadOnlyFanOut(read_only, self.stats, queue_size, snapshot_positions)
+
+    @staticmethod
+    def _create_interceptor_names(interceptors: List[MessageInterceptor]) -> List[str]:
+        # Names used in stats (the same interceptor can be used multiple times in the chain)
+        names = []
+        for interceptor in interceptors:
+            name = interceptor.get_name()
+            occurrence = sum(1 for existing in names if existing.split('#')[0] == name)
+            names.append(name if occurrence == 0 else f'{name}#{occurrence + 1}')
+        return names
+
+    @staticmethod
+    def _release_connection(process: Process, message: CloseMessage):
+        handle = message.metadata.get(MetadataType.CONNECTION_HANDLE)
+        if handle is not None:
+            process.connections.release(handle)
+
+    @staticmethod
+    def _is_unchanged(message: DataMessage, original_data: bytes, original_metadata: Dict[str, any]) -> bool:
+        """
+        Checks whether interceptors left the data and metadata of the message untouched
+        """
+        if message.data is not original_data and message.data != original_data:
+            return False
+        return message.metadata == original_metadata
+
+    @staticmethod
+    def _create_unchanged_message_response(message: DataMessage):
+        """
+        Creates compact response, which lets the script keep the original buffer
+        """
+        return {
+            'type': message.id,
+            'id': message.id,
+            'unchanged': True,
+        }
+
     @staticmethod
     def _create_data_message_response(message: DataMessage):
         return {
@@ -43,3 +295,20 @@ class MessageRouter:
             'data': list(message.data),
             'metadata': message.metadata,
         }
+
+    @staticmethod
+    def _create_binary_data_message_response(message: DataMessage):
+        """
+        Creates response without the payload, which is sent separately through the Frida's binary data channel
+        """
+        return {
+            'type': message.id,
+            'id': message.id,
+            'metadata': message.metadata,
+        }
+
+    @staticmethod
+    def _get_response_data(message: DataMessage) -> bytes:
+        if isinstance(message.data, bytes):
+            return message.data
+        return bytes(message.data)
@@ -5,7 +5,7 @@ from deluder.common import *
 from deluder.scripts import *
 
 
-def load_scripts(config: DeluderConfig) -> str:
+def load_scripts(config: DeluderConfig, observe_only: bool=False) -> str:
     """
     Loads scripts using given Deluder config as a single script string
     (concatenates all scripts into single string)
@@ -13,7 +13,7 @@ def load_scripts(config: DeluderConfig) -> str:
     source = ''
     
     source += _read_script('config')
-    source += _create_config_changes(config)
+    source += _create_config_changes(config, observe_only)
     source += _read_script('common')
 
     for script in config.scripts:
@@ -47,7 +47,9 @@ def _wrap_script(script_source: str) -> str:
 }}());
     """
 
-def _create_config_changes(config: DeluderConfig) -> str:
+def _create_config_changes(config: DeluderConfig, observe_only: bool) -> str:
     return f"""
 config.debug = {str(config.debug).lower()};    
+config.observeOnly = {str(observe_only).lower()};
+config.filters = {json.dumps(config.filters)};
 """
@@ -34,6 +34,8 @@ SCRIPTS_DEFAULT_CONFIGS = {
         'WSARecvFrom': True,
         'shutdown': True,
         'closesocket': True,
+        'connect': True,
+        'accept': True,
     },
     'libc': {
         'libs': ["libc.so"],
@@ -43,6 +45,8 @@ SCRIPTS_DEFAULT_CONFIGS = {
         'recvfrom': True,
         'shutdown': True,
         'close': True,
+        'connect': True,
+        'accept': True,
     },
     'openssl': {
         'libs': ["libssl", "openssl", "ssleay", "libeay", "libcrypto"],
@@ -51,12 +55,14 @@ SCRIPTS_DEFAULT_CONFIGS = {
         'SSL_read': True,
         'SSL_read_ex': True,
         'SSL_shutdown': True,
+        'SSL_free': True,
     },
     'gnutls': {
         'libs': ["gnutls"],
         'gnutls_record_send': True,
         'gnutls_record_recv': True,
         'gnutls_bye': True,
+        'gnutls_deinit': True,
     },
     'schannel': {
         'libs': ["Secur32.dll"],
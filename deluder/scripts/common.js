@@ -5,6 +5,7 @@ const MessageType = {
     SEND: 's',
     RECV: 'r',
     CLOSE: 'c',
+    BATCH: 'b',
 };
 
 const MetadataType = {
@@ -17,6 +18,7 @@ const MetadataType = {
     CONNECTION_DESTINATION_IP: 'cdi',
     CONNECTION_DESTINATION_PORT: 'cdp',
     CONNECTION_DESTINATION_PATH: 'cdpa',
+    CONNECTION_HANDLE: 'h',
     MODULE: 'm',
 };
 
@@ -25,15 +27,146 @@ const generateMessageId = () => {
     return (S4()+S4()+'-'+S4()+'-'+S4()+'-'+S4()+'-'+S4()+S4()+S4());
 };
 
-const intercept = (type, message, buffer) => {
+//
+// Connections
+//
+const connectionHandles = new Map();
+let nextConnectionHandle = 1;
+
+/**
+ * Replaces metadata of already known connection by its numeric handle
+ * (full metadata are sent only with the first message of each connection)
+ */
+const compactMetadata = (metadata) => {
+    const connectionId = metadata[MetadataType.CONNECTION_ID];
+    if (connectionId === undefined) {
+        return metadata;
+    }
+
+    const handle = connectionHandles.get(connectionId);
+    if (handle !== undefined) {
+        return {[MetadataType.CONNECTION_HANDLE]: handle};
+    }
+
+    if (connectionHandles.size >= config.connectionHandlesSize) {
+        // Forgotten connection sends full metadata again with a new handle
+        connectionHandles.delete(connectionHandles.keys().next().value);
+    }
+    const newHandle = nextConnectionHandle++;
+    connectionHandles.set(connectionId, newHandle);
+    metadata[MetadataType.CONNECTION_HANDLE] = newHandle;
+    return metadata;
+};
+
+/**
+ * Determines whether the connection has handle assigned (Deluder knows the connection)
+ */
+const hasConnectionHandle = (metadata) => {
+    return connectionHandles.has(metadata[MetadataType.CONNECTION_ID]);
+};
+
+/**
+ * Forgets handle of the connection, so that the next connection with the same identifier sends full metadata again
+ */
+const releaseConnection = (metadata) => {
+    const connectionId = metadata[MetadataType.CONNECTION_ID];
+    if (connectionId !== undefined) {
+        connectionHandles.delete(connectionId);
+    }
+};
+
+//
+// Batching
+//
+const batch = {
+    messages: [],
+    buffers: [],
+    bytes: 0,
+    timer: null,
+};
+
+/**
+ * Sends all messages collected in the batch as a single message (data of all messages are concatenated)
+ */
+const flushBatch = () => {
+    if (batch.timer !== null) {
+        clearTimeout(batch.timer);
+        batch.timer = null;
+    }
+    if (batch.messages.length === 0) {
+        return;
+    }
+
+    let data = null;
+    if (batch.buffers.length > 0) {
+        const bytes = new Uint8Array(batch.bytes);
+        let offset = 0;
+        batch.buffers.forEach(buffer => {
+            bytes.set(new Uint8Array(buffer), offset);
+            offset += buffer.byteLength;
+        });
+        data = bytes.buffer;
+    }
+
+    send({type: MessageType.BATCH, messages: batch.messages}, data);
+
+    batch.messages = [];
+    batch.buffers = [];
+    batch.bytes = 0;
+};
+
+/**
+ * Adds message to the batch, which is sent once it is full or once the flush interval elapses
+ */
+const sendBatched = (message, buffer) => {
+    if (config.batchMaxSize <= 1) {
+        send(message, buffer);
+        return;
+    }
+
+    if (buffer) {
+        message.o = batch.bytes; // Offset of data in the batch data
+        message.l = buffer.byteLength; // Length of data
+        batch.buffers.push(buffer);
+        batch.bytes += buffer.byteLength;
+    }
+    batch.messages.push(message);
+
+    if (batch.messages.length >= config.batchMaxSize || batch.bytes >= config.batchMaxBytes) {
+        flushBatch();
+    } else if (batch.timer === null) {
+        batch.timer = setTimeout(flushBatch, config.batchFlushInterval);
+    }
+};
+
+const intercept = (type, metadata, buffer) => {
+    if (isFiltered(type, metadata, buffer)) {
+        // Filtered traffic never leaves the target
+        return {unchanged: true};
+    }
+
+    const message = compactMetadata(metadata);
     message.id = message.id ? message.id : generateMessageId();
     message.type = type;
 
+    if (config.observeOnly) {
+        // Interceptors cannot modify the data, so there is no need to wait for the response
+        sendBatched(message, buffer);
+        return {unchanged: true};
+    }
+
+    // Batched messages have to be delivered before this one to keep the order
+    flushBatch();
+
     send(message, buffer);
     
     let responseHolder = null;
 
-    recv(message.id, response => {
+    recv(message.id, (response, data) => {
+        // Binary responses carry the payload in Frida's data channel, JSON responses in response.data
+        if (!response.unchanged && response.data === undefined) {
+            response.data = data ? new Uint8Array(data) : new Uint8Array(0);
+        }
         responseHolder = response;
     }).wait();
 
@@ -43,14 +176,24 @@ const intercept = (type, message, buffer) => {
 const interceptSend = (message, buffer) => intercept(MessageType.SEND, message, buffer);
 const interceptRecv = (message, buffer) => intercept(MessageType.RECV, message, buffer);
 
-const process = (type, message) => {
+const process = (type, metadata) => {
+    // Close of connection known to Deluder is never filtered, so that Deluder releases the connection
+    const knownClose = type === MessageType.CLOSE && hasConnectionHandle(metadata);
+    if (!knownClose && isFiltered(type, metadata)) {
+        return;
+    }
+
+    const message = compactMetadata(metadata);
     message.id = message.id ? message.id : generateMessageId();
     message.type = type;
 
-    send(message);
+    sendBatched(message);
 };
 
-const processClose = (message) => process(MessageType.CLOSE, message);
+const processClose = (metadata) => {
+    process(MessageType.CLOSE, metadata);
+    releaseConnection(metadata);
+};
 
 //
 // Logging
@@ -63,6 +206,207 @@ const logWarning = (...message) => log('WARN', ...message);
 const logError = (...message) => log('ERROR', ...message);
 const logDebug = (...message) => config.debug ? log('DEBUG', ...message) : null;
 
+//
+// Filtering
+//
+const FilterAction = {
+    SKIP: 'skip',
+    INTERCEPT: 'intercept',
+};
+
+const FILTER_DIRECTIONS = {
+    send: MessageType.SEND,
+    recv: MessageType.RECV,
+    close: MessageType.CLOSE,
+};
+
+/**
+ * Parses IPv4/IPv6 address to array of bytes (IPv4-mapped IPv6 addresses are parsed as IPv4)
+ * @returns Array of 4 or 16 bytes or null if the address is invalid
+ */
+const parseIp = (ip) => {
+    ip = String(ip).toLowerCase();
+    if (ip.startsWith('::ffff:') && ip.indexOf('.') !== -1) {
+        ip = ip.substring(7);
+    }
+
+    if (ip.indexOf(':') === -1) {
+        const parts = ip.split('.').map(Number);
+        if (parts.length !== 4 || parts.some(part => !Number.isInteger(part) || part < 0 || part > 255)) {
+            return null;
+        }
+        return parts;
+    }
+
+    const halves = ip.split('::');
+    if (halves.length > 2) {
+        return null;
+    }
+    const head = halves[0] ? halves[0].split(':') : [];
+    const tail = halves.length === 2 && halves[1] ? halves[1].split(':') : [];
+    const missing = 8 - head.length - tail.length;
+    if (missing < 0 || (halves.length === 1 && missing !== 0)) {
+        return null;
+    }
+    const groups = head.concat(new Array(missing).fill('0'), tail).map(group => parseInt(group, 16));
+    if (groups.some(group => isNaN(group) || group < 0 || group > 0xffff)) {
+        return null;
+    }
+    return groups.reduce((bytes, group) => bytes.concat([group >> 8, group & 0xff]), []);
+};
+
+/**
+ * Compiles IP address or CIDR range (e.g. 10.0.0.0/8, ::1) to matcher function
+ */
+const compileIpMatcher = (cidr) => {
+    const [ip, prefix] = String(cidr).split('/');
+    const network = parseIp(ip);
+    if (network === null) {
+        throw new Error('Invalid IP address ' + cidr);
+    }
+    const bits = prefix === undefined ? network.length * 8 : Number(prefix);
+    if (!Number.isInteger(bits) || bits < 0 || bits > network.length * 8) {
+        throw new Error('Invalid CIDR prefix ' + cidr);
+    }
+
+    return (address) => {
+        const bytes = parseIp(address);
+        if (bytes === null || bytes.length !== network.length) {
+            return false;
+        }
+        for (let i = 0; i < bits; i += 8) {
+            const mask = bits - i >= 8 ? 0xff : (0xff << (8 - (bits - i))) & 0xff;
+            if ((bytes[i / 8] & mask) !== (network[i / 8] & mask)) {
+                return false;
+            }
+        }
+        return true;
+    };
+};
+
+/**
+ * Compiles port or port range (e.g. 53, "8000-8100") to matcher function
+ */
+const compilePortMatcher = (range) => {
+    const [from, to] = String(range).split('-').map(Number);
+    const max = to === undefined ? from : to;
+    if (!Number.isInteger(from) || !Number.isInteger(max)) {
+        throw new Error('Invalid port range ' + range);
+    }
+    return (port) => port >= from && port <= max;
+};
+
+/**
+ * Compiles Unix socket path (exact path or prefix ending with *) to matcher function
+ */
+const compilePathMatcher = (path) => {
+    path = String(path);
+    if (path.endsWith('*')) {
+        const prefix = path.substring(0, path.length - 1);
+        return (value) => value.startsWith(prefix);
+    }
+    return (value) => value === path;
+};
+
+/**
+ * Creates condition, which matches if any of the values of the connection (source/destination) matches any matcher
+ */
+const createAnyMatcherCondition = (values, compile, keys) => {
+    const matchers = [].concat(values).map(compile);
+    return (metadata) => keys.some(key => {
+        const value = metadata[key];
+        return value !== undefined && value !== null && matchers.some(matcher => matcher(value));
+    });
+};
+
+/**
+ * Compiles filter rule to the list of conditions, which all have to match
+ */
+const compileFilterRule = (rule, index) => {
+    const conditions = [];
+
+    if (rule.modules !== undefined) {
+        const modules = new Set([].concat(rule.modules));
+        conditions.push((type, metadata) => modules.has(metadata[MetadataType.MODULE]));
+    }
+    if (rule.directions !== undefined) {
+        const types = new Set([].concat(rule.directions).map(direction => {
+            if (!(direction in FILTER_DIRECTIONS)) {
+                throw new Error('Invalid direction ' + direction);
+            }
+            return FILTER_DIRECTIONS[direction];
+        }));
+        conditions.push((type) => types.has(type));
+    }
+    if (rule.protocols !== undefined) {
+        const protocols = new Set([].concat(rule.protocols));
+        conditions.push((type, metadata) => protocols.has(metadata[MetadataType.PROTOCOL]));
+    }
+    if (rule.ips !== undefined) {
+        const condition = createAnyMatcherCondition(rule.ips, compileIpMatcher,
+            [MetadataType.CONNECTION_SOURCE_IP, MetadataType.CONNECTION_DESTINATION_IP]);
+        conditions.push((type, metadata) => condition(metadata));
+    }
+    if (rule.ports !== undefined) {
+        const condition = createAnyMatcherCondition(rule.ports, compilePortMatcher,
+            [MetadataType.CONNECTION_SOURCE_PORT, MetadataType.CONNECTION_DESTINATION_PORT]);
+        conditions.push((type, metadata) => condition(metadata));
+    }
+    if (rule.paths !== undefined) {
+        const condition = createAnyMatcherCondition(rule.paths, compilePathMatcher,
+            [MetadataType.CONNECTION_SOURCE_PATH, MetadataType.CONNECTION_DESTINATION_PATH]);
+        conditions.push((type, metadata) => condition(metadata));
+    }
+    if (rule.minSize !== undefined) {
+        conditions.push((type, metadata, buffer) => buffer !== undefined && buffer !== null && buffer.byteLength >= rule.minSize);
+    }
+    if (rule.maxSize !== undefined) {
+        conditions.push((type, metadata, buffer) => buffer !== undefined && buffer !== null && buffer.byteLength <= rule.maxSize);
+    }
+
+    const action = rule.action === undefined ? FilterAction.SKIP : rule.action;
+    if (action !== FilterAction.SKIP && action !== FilterAction.INTERCEPT) {
+        throw new Error('Invalid action ' + action);
+    }
+
+    return {
+        name: rule.name ? String(rule.name) : 'rule-' + (index + 1),
+        skip: action === FilterAction.SKIP,
+        conditions: conditions,
+    };
+};
+
+/**
+ * Compiles all filter rules from config (invalid rules are reported and ignored)
+ */
+const compileFilterRules = (rules) => {
+    const compiled = [];
+    (rules || []).forEach((rule, index) => {
+        try {
+            compiled.push(compileFilterRule(rule, index));
+        } catch (e) {
+            logError('Ignoring invalid filter rule', JSON.stringify(rule) + ':', e.message);
+        }
+    });
+    return compiled;
+};
+
+const filterRules = compileFilterRules(config.filters);
+
+/**
+ * Checks whether the call should be skipped (first matching rule decides, calls matching no rule are intercepted)
+ */
+const isFiltered = (type, metadata, buffer) => {
+    for (let i = 0; i < filterRules.length; i++) {
+        const rule = filterRules[i];
+        if (rule.conditions.every(condition => condition(type, metadata, buffer))) {
+            stats.filterHits[rule.name]++;
+            return rule.skip;
+        }
+    }
+    return false;
+};
+
 //
 // Hooking
 //
@@ -126,6 +470,13 @@ const attachToFunctionInLibrariesMatching = (libsNamesMatcher, func, handlerCrea
 // Buffers
 //
 const responseDataToBuffer = (responseData) => {
+    if (responseData instanceof Uint8Array) {
+        // Binary response data can be used directly, unless it is just a view into a bigger buffer
+        if (responseData.byteOffset === 0 && responseData.byteLength === responseData.buffer.byteLength) {
+            return responseData.buffer;
+        }
+        return responseData.slice().buffer;
+    }
     return new Uint8Array(responseData).buffer;
 }
 
@@ -161,10 +512,104 @@ const createBufferInMemory = (responseData) => {
     return buffer;
 };
 
+//
+// Statistics
+//
+const stats = {
+    socketMetadataCacheHits: 0,
+    socketMetadataCacheMisses: 0,
+    filterHits: filterRules.reduce((hits, rule) => {
+        hits[rule.name] = 0;
+        return hits;
+    }, {}),
+};
+
+rpc.exports = {
+    stats: () => stats,
+    // Batched messages are sent before Deluder detaches and before the script is unloaded
+    flush: () => flushBatch(),
+    dispose: () => flushBatch(),
+};
+
 //
 // Sockets
 //
+const socketMetadataCache = new Map();
+
+/**
+ * Obtains metadata from the cache or resolves them using given resolver and caches them
+ * (the key has to be invalidated once the socket/session is closed)
+ */
+const getCachedMetadata = (key, resolve) => {
+    if (!config.socketMetadataCache) {
+        return resolve();
+    }
+
+    let metadata = socketMetadataCache.get(key);
+    if (metadata !== undefined) {
+        stats.socketMetadataCacheHits++;
+    } else {
+        stats.socketMetadataCacheMisses++;
+        if (socketMetadataCache.size >= config.socketMetadataCacheSize) {
+            // Only the oldest entry is evicted (Map keeps insertion order), so open sessions keep their metadata
+            socketMetadataCache.delete(socketMetadataCache.keys().next().value);
+        }
+        metadata = resolve();
+        socketMetadataCache.set(key, metadata);
+    }
+
+    // Metadata object gets modified when the message is sent
+    return Object.assign({}, metadata);
+};
+
+/**
+ * Removes cached metadata of the closed (or reconnected) socket/session
+ */
+const invalidateCachedMetadata = (key) => {
+    socketMetadataCache.delete(key);
+};
+
+/**
+ * Removes cached metadata of the freed socket/session and returns them (undefined if they are not cached)
+ */
+const takeCachedMetadata = (key) => {
+    const metadata = socketMetadataCache.get(key);
+    socketMetadataCache.delete(key);
+    return metadata !== undefined ? Object.assign({}, metadata) : undefined;
+};
+
+/**
+ * Sends close of the freed socket/session, metadata are taken from the cache or resolved if Deluder still knows the connection
+ * (metadata of open session could have been evicted from the cache)
+ */
+const processFreeClose = (key, resolve) => {
+    let metadata = takeCachedMetadata(key);
+    if (metadata === undefined) {
+        metadata = resolve();
+        if (!hasConnectionHandle(metadata)) {
+            return;
+        }
+    }
+    processClose(metadata);
+};
+
 const getMetadataFromSocket = (socket, module) => {
+    return getCachedMetadata(module + '-' + socket, () => resolveMetadataFromSocket(socket, module));
+};
+
+const invalidateMetadataFromSocket = (socket, module) => {
+    invalidateCachedMetadata(module + '-' + socket);
+};
+
+/**
+ * Warms up the cache for freshly connected/accepted socket
+ */
+const warmMetadataFromSocket = (socket, module) => {
+    invalidateMetadataFromSocket(socket, module);
+    getMetadataFromSocket(socket, module);
+};
+
+const resolveMetadataFromSocket = (socket, module) => {
     const metadata = {
         [MetadataType.SOCKET]: socket,
         [MetadataType.CONNECTION_ID]: module + '-' + socket,
@@ -1,3 +1,15 @@
-const config = {};
+const config = {
+    observeOnly: false,
+    // Close events and observe-only messages are sent in batches
+    batchFlushInterval: 50, // Maximum time in ms before the batch is sent
+    batchMaxSize: 100, // Maximum number of messages in a batch (use 1 to disable batching)
+    batchMaxBytes: 1048576, // Maximum size of data of all messages in a batch
+    // Metadata of sockets are resolved once and cached until the socket is closed
+    socketMetadataCache: true,
+    socketMetadataCacheSize: 4096, // Maximum number of cached sockets
+    connectionHandlesSize: 65536, // Maximum number of connections with assigned handles (the oldest are forgotten)
+    // Rules for traffic, which is not sent to Deluder at all (first matching rule decides, see README)
+    filters: [],
+};
 
 
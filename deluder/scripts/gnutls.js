@@ -20,8 +20,7 @@ const getFd = (lib, ssl) => {
 };
 
 const getMetadata = (lib, session) => {
-    const socket = getFd(lib, session);
-    return getMetadataFromSocket(socket, 'gnutls');
+    return getCachedMetadata('gnutls-' + session, () => resolveMetadataFromSocket(getFd(lib, session), 'gnutls'));
 };
 
 /*
@@ -41,6 +40,10 @@ if (module.config.gnutls_record_send) {
                 const buffer = Memory.readByteArray(bufferPointer, this.originalDataSize);
                 
                 const response = interceptSend(getMetadata(lib, session), buffer);
+                if (response.unchanged) {
+                    // Keep original buffer
+                    return;
+                }
                 
                 this.buffer = createBufferInMemory(response.data);
 
@@ -51,6 +54,11 @@ if (module.config.gnutls_record_send) {
                 args[2] = new NativePointer(response.data.length);
             }, 
             onLeave: function(retval) {
+                if (!this.buffer) {
+                    // Original buffer was kept
+                    return;
+                }
+
                 // Set original size
                 retval.replace(this.originalDataSize);
             }
@@ -82,6 +90,10 @@ if (module.config.gnutls_record_recv) {
                 const receivedData = Memory.readByteArray(this.bufferPointer, receivedDataSize);
                 
                 const response = interceptRecv(getMetadata(lib, this.session), receivedData);
+                if (response.unchanged) {
+                    // Keep original data
+                    return;
+                }
         
                 // Replace received data
                 const byteLength = safeWriteToBuffer(this.bufferPointer, this.bufferSize, response.data);
@@ -104,6 +116,22 @@ if (module.config.gnutls_bye) {
         onEnter: function(args) {
             const session = args[0];
             processClose(getMetadata(lib, session));
+            invalidateCachedMetadata('gnutls-' + session);
+        }, 
+        onLeave: function(retval) {
+        }
+    }));
+}
+
+/*
+void gnutls_deinit(gnutls_session_t session);
+*/
+if (module.config.gnutls_deinit) {
+    attachToFunctionInLibrariesMatching(LIBS, 'gnutls_deinit', (lib) => ({
+        onEnter: function(args) {
+            // Session freed without bye would leave stale metadata for the next session at the same address
+            const session = args[0];
+            processFreeClose('gnutls-' + session, () => getMetadataFromCode(getFd(lib, session), 'gnutls'));
         }, 
         onLeave: function(retval) {
         }
@@ -33,6 +33,10 @@ const createSendHandler = (func) => ({
 
         // Intercept data
         const response = interceptSend(getMetadataFromSocket(socket, 'libc'), buffer);
+        if (response.unchanged) {
+            // Keep original buffer
+            return;
+        }
         
         // Create buffer for intercepted data in memory
         this.buffer = createBufferInMemory(response.data);
@@ -44,6 +48,11 @@ const createSendHandler = (func) => ({
         args[2] = new NativePointer(response.data.length);
     }, 
     onLeave: function(retval) {
+        if (!this.buffer) {
+            // Original buffer was kept
+            return;
+        }
+
         // Set original size
         retval.replace(this.originalDataSize);
     }
@@ -96,6 +105,10 @@ const createRecvHandler = (func) => ({
         const receivedData = Memory.readByteArray(this.bufferPointer, receivedDataSize);
         
         const response = interceptRecv(getMetadataFromSocket(this.socket, 'libc'), receivedData);
+        if (response.unchanged) {
+            // Keep original data
+            return;
+        }
 
         // Replace received data
         const byteLength = safeWriteToBuffer(this.bufferPointer, this.bufferSize, response.data);
@@ -127,6 +140,7 @@ const createCloseHandler = (func) => ({
   onEnter: function(args) {
       const socket = args[0].toInt32();
       processClose(getMetadataFromSocket(socket, 'libc'));
+      invalidateMetadataFromSocket(socket, 'libc');
   }, 
   onLeave: function(retval) {
   }
@@ -139,3 +153,58 @@ if (module.config.shutdown) {
 if (module.config.close) {
   attachToFunctionInLibrariesMatching(LIBS, 'close', () => createCloseHandler('close'));
 }
+
+/*
+int connect(
+  int socket,
+  const struct sockaddr *addr,
+  socklen_t addrlen
+);
+*/
+const createConnectHandler = (func) => ({
+  onEnter: function(args) {
+      this.socket = args[0].toInt32();
+  }, 
+  onLeave: function(retval) {
+      if (retval.toInt32() == 0) {
+          warmMetadataFromSocket(this.socket, 'libc');
+      } else {
+          // Non-blocking connect is still in progress
+          invalidateMetadataFromSocket(this.socket, 'libc');
+      }
+  }
+});
+
+if (module.config.connect) {
+  attachToFunctionInLibrariesMatching(LIBS, 'connect', () => createConnectHandler('connect'));
+}
+
+/*
+int accept(
+  int socket,
+  struct sockaddr *_Nullable restrict addr,
+  socklen_t *_Nullable restrict addrlen
+);
+
+int accept4(
+  int socket,
+  struct sockaddr *_Nullable restrict addr,
+  socklen_t *_Nullable restrict addrlen,
+  int flags
+);
+*/
+const createAcceptHandler = (func) => ({
+  onEnter: function(args) {
+  }, 
+  onLeave: function(retval) {
+      const socket = retval.toInt32();
+      if (socket >= 0) {
+          warmMetadataFromSocket(socket, 'libc');
+      }
+  }
+});
+
+if (module.config.accept) {
+  attachToFunctionInLibrariesMatching(LIBS, 'accept', () => createAcceptHandler('accept'));
+  attachToFunctionInLibrariesMatching(LIBS, 'accept4', () => createAcceptHandler('accept4'));
+}
@@ -20,8 +20,7 @@ const getFd = (lib, ssl) => {
 };
 
 const getMetadata = (lib, ssl) => {
-    const socket = getFd(lib, ssl);
-    return getMetadataFromSocket(socket, 'openssl');
+    return getCachedMetadata('openssl-' + ssl, () => resolveMetadataFromSocket(getFd(lib, ssl), 'openssl'));
 };
 
 /*
@@ -37,6 +36,10 @@ if (module.config.SSL_write) {
                 const buffer = Memory.readByteArray(bufferPointer, this.originalDataSize);
                 
                 const response = interceptSend(getMetadata(lib, ssl), buffer);
+                if (response.unchanged) {
+                    // Keep original buffer
+                    return;
+                }
                 
                 this.buffer = createBufferInMemory(response.data);
 
@@ -47,6 +50,11 @@ if (module.config.SSL_write) {
                 args[2] = new NativePointer(response.data.length);
             }, 
             onLeave: function(retval) {
+                if (!this.buffer) {
+                    // Original buffer was kept
+                    return;
+                }
+
                 // Set original size
                 retval.replace(this.originalDataSize);
             }
@@ -67,6 +75,10 @@ if (module.config.SSL_write_ex) {
             const buffer = Memory.readByteArray(bufferPointer, this.originalDataSize);
 
             const response = interceptSend(getMetadata(lib, ssl), buffer);
+            if (response.unchanged) {
+                // Keep original buffer
+                return;
+            }
             
             this.buffer = createBufferInMemory(response.data);
 
@@ -77,6 +89,11 @@ if (module.config.SSL_write_ex) {
             args[2] = new NativePointer(response.data.length);
         }, 
         onLeave: function(retval) {
+            if (!this.buffer) {
+                // Original buffer was kept
+                return;
+            }
+
             this.writtenPointer.writeInt(this.originalDataSize);
         }
     }));
@@ -100,6 +117,10 @@ if (module.config.SSL_read) {
             const receivedData = Memory.readByteArray(this.bufferPointer, receivedDataSize);
             
             const response = interceptRecv(getMetadata(lib, this.ssl), receivedData);
+            if (response.unchanged) {
+                // Keep original data
+                return;
+            }
 
             // Replace received data
             const byteLength = safeWriteToBuffer(this.bufferPointer, this.bufferSize, response.data);
@@ -129,6 +150,10 @@ if (module.config.SSL_read_ex) {
             const receivedData = Memory.readByteArray(this.bufferPointer, this.readPointer.readInt());
             
             const response = interceptRecv(getMetadata(lib, this.ssl), receivedData);
+            if (response.unchanged) {
+                // Keep original data
+                return;
+            }
 
             // Replace received data
             const byteLength = safeWriteToBuffer(this.bufferPointer, this.bufferSize, response.data);
@@ -147,6 +172,22 @@ if (module.config.SSL_shutdown) {
         onEnter: function(args) {
             const ssl = args[0];
             processClose(getMetadata(lib, ssl));
+            invalidateCachedMetadata('openssl-' + ssl);
+        }, 
+        onLeave: function(retval) {
+        }
+    }));
+}
+
+/*
+void SSL_free(SSL *ssl);
+*/
+if (module.config.SSL_free) {
+    attachToFunctionInLibrariesMatching(LIBS, 'SSL_free', (lib) => ({
+        onEnter: function(args) {
+            // Session freed without shutdown would leave stale metadata for the next session at the same address
+            const ssl = args[0];
+            processFreeClose('openssl-' + ssl, () => getMetadataFromCode(getFd(lib, ssl), 'openssl'));
         }, 
         onLeave: function(retval) {
         }
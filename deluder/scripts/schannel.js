@@ -37,11 +37,13 @@ const interceptDataBuffer = (context, secBufferDescPointer, intercept) => {
 
             const response = intercept(getMetadataFromCode(context, 'schannel'), data);
 
-            // Write to the buffer
-            const newLength = safeWriteToBuffer(bufferPointer, bufferSize, response.data);
-    
-            // Write new size (might not work for some apps)
-            buffer.writeULong(newLength);
+            // Write to the buffer (unless the original data were kept)
+            if (!response.unchanged) {
+                const newLength = safeWriteToBuffer(bufferPointer, bufferSize, response.data);
+        
+                // Write new size (might not work for some apps)
+                buffer.writeULong(newLength);
+            }
         }
 
         // Move to next buffer
@@ -29,6 +29,10 @@ const createSendHandler = (func) => ({
 
         // Intercept data
         const response = interceptSend(getMetadataFromSocket(socket, 'wsock'), buffer);
+        if (response.unchanged) {
+            // Keep original buffer
+            return;
+        }
         
         // Create buffer for intercepted data in memory
         this.buffer = createBufferInMemory(response.data);
@@ -40,6 +44,11 @@ const createSendHandler = (func) => ({
         args[2] = new NativePointer(response.data.length);
     }, 
     onLeave: function(retval) {
+        if (!this.buffer) {
+            // Original buffer was kept
+            return;
+        }
+
         // Set original size
         retval.replace(this.originalDataSize);
     }
@@ -85,6 +94,10 @@ const createRecvHandler = (func) => ({
         const receivedData = Memory.readByteArray(this.bufferPointer, receivedDataSize);
         
         const response = interceptRecv(getMetadataFromSocket(this.socket, 'wsock'), receivedData);
+        if (response.unchanged) {
+            // Keep original data
+            return;
+        }
 
         // Replace received data
         const byteLength = safeWriteToBuffer(this.bufferPointer, this.bufferSize, response.data);
@@ -164,6 +177,10 @@ const createWSASendHandler = (func) => ({
   
           // Intercept the data
           const response = interceptSend(getMetadataFromSocket(socket, 'wsock'), data);
+          if (response.unchanged) {
+              // Keep original buffer
+              return;
+          }
           
           // Create buffer for intercepted data in memory (and store it, so it is not cleared before the function finishes)
           const newBuffer = createBufferInMemory(response.data);
@@ -279,6 +296,10 @@ const createWSARecvHandler = (func) => ({
       
       // Intercept the data
       const response = interceptRecv(getMetadataFromSocket(this.socket, 'wsock'), totalBuffer.buffer);
+      if (response.unchanged) {
+          // Keep original data in the buffers
+          return;
+      }
 
       // Notify user about shortening of the data
       if (response.data.length > totalCapacity) {
@@ -339,6 +360,7 @@ const createCloseHandler = (func) => ({
   onEnter: function(args) {
       const socket = args[0].toInt32();
       processClose(getMetadataFromSocket(socket, 'wsock'));
+      invalidateMetadataFromSocket(socket, 'wsock');
   }, 
   onLeave: function(retval) {
   }
@@ -351,3 +373,50 @@ if (module.config.closesocket) {
 if (module.config.shutdown) {
   attachToFunctionInLibraries(LIBS, 'shutdown', () => createCloseHandler('shutdown'));
 }
+
+/*
+int WSAAPI connect(
+  [in] SOCKET         s,
+  [in] const sockaddr *name,
+  [in] int            namelen
+);
+*/
+const createConnectHandler = (func) => ({
+  onEnter: function(args) {
+      this.socket = args[0].toInt32();
+  }, 
+  onLeave: function(retval) {
+      if (retval.toInt32() == 0) {
+          warmMetadataFromSocket(this.socket, 'wsock');
+      } else {
+          // Non-blocking connect is still in progress
+          invalidateMetadataFromSocket(this.socket, 'wsock');
+      }
+  }
+});
+
+if (module.config.connect) {
+  attachToFunctionInLibraries(LIBS, 'connect', () => createConnectHandler('connect'));
+}
+
+/*
+SOCKET WSAAPI accept(
+  [in]      SOCKET   s,
+  [out]     sockaddr *addr,
+  [in, out] int      *addrlen
+);
+*/
+const createAcceptHandler = (func) => ({
+  onEnter: function(args) {
+  }, 
+  onLeave: function(retval) {
+      const socket = retval.toInt32();
+      if (socket != -1) {
+          warmMetadataFromSocket(socket, 'wsock');
+      }
+  }
+});
+
+if (module.config.accept) {
+  attachToFunctionInLibraries(LIBS, 'accept', () => createAcceptHandler('accept'));
+}
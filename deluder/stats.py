@@ -0,0 +1,277 @@
+import threading
+import time
+
+from typing import Callable, Tuple
+
+from deluder.common import *
+from deluder.log import logger
+
+
+HISTOGRAM_SUB_BUCKETS_BITS = 3
+HISTOGRAM_SUB_BUCKETS = 1 << HISTOGRAM_SUB_BUCKETS_BITS
+
+DIRECTIONS = {
+    MessageType.SEND: 'send',
+    MessageType.RECV: 'recv',
+    MessageType.CLOSE: 'close',
+}
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in nanoseconds (relative error of percentiles is below 1/8)
+    """
+    buckets: Dict[int, int]
+    count: int
+    total: int
+    max: int
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        """
+        Records latency value in nanoseconds
+        """
+        index = self._get_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        """
+        Adds all values of other histogram to this histogram
+        """
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> int:
+        """
+        Obtains approximate value of given percentile (0-100) in nanoseconds
+        """
+        if self.count == 0:
+            return 0
+        rank = percentile / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self._get_value(index), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Obtains summary of the histogram with latencies in milliseconds
+        """
+        return {
+            'count': self.count,
+            'mean': self.total / self.count / 1e6 if self.count else 0.0,
+            'p50': self.percentile(50) / 1e6,
+            'p95': self.percentile(95) / 1e6,
+            'p99': self.percentile(99) / 1e6,
+            'max': self.max / 1e6,
+        }
+
+    @staticmethod
+    def _get_index(value: int) -> int:
+        if value < 2 * HISTOGRAM_SUB_BUCKETS:
+            return value
+        exponent = value.bit_length() - HISTOGRAM_SUB_BUCKETS_BITS - 1
+        return exponent * HISTOGRAM_SUB_BUCKETS + (value >> exponent)
+
+    @staticmethod
+    def _get_value(index: int) -> int:
+        # Middle of the bucket
+        if index < 2 * HISTOGRAM_SUB_BUCKETS:
+            return index
+        exponent = index // HISTOGRAM_SUB_BUCKETS - 1
+        mantissa = index - exponent * HISTOGRAM_SUB_BUCKETS
+        return (mantissa << exponent) + (1 << exponent) // 2
+
+
+class RouterStats:
+    """
+    Performance counters of the router: messages and bytes per direction and process,
+    latency histograms of the whole routing and of each interceptor per direction and process
+    """
+    started: float
+    messages: Dict[Tuple[int, str], int]
+    bytes: Dict[Tuple[int, str], int]
+    route: Dict[Tuple[int, str], LatencyHistogram]
+    interceptors: Dict[Tuple[str, int, str], LatencyHistogram]
+    lock: threading.Lock
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.messages = {}
+        self.bytes = {}
+        self.route = {}
+        self.interceptors = {}
+        self.lock = threading.Lock()
+
+    def record_message(self, pid: int, message: Message):
+        """
+        Counts routed message and its data
+        """
+        key = (pid, DIRECTIONS.get(message.type, message.type))
+        with self.lock:
+            self.messages[key] = self.messages.get(key, 0) + 1
+            if isinstance(message, DataMessage) and message.data is not None:
+                self.bytes[key] = self.bytes.get(key, 0) + len(message.data)
+
+    def record_route(self, pid: int, message: Message, duration: int):
+        """
+        Records time in nanoseconds spent by routing the message through all interceptors
+        """
+        key = (pid, DIRECTIONS.get(message.type, message.type))
+        with self.lock:
+            histogram = self.route.get(key)
+            if histogram is None:
+                histogram = self.route[key] = LatencyHistogram()
+            histogram.record(duration)
+
+    def record_interceptor(self, name: str, pid: int, message: Message, duration: int):
+        """
+        Records time in nanoseconds spent in intercept of given interceptor
+        """
+        key = (name, pid, DIRECTIONS.get(message.type, message.type))
+        with self.lock:
+            histogram = self.interceptors.get(key)
+            if histogram is None:
+                histogram = self.interceptors[key] = LatencyHistogram()
+            histogram.record(duration)
+
+    def snapshot(self) -> dict:
+        """
+        Creates snapshot of all counters (latencies are in milliseconds)
+        """
+        with self.lock:
+            snapshot = {
+                'uptime': time.monotonic() - self.started,
+                'messages': self._sum_by_direction(self.messages),
+                'bytes': self._sum_by_direction(self.bytes),
+                'route': self._summarize(self.route),
+                'interceptors': {},
+                'processes': {},
+            }
+
+            for (name, pid, direction), histogram in self.interceptors.items():
+                self._merge_into(snapshot['interceptors'].setdefault(name, {}), direction, histogram)
+                process = self._get_process_snapshot(snapshot, pid)
+                self._merge_into(process['interceptors'].setdefault(name, {}), direction, histogram)
+
+            for (pid, direction), count in self.messages.items():
+                self._get_process_snapshot(snapshot, pid)['messages'][direction] = count
+            for (pid, direction), count in self.bytes.items():
+                self._get_process_snapshot(snapshot, pid)['bytes'][direction] = count
+            for (pid, direction), histogram in self.route.items():
+                self._merge_into(self._get_process_snapshot(snapshot, pid)['route'], direction, histogram)
+
+        self._finalize(snapshot)
+        return snapshot
+
+    @staticmethod
+    def _sum_by_direction(counters: Dict[Tuple[int, str], int]) -> Dict[str, int]:
+        result = {}
+        for (_, direction), count in counters.items():
+            result[direction] = result.get(direction, 0) + count
+        return result
+
+    @staticmethod
+    def _summarize(histograms: Dict[Tuple[int, str], LatencyHistogram]) -> Dict[str, LatencyHistogram]:
+        result = {}
+        for (_, direction), histogram in histograms.items():
+            RouterStats._merge_into(result, direction, histogram)
+        return result
+
+    @staticmethod
+    def _merge_into(target: Dict[str, LatencyHistogram], direction: str, histogram: LatencyHistogram):
+        merged = target.get(direction)
+        if merged is None:
+            merged = target[direction] = LatencyHistogram()
+        merged.merge(histogram)
+
+    @staticmethod
+    def _get_process_snapshot(snapshot: dict, pid: int) -> dict:
+        return snapshot['processes'].setdefault(pid, {
+            'messages': {},
+            'bytes': {},
+            'route': {},
+            'interceptors': {},
+        })
+
+    @staticmethod
+    def _finalize(value):
+        # Replaces histograms with their summaries
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, LatencyHistogram):
+                    value[key] = item.summary()
+                else:
+                    RouterStats._finalize(item)
+
+
+class StatsReporter:
+    """
+    Periodically logs summary line of Deluder statistics
+    """
+    def __init__(self, interval: float, snapshot: Callable[[], dict]):
+        self.interval = interval
+        self.snapshot = snapshot
+        self.stopped = threading.Event()
+        self.thread = None
+        self._previous = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='DeluderStats', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                logger.info('Stats: %s', self.format(self.snapshot()))
+            except Exception as e:
+                logger.error('Failed to report stats!', exc_info=e)
+
+    def format(self, snapshot: dict) -> str:
+        """
+        Formats snapshot to a single line summary (rates are computed from the previous snapshot)
+        """
+        previous = self._previous or {'uptime': 0.0, 'messages': {}, 'bytes': {}}
+        self._previous = snapshot
+        elapsed = max(snapshot['uptime'] - previous['uptime'], 1e-9)
+
+        def rate(counters: str, direction: str) -> float:
+            return (snapshot[counters].get(direction, 0) - previous[counters].get(direction, 0)) / elapsed
+
+        def latency(summary: dict) -> str:
+            return f'p50={summary["p50"]:.3f}ms p95={summary["p95"]:.3f}ms p99={summary["p99"]:.3f}ms'
+
+        parts = [
+            'msg/s send={:.1f} recv={:.1f} close={:.1f}'.format(rate('messages', 'send'), rate('messages', 'recv'), rate('messages', 'close')),
+            'B/s send={:.0f} recv={:.0f}'.format(rate('bytes', 'send'), rate('bytes', 'recv')),
+        ]
+        for direction, summary in snapshot['route'].items():
+            parts.append(f'route[{direction}] {latency(summary)}')
+        for name, directions in snapshot['interceptors'].items():
+            for direction, summary in directions.items():
+                parts.append(f'{name}[{direction}] {latency(summary)}')
+        if 'dispatcher' in snapshot:
+            dispatcher = snapshot['dispatcher']
+            parts.append(f'queue depth={sum(dispatcher["depths"])} dropped={dispatcher["dropped"]} wait {latency(dispatcher["wait"])}')
+        return ' | '.join(parts)
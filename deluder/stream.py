@@ -0,0 +1,424 @@
+import threading
+
+from collections import deque
+from typing import Callable, Deque, Tuple
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.log import logger
+
+
+DEFAULT_MAX_BUFFER_SIZE = 16 * 1024 * 1024
+"""
+Default maximum number of bytes buffered in a single direction of a connection
+"""
+
+COMPACT_THRESHOLD = 64 * 1024
+"""
+Number of consumed bytes, after which the buffer is compacted (if they are at least half of the buffer)
+"""
+
+
+class StreamError(DeluderException):
+    """
+    Error of stream reassembly (invalid framing or exceeded buffer size)
+    """
+
+
+class StreamBuffer:
+    """
+    Bounded buffer of a single direction of a connection, data are appended at the end and consumed from the start
+    (consumed space is reclaimed lazily, so consuming small messages does not move the rest of the data).
+    Buffer is contiguous instead of ring, so that framers can search it by C bytes search without handling wrapped data.
+    """
+    def __init__(self, max_size: int=DEFAULT_MAX_BUFFER_SIZE):
+        self.data = bytearray()
+        self.start = 0
+        self.max_size = max_size
+
+    def __len__(self) -> int:
+        return len(self.data) - self.start
+
+    def append(self, data: bytes):
+        if len(self) + len(data) > self.max_size:
+            raise StreamError(f'Stream buffer exceeded {self.max_size} bytes!')
+        self.data += data
+
+    def find(self, sub: bytes, start: int=0) -> int:
+        """
+        Finds position of given bytes relative to the start of the buffered data (-1 if not found)
+        """
+        position = self.data.find(sub, self.start + start)
+        return position - self.start if position >= 0 else -1
+
+    def peek(self, length: int, offset: int=0) -> bytes:
+        start = self.start + offset
+        return bytes(self.data[start:start + length])
+
+    def consume(self, length: int) -> bytes:
+        """
+        Removes given number of bytes from the start of the buffer and returns them
+        """
+        result = bytes(self.data[self.start:self.start + length])
+        self.start += length
+        if self.start == len(self.data):
+            self.clear()
+        elif self.start >= COMPACT_THRESHOLD and self.start * 2 >= len(self.data):
+            del self.data[:self.start]
+            self.start = 0
+        return result
+
+    def clear(self):
+        self.data = bytearray()
+        self.start = 0
+
+
+class StreamFramer:
+    """
+    Base class for framing detectors, which find boundaries of application messages in the stream
+    (framer is used for a single direction of a connection, so it can keep progress of the current message)
+    """
+    def frame(self, buffer: StreamBuffer) -> Optional[int]:
+        """
+        Obtains length of the complete message at the start of the buffer (None if the message is not complete yet)
+        """
+        raise Exception('Not implemented!')
+
+    def finish(self, buffer: StreamBuffer) -> Optional[int]:
+        """
+        Obtains length of the message, which is completed by closing of the connection
+        """
+        return None
+
+    def reset(self):
+        """
+        Resets progress after the message was consumed
+        """
+        pass
+
+    def link(self, peer: 'StreamFramer'):
+        """
+        Links framer with framer of the opposite direction of the same connection
+        """
+        pass
+
+
+class LengthPrefixFramer(StreamFramer):
+    """
+    Messages starting with header containing unsigned length of the rest of the message
+    """
+    def __init__(self, length_size: int=4, length_offset: int=0, byte_order: str='big', length_adjustment: int=0):
+        if length_size not in (1, 2, 4, 8):
+            raise StreamError(f'Unsupported length size {length_size}!')
+        self.length_size = length_size
+        self.length_offset = length_offset
+        self.byte_order = byte_order
+        self.length_adjustment = length_adjustment
+        self.header_size = length_offset + length_size
+
+    def frame(self, buffer: StreamBuffer) -> Optional[int]:
+        if len(buffer) < self.header_size:
+            return None
+        length = int.from_bytes(buffer.peek(self.length_size, self.length_offset), self.byte_order)
+        total = self.header_size + length + self.length_adjustment
+        if total < self.header_size:
+            raise StreamError(f'Invalid message length {length}!')
+        return total if len(buffer) >= total else None
+
+
+class DelimiterFramer(StreamFramer):
+    """
+    Messages terminated by delimiter (the delimiter is part of the message)
+    """
+    def __init__(self, delimiter: bytes=b'\r\n'):
+        if not delimiter:
+            raise StreamError('Delimiter cannot be empty!')
+        self.delimiter = delimiter
+        self.scanned = 0
+
+    def frame(self, buffer: StreamBuffer) -> Optional[int]:
+        position = buffer.find(self.delimiter, self.scanned)
+        if position < 0:
+            # Delimiter can be split between appended chunks
+            self.scanned = max(len(buffer) - len(self.delimiter) + 1, 0)
+            return None
+        return position + len(self.delimiter)
+
+    def reset(self):
+        self.scanned = 0
+
+
+class HttpFramer(StreamFramer):
+    """
+    HTTP/1.x requests and responses with body delimited by Content-Length, chunked encoding or closing of the connection
+    (methods of requests are shared with the framer of the opposite direction, so that responses to HEAD have no body)
+    """
+    methods: Deque[str]
+
+    def __init__(self):
+        self.methods = deque()
+        self.reset()
+
+    def link(self, peer: StreamFramer):
+        if isinstance(peer, HttpFramer):
+            self.methods = peer.methods
+
+    def reset(self):
+        self.scanned = 0
+        self.header_length = None
+        self.body_length = None
+        self.chunk_offset = None
+        self.until_close = False
+
+    def frame(self, buffer: StreamBuffer) -> Optional[int]:
+        if self.header_length is None and not self._parse_header(buffer):
+            return None
+        if self.body_length is not None:
+            total = self.header_length + self.body_length
+            return total if len(buffer) >= total else None
+        if self.chunk_offset is not None:
+            return self._frame_chunks(buffer)
+        return None
+
+    def finish(self, buffer: StreamBuffer) -> Optional[int]:
+        return len(buffer) if self.until_close else None
+
+    def _parse_header(self, buffer: StreamBuffer) -> bool:
+        end = buffer.find(b'\r\n\r\n', self.scanned)
+        if end < 0:
+            self.scanned = max(len(buffer) - 3, 0)
+            return False
+        self.header_length = end + 4
+
+        lines = buffer.peek(end).decode('latin-1').split('\r\n')
+        start_line = lines[0]
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(':')
+            if not separator:
+                raise StreamError(f'Invalid HTTP header line {line!r}!')
+            headers[name.strip().lower()] = value.strip()
+
+        status = None
+        method = None
+        if start_line.startswith('HTTP/'):
+            parts = start_line.split(' ', 2)
+            if len(parts) < 2 or not parts[1].isdigit():
+                raise StreamError(f'Invalid HTTP status line {start_line!r}!')
+            status = int(parts[1])
+            # Informational responses are followed by the final response to the same request
+            if status >= 200 and self.methods:
+                method = self.methods.popleft()
+        else:
+            self.methods.append(start_line.split(' ', 1)[0])
+
+        if status is not None and (status < 200 or status in (204, 304) or method == 'HEAD'):
+            self.body_length = 0
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self.chunk_offset = self.header_length
+        elif 'content-length' in headers:
+            try:
+                self.body_length = int(headers['content-length'])
+            except ValueError:
+                raise StreamError(f'Invalid HTTP Content-Length {headers["content-length"]!r}!')
+        elif status is not None:
+            # Response without length ends with the connection
+            self.until_close = True
+        else:
+            self.body_length = 0
+        return True
+
+    def _frame_chunks(self, buffer: StreamBuffer) -> Optional[int]:
+        while True:
+            line_end = buffer.find(b'\r\n', self.chunk_offset)
+            if line_end < 0:
+                return None
+            size_field = buffer.peek(line_end - self.chunk_offset, self.chunk_offset).split(b';')[0]
+            try:
+                size = int(size_field, 16)
+            except ValueError:
+                raise StreamError(f'Invalid HTTP chunk size {size_field!r}!')
+            if size == 0:
+                # Last chunk is followed by optional trailers and an empty line
+                if buffer.peek(2, line_end + 2) == b'\r\n':
+                    return line_end + 4
+                end = buffer.find(b'\r\n\r\n', line_end)
+                return end + 4 if end >= 0 else None
+            next_offset = line_end + 2 + size + 2
+            if len(buffer) < next_offset:
+                return None
+            self.chunk_offset = next_offset
+
+
+FRAMERS = {
+    'length': lambda config: LengthPrefixFramer(
+        config.get('lengthSize', 4),
+        config.get('lengthOffset', 0),
+        config.get('byteOrder', 'big'),
+        config.get('lengthAdjustment', 0),
+    ),
+    'delimiter': lambda config: DelimiterFramer(
+        bytes.fromhex(config['delimiterHex']) if 'delimiterHex' in config else config.get('delimiter', '\r\n').encode()
+    ),
+    'http': lambda config: HttpFramer(),
+}
+"""
+Factories of framers by their type used in config
+"""
+
+
+def create_framer_factory(config: Dict[str, any]) -> Callable[[], StreamFramer]:
+    """
+    Creates factory of framers configured by given config (e.g. `{"type": "length", "lengthSize": 2}`)
+    """
+    type = config.get('type')
+    if type not in FRAMERS:
+        raise StreamError(f'Unknown framing {type}!')
+    FRAMERS[type](config) # Validates the config
+    return lambda: FRAMERS[type](config)
+
+
+@dataclass
+class Stream:
+    """
+    Single direction of a connection
+    """
+    buffer: StreamBuffer
+    framer: StreamFramer
+
+
+class StreamReassembler:
+    """
+    Reassembles data of connections to application messages using framer (each direction of each connection has its own
+    bounded buffer), callback is called with every complete message and buffers are released on close of the connection.
+    Messages of a single connection have to be fed in order (which the router guarantees).
+    """
+    streams: Dict[Tuple[int, Optional[str], MessageType], Stream]
+
+    def __init__(
+            self,
+            framer_factory: Callable[[], StreamFramer],
+            on_message: Callable[[Process, Message, bytes], None],
+            max_buffer_size: int=DEFAULT_MAX_BUFFER_SIZE
+    ):
+        self.framer_factory = framer_factory
+        self.on_message = on_message
+        self.max_buffer_size = max_buffer_size
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.errors = 0
+
+    def feed(self, process: Process, message: Message):
+        """
+        Appends data of the message to its stream and emits all completed application messages
+        """
+        if isinstance(message, CloseMessage):
+            self.release(process, message)
+            return
+        if not isinstance(message, DataMessage) or not message.data:
+            return
+
+        connection_id = message.metadata.get(MetadataType.CONNECTION_ID)
+        key = (process.pid, connection_id, message.type)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = Stream(StreamBuffer(self.max_buffer_size), self.framer_factory())
+            peer_type = MessageType.RECV if message.type == MessageType.SEND else MessageType.SEND
+            with self.lock:
+                peer = self.streams.get((process.pid, connection_id, peer_type))
+                self.streams[key] = stream
+            if peer is not None:
+                stream.framer.link(peer.framer)
+
+        try:
+            stream.buffer.append(message.data)
+            while stream.buffer:
+                length = stream.framer.frame(stream.buffer)
+                if length is None:
+                    break
+                self._emit(process, message, stream, length)
+        except StreamError as e:
+            self._on_error(key, stream, e)
+
+    def release(self, process: Process, message: Message):
+        """
+        Emits messages completed by closing of the connection and releases its buffers
+        """
+        connection_id = message.metadata.get(MetadataType.CONNECTION_ID)
+        for type in (MessageType.SEND, MessageType.RECV):
+            key = (process.pid, connection_id, type)
+            with self.lock:
+                stream = self.streams.pop(key, None)
+            if stream is None:
+                continue
+            try:
+                length = stream.framer.finish(stream.buffer)
+                if length:
+                    self._emit(process, message, stream, length)
+            except StreamError as e:
+                self._on_error(key, stream, e)
+            stream.buffer.clear()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            streams = list(self.streams.values())
+            messages, errors = self.messages, self.errors
+        return {
+            'streams': len(streams),
+            'bufferedBytes': sum(len(stream.buffer) for stream in streams),
+            'messages': messages,
+            'errors': errors,
+        }
+
+    def _emit(self, process: Process, message: Message, stream: Stream, length: int):
+        data = stream.buffer.consume(length)
+        stream.framer.reset()
+        with self.lock:
+            self.messages += 1
+        self.on_message(process, message, data)
+
+    def _on_error(self, key: tuple, stream: Stream, error: StreamError):
+        # Rest of the stream cannot be framed reliably, so it is dropped
+        with self.lock:
+            self.errors += 1
+        logger.warning('Stream %s of connection %s [pid=%d] dropped: %s', key[2].name, key[1], key[0], error.message)
+        stream.buffer.clear()
+        stream.framer.reset()
+
+
+class StreamMessageInterceptor(MessageInterceptor):
+    """
+    Base class for read-only interceptors, which process reassembled application messages instead of data chunks
+    of single send/recv calls (see `intercept_stream`)
+    """
+    reassembler: StreamReassembler
+
+    @classmethod
+    def default_config(cls) -> dict:
+        return {
+            'framing': {'type': 'delimiter', 'delimiter': '\r\n'},
+            'maxBufferSize': DEFAULT_MAX_BUFFER_SIZE,
+        }
+
+    def is_read_only(self) -> bool:
+        return True
+
+    def init(self):
+        self.reassembler = StreamReassembler(
+            create_framer_factory(self.config['framing']),
+            self.intercept_stream,
+            self.config['maxBufferSize']
+        )
+
+    def intercept(self, process: Process, message: Message):
+        self.reassembler.feed(process, message)
+
+    def intercept_stream(self, process: Process, message: Message, data: bytes):
+        """
+        Intercepts complete application message (message is the last message, which completed it)
+        """
+        pass
+
+    def stats(self) -> dict:
+        return self.reassembler.snapshot()
@@ -0,0 +1,108 @@
+import os
+import socket
+import stat
+
+from deluder.common import *
+
+
+UNIX_ENDPOINT_PREFIX = 'unix:'
+ABSTRACT_NAMESPACE_PREFIX = '@'
+
+
+@dataclass
+class Endpoint:
+    """
+    Endpoint of local IPC, either TCP host and port or Unix domain socket path
+    (paths starting with @ are in the abstract namespace on Linux)
+    """
+    host: Optional[str] = None
+    port: Optional[int] = None
+    path: Optional[str] = None
+
+    def is_unix(self) -> bool:
+        return self.path is not None
+
+    def is_abstract(self) -> bool:
+        return self.is_unix() and self.path.startswith(ABSTRACT_NAMESPACE_PREFIX)
+
+    def get_address(self):
+        """
+        Obtains address of the endpoint for socket functions
+        """
+        if self.is_abstract():
+            return '\0' + self.path[len(ABSTRACT_NAMESPACE_PREFIX):]
+        if self.is_unix():
+            return self.path
+        return (self.host, self.port)
+
+    def connect(self, timeout: Optional[float]=None) -> socket.socket:
+        """
+        Connects to the endpoint (timeout applies only to connecting)
+        """
+        if not self.is_unix():
+            sock = socket.create_connection(self.get_address(), timeout=timeout)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+
+        sock = socket.socket(self._get_unix_family(), socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(self.get_address())
+            sock.settimeout(None)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def listen(self, backlog: int) -> socket.socket:
+        """
+        Creates server socket listening on the endpoint (stale socket file is replaced)
+        """
+        if not self.is_unix():
+            return socket.create_server(self.get_address(), backlog=backlog)
+
+        self.remove_socket_file()
+        sock = socket.socket(self._get_unix_family(), socket.SOCK_STREAM)
+        try:
+            sock.bind(self.get_address())
+            sock.listen(backlog)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def remove_socket_file(self):
+        """
+        Removes socket file of the Unix domain socket endpoint (if it exists)
+        """
+        if not self.is_unix() or self.is_abstract():
+            return
+        try:
+            if stat.S_ISSOCK(os.stat(self.path).st_mode):
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _get_unix_family(self) -> int:
+        family = getattr(socket, 'AF_UNIX', None)
+        if family is None:
+            raise DeluderException(f'Unix domain sockets are not supported on this platform ({self})!')
+        return family
+
+    def __str__(self) -> str:
+        if self.is_unix():
+            return UNIX_ENDPOINT_PREFIX + self.path
+        return f'{self.host}:{self.port}'
+
+
+def parse_endpoint(host: str, port: Optional[int]=None) -> Endpoint:
+    """
+    Parses endpoint from host, which is either hostname/IP (used with the port) or unix:/path endpoint
+    """
+    if host.startswith(UNIX_ENDPOINT_PREFIX):
+        path = host[len(UNIX_ENDPOINT_PREFIX):]
+        if path in ('', ABSTRACT_NAMESPACE_PREFIX):
+            raise DeluderException(f'Unix domain socket endpoint {host} is missing path!')
+        return Endpoint(path=path)
+    return Endpoint(host=host, port=port)
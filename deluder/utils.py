@@ -1,9 +1,26 @@
-import itertools
 import socket
 
 
 SPACE_BYTE = 46
 
+HEX_TABLE_LINE_SIZE = 16
+
+HEX_TABLE_HEADER = (
+    ' ' * 10
+    + ' '.join(f'{x:2X}' for x in range(HEX_TABLE_LINE_SIZE))
+    + ' ' * 2
+    + ''.join(f'{x:1X}' for x in range(HEX_TABLE_LINE_SIZE))
+    + '\n'
+)
+
+PRINTABLE_TABLE = bytes(
+    SPACE_BYTE if x <= 0x1F or 0x7F <= x <= 0x9F else x
+    for x in range(256)
+)
+"""
+Translation table, which replaces invisible characters by dots
+"""
+
 
 def try_close(sock: socket.socket):
     """
@@ -16,59 +33,115 @@ def try_close(sock: socket.socket):
         pass
 
 
-def recv_n(receiving_sock: socket.socket, n: int) -> bytes:
+def recv_n(receiving_sock: socket.socket, n: int) -> bytearray:
     """
     Receives exactly specified amount of bytes from the socket
+    (data are received directly into preallocated buffer)
     """
-    remaining = n
-    total_data = bytearray()
-    while remaining != 0:
-        data = receiving_sock.recv(remaining)
-        if len(data) == 0:
+    data = bytearray(n)
+    view = memoryview(data)
+    received = 0
+    while received != n:
+        count = receiving_sock.recv_into(view[received:])
+        if count == 0:
             raise Exception('Connection lost, please restart deluder!')
-        total_data.extend(data)
-        remaining = n - len(total_data)
-    return total_data
+        received += count
+    return data
 
 
-def format_bytes(data: bytes) -> str:
+def recv_until(receiving_sock: socket.socket, suffix: bytes, buffer_size: int) -> bytearray:
+    """
+    Receives data from the socket until they end with the suffix and returns them without the suffix
+    (data are received directly into buffer, which grows by doubling, and only the tail is compared with the suffix)
+    """
+    data = bytearray(max(buffer_size, len(suffix)))
+    view = memoryview(data)
+    filled = 0
+    try:
+        while True:
+            if len(data) - filled < buffer_size:
+                # Buffer cannot be resized while it is exported by the view
+                view.release()
+                data.extend(bytes(max(len(data), buffer_size)))
+                view = memoryview(data)
+            count = receiving_sock.recv_into(view[filled:filled + buffer_size])
+            if count == 0:
+                raise Exception('Connection lost, please restart deluder!')
+            filled += count
+            if filled >= len(suffix) and view[filled - len(suffix):filled] == suffix:
+                break
+    finally:
+        view.release()
+    del data[filled - len(suffix):]
+    return data
+
+
+def send_all(sending_sock: socket.socket, *buffers: bytes):
+    """
+    Sends all buffers through the socket as continuous data
+    (using scatter/gather I/O if available, so that the buffers do not have to be joined)
+    """
+    if not hasattr(sending_sock, 'sendmsg'):
+        sending_sock.sendall(b''.join(buffers))
+        return
+
+    views = [memoryview(buffer).cast('B') for buffer in buffers if len(buffer) > 0]
+    while views:
+        sent = sending_sock.sendmsg(views)
+        while sent > 0:
+            if sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+def format_bytes(data: bytes, max_bytes: int=0) -> str:
     """
     Formats given bytes to human readable format (hex table)
+    (if max_bytes is set, only the head and the tail of longer data are formatted)
     """
-    text = ''
-    line = '        '
-    line += ' ' * 2
-    line += ' '.join('{:2x}'.format(x).upper() for x in range(16))
-    line += ' ' * 2
-    line += ''.join('{:1x}'.format(x).upper() for x in range(16))
-    text += line + '\n'
-
-    part_index = 0
-    for part in _partition(data, 16):
-        line = ''.join('{:08x}'.format(part_index).upper())
-        line += ' ' * 2
-        line += _add_padding_to_line(' '.join('{:02x}'.format(x) for x in part), 47)
-        line += ' ' * 2
-        line += bytes(_replace_invisible_chars(part)).decode('latin1')
-        text += line + '\n'
-        part_index += 16
-
+    # Only formatted parts are copied, so that truncated formatting of large data does not copy the whole data
+    data = memoryview(data).cast('B')
+    if max_bytes <= 0 or len(data) <= max_bytes:
+        return HEX_TABLE_HEADER + _format_lines(data, 0, len(data))
+
+    # Both parts are aligned to lines, so that the offsets stay the same as in the full table
+    head_end = max(max_bytes // 2 // HEX_TABLE_LINE_SIZE, 1) * HEX_TABLE_LINE_SIZE
+    tail_start = min(_align_up(max(len(data) - (max_bytes - head_end), head_end), HEX_TABLE_LINE_SIZE), len(data))
+    text = HEX_TABLE_HEADER + _format_lines(data, 0, head_end)
+    text += f'... {tail_start - head_end} bytes omitted ...\n'
+    text += _format_lines(data, tail_start, len(data))
     return text
 
 
-def _partition(array: bytes, size: int):
-    for i in range(0, len(array), size):
-        yield bytes(itertools.islice(array, i, i + size))
+class LazyFormattedBytes:
+    """
+    Bytes formatted to hex table only when converted to string
+    (can be passed as logging argument, so that the data are not formatted if the record is not emitted)
+    """
+    __slots__ = ('data', 'max_bytes')
+
+    def __init__(self, data: bytes, max_bytes: int=0):
+        self.data = data
+        self.max_bytes = max_bytes
+
+    def __str__(self) -> str:
+        return format_bytes(self.data, self.max_bytes)
 
 
-def _add_padding_to_line(line: str, length: int) -> str:
-    padding = (length - len(line)) * ' ' 
-    return line + padding
+def _format_lines(data: bytes, start: int, end: int) -> str:
+    # Whole range is converted at once, the loop only slices the prepared strings
+    part = bytes(data[start:end])
+    hex_text = part.hex(' ')
+    printable_text = part.translate(PRINTABLE_TABLE).decode('latin1')
+    hex_line_size = HEX_TABLE_LINE_SIZE * 3
+    return ''.join(
+        f'{start + i:08X}  {hex_text[i * 3:i * 3 + hex_line_size - 1]:<47}  {printable_text[i:i + HEX_TABLE_LINE_SIZE]}\n'
+        for i in range(0, len(part), HEX_TABLE_LINE_SIZE)
+    )
 
 
-def _replace_invisible_chars(data: bytes) -> bytes:
-    new_bytes = bytearray(data)
-    for i in range(len(data)):
-        if (data[i] >= 0x00 and data[i] <= 0x1F) or (data[i] >= 0x7F and data[i] <= 0x9F):
-            new_bytes[i] = SPACE_BYTE
-    return new_bytes
+def _align_up(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
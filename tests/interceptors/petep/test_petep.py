@@ -1,60 +1,117 @@
 import json
 import pytest
 import socket 
+import sys
+import time
 
-from threading import Thread
+from threading import Lock, Thread
+from typing import Optional
 
-from deluder.common import MetadataType, RecvMessage, SendMessage
+from deluder.common import CloseMessage, DeluderException, MetadataType, RecvMessage, SendMessage
 
+from deluder.transport import parse_endpoint
 from deluder.utils import recv_n, try_close
 from deluder.interceptors.petep.interceptor import PetepDeluderMessageType, PetepMessageInterceptor
+from deluder.interceptors.petep.multiplexed import MULTIPLEXED_HEADER
 
 from tests.interceptors.proxifier.common import TEST_DATA_INPUT, TEST_DATA_OUTPUT, data_inteceptor
+from tests.utils import unique_unix_host
+
+
+PETEP_HOSTS = ['tcp']
+if hasattr(socket, 'AF_UNIX'):
+    PETEP_HOSTS.append('unix')
+if sys.platform == 'linux':
+    PETEP_HOSTS.append('unix-abstract')
+
+
+def create_petep_host(kind: str) -> str:
+    if kind == 'tcp':
+        return '127.0.0.1'
+    return unique_unix_host('deluder-test-petep', abstract=kind == 'unix-abstract')
 
 
 class PetepProxy(Thread):
+    """
+    PETEP stand-in speaking the standard framing (accepts multiple sockets),
+    TCP proxy listens on free port, which is available in petep_port once the proxy is started
+    """
     petep_port: int
     server_socket: socket.socket
 
     def __init__(
             self, 
-            petep_port: int,
-            interceptor
+            interceptor,
+            petep_host: str='127.0.0.1',
+            server_socket: Optional[socket.socket]=None
     ):
         Thread.__init__(self)
-        self.petep_port = petep_port
+        self.petep_port = server_socket.getsockname()[1] if server_socket is not None else 0
+        self.petep_host = petep_host
+        self.server_socket = server_socket
         self.interceptor = interceptor
+        self.client_sockets = []
+        self.lock = Lock()
+        self.running = True
+
+    def start(self):
+        # Listen before the thread starts, so that the interceptor cannot connect too early
+        self.endpoint = parse_endpoint(self.petep_host, self.petep_port)
+        if self.server_socket is None:
+            self.server_socket = self.endpoint.listen(16)
+        else:
+            self.server_socket.listen(16)
+        if not self.endpoint.is_unix():
+            self.petep_port = self.server_socket.getsockname()[1]
+        self.server_socket.settimeout(0.1)
+        Thread.start(self)
     
     def run(self):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.settimeout(10)
-        petep_address = ('127.0.0.1', self.petep_port)
-        self.server_socket.bind(petep_address)
-        self.server_socket.listen(1)
-        
-        self.client_socket, _ = self.server_socket.accept()
-        
+        handlers = []
+        while self.running:
+            try:
+                client_socket, _ = self.server_socket.accept()
+            except socket.timeout:
+                continue
+            except:
+                break
+            client_socket.settimeout(None)
+            self.client_sockets.append(client_socket)
+            handler = Thread(target=self._handle, args=(client_socket,))
+            handler.start()
+            handlers.append(handler)
+        for handler in handlers:
+            handler.join()
+
+    def stop(self):
+        self.running = False
+        for client_socket in self.client_sockets:
+            try:
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try_close(client_socket)
+        self.join()
+        try_close(self.server_socket)
+        self.endpoint.remove_socket_file()
+
+    def _handle(self, client_socket: socket.socket):
         try:
             while True:
-                type_byte = recv_n(self.client_socket, 1)
-                length_bytes = recv_n(self.client_socket, 4)
+                type_byte = recv_n(client_socket, 1)
+                length_bytes = recv_n(client_socket, 4)
                 length = int.from_bytes(length_bytes, 'big')
-                data = recv_n(self.client_socket, length)
+                data = recv_n(client_socket, length)
 
                 if type_byte[0] in {PetepDeluderMessageType.DATA_C2S.value, PetepDeluderMessageType.DATA_S2C.value}:
                     data = self.interceptor(data)
                     payload = self._create_payload(type_byte[0], data)
-                    self.client_socket.sendall(payload)
+                    client_socket.sendall(payload)
                 elif type_byte[0] == PetepDeluderMessageType.CONNECTION_INFO.value:
                     self.last_connection_info = json.loads(data) 
         except:
             pass
 
-    def stop(self):
-        try_close(self.server_socket)
-        try_close(self.client_socket)
-        self.join()
-
     def _create_payload(self, type: int, data: bytes) -> bytes:
         length = len(data)
         length_bytes = length.to_bytes(4, byteorder='big')
@@ -66,6 +123,15 @@ class PetepProxy(Thread):
         return payload
 
 
+def bind_free_port() -> socket.socket:
+    """
+    Binds socket to free port without listening, so that connecting to it fails until the proxy is started
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(('127.0.0.1', 0))
+    return server_socket
+
+
 @pytest.mark.parametrize("metadata,expected_id,expected_name", [
     ({}, 'default', 'Deluder Connection'),
     ({MetadataType.CONNECTION_ID: 'test-connection-1'}, 'test-connection-1', 'test-connection-1'),
@@ -80,15 +146,18 @@ class PetepProxy(Thread):
       MetadataType.PROTOCOL: 'tcp6',
       MetadataType.CONNECTION_DESTINATION_PORT: 1255}, 'test-1', ':55680<->:1255 (winsock/tcp6)'),
 ])
-def test_petep_interceptor(metadata, expected_id, expected_name):
+@pytest.mark.parametrize("petep_host", PETEP_HOSTS)
+def test_petep_interceptor(metadata, expected_id, expected_name, petep_host):
+    petep_host = create_petep_host(petep_host)
     interceptor = None
     proxy = None
     try:
-        proxy = PetepProxy(petep_port=18888, interceptor=data_inteceptor)
+        proxy = PetepProxy(interceptor=data_inteceptor, petep_host=petep_host)
         proxy.start()
 
         config = {
-            'petepPort': 18888,
+            'petepHost': petep_host,
+            'petepPort': proxy.petep_port,
         }
         interceptor = PetepMessageInterceptor(config)
         interceptor.init()
@@ -112,3 +181,231 @@ def test_petep_interceptor(metadata, expected_id, expected_name):
         if proxy:
             proxy.stop()
 
+
+
+class PetepMultiplexedProxy(PetepProxy):
+    """
+    PETEP stand-in speaking the multiplexed framing (accepts multiple multiplexed sockets)
+    """
+    def __init__(self, interceptor):
+        PetepProxy.__init__(self, interceptor)
+        self.connection_infos = {}
+        self.closed_channels = set()
+
+    def _handle(self, client_socket: socket.socket):
+        try:
+            type_byte = recv_n(client_socket, 1)
+            length = int.from_bytes(recv_n(client_socket, 4), 'big')
+            hello = json.loads(recv_n(client_socket, length))
+            assert type_byte[0] == PetepDeluderMessageType.MULTIPLEXED.value
+            assert hello['version'] == 1
+
+            while True:
+                type, channel, sequence, length = MULTIPLEXED_HEADER.unpack(recv_n(client_socket, MULTIPLEXED_HEADER.size))
+                data = recv_n(client_socket, length)
+
+                if type in {PetepDeluderMessageType.DATA_C2S.value, PetepDeluderMessageType.DATA_S2C.value}:
+                    data = self.interceptor(data)
+                    with self.lock:
+                        client_socket.sendall(MULTIPLEXED_HEADER.pack(type, channel, sequence, len(data)) + data)
+                elif type == PetepDeluderMessageType.CONNECTION_INFO.value:
+                    with self.lock:
+                        self.connection_infos[channel] = json.loads(data)
+                elif type == PetepDeluderMessageType.CONNECTION_CLOSE.value:
+                    with self.lock:
+                        self.closed_channels.add(channel)
+        except:
+            pass
+
+
+@pytest.mark.parametrize("sockets", [1, 2])
+def test_petep_interceptor_multiplexed(sockets):
+    interceptor = None
+    proxy = None
+    try:
+        proxy = PetepMultiplexedProxy(interceptor=data_inteceptor)
+        proxy.start()
+
+        config = {
+            'petepPort': proxy.petep_port,
+            'multiplexed': True,
+            'multiplexedSockets': sockets,
+        }
+        interceptor = PetepMessageInterceptor(config)
+        interceptor.init()
+
+        errors = []
+
+        def run_connection(connection_id: str):
+            try:
+                metadata = {MetadataType.CONNECTION_ID: connection_id}
+                for _ in range(20):
+                    for i in range(len(TEST_DATA_INPUT)):
+                        message = SendMessage('id-1', TEST_DATA_INPUT[i], metadata)
+                        interceptor.intercept(None, message)
+                        assert message.data == TEST_DATA_OUTPUT[i]
+
+                        message = RecvMessage('id-1', TEST_DATA_INPUT[i], metadata)
+                        interceptor.intercept(None, message)
+                        assert message.data == TEST_DATA_OUTPUT[i]
+                interceptor.intercept(None, CloseMessage('id-1', metadata))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=run_connection, args=(f'connection-{i}',)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(proxy.client_sockets) == sockets
+        assert sorted(info['id'] for info in proxy.connection_infos.values()) == [f'connection-{i}' for i in range(4)]
+
+        # Close frames do not have responses, so they may still be on the way
+        for _ in range(100):
+            if len(proxy.closed_channels) == 4:
+                break
+            time.sleep(0.05)
+        assert len(proxy.closed_channels) == 4
+    finally:
+        if interceptor:
+            interceptor.destroy()
+
+        if proxy:
+            proxy.stop()
+
+
+def test_petep_interceptor_multiplexed_reconnect():
+    interceptor = None
+    proxy = None
+    try:
+        proxy = PetepMultiplexedProxy(interceptor=data_inteceptor)
+        proxy.start()
+
+        interceptor = PetepMessageInterceptor({'petepPort': proxy.petep_port, 'multiplexed': True})
+        interceptor.init()
+        metadata = {MetadataType.CONNECTION_ID: 'test-1'}
+        interceptor.intercept(None, SendMessage('id-1', TEST_DATA_INPUT[0], metadata))
+
+        # Lost socket is closed by its reader and replaced on the next message
+        lost_socket = interceptor.transport.sockets[0]
+        proxy.client_sockets[0].shutdown(socket.SHUT_RDWR)
+        lost_socket.reader.join(5)
+        assert lost_socket.socket.fileno() == -1
+
+        message = SendMessage('id-2', TEST_DATA_INPUT[2], metadata)
+        interceptor.intercept(None, message)
+        assert message.data == TEST_DATA_OUTPUT[2]
+        assert interceptor.transport.sockets[0] is not lost_socket
+        assert len(proxy.client_sockets) == 2
+    finally:
+        if interceptor:
+            interceptor.destroy()
+        if proxy:
+            proxy.stop()
+
+
+def test_petep_interceptor_connect_retry():
+    interceptor = None
+    proxy = PetepProxy(interceptor=data_inteceptor, server_socket=bind_free_port())
+    try:
+        config = {
+            'petepPort': proxy.petep_port,
+            'connectRetries': 10,
+            'connectBackoff': 0.05,
+        }
+        interceptor = PetepMessageInterceptor(config)
+        interceptor.init()
+
+        # PETEP starts listening only after the first attempts fail
+        starter = Thread(target=lambda: (time.sleep(0.2), proxy.start()))
+        starter.start()
+
+        message = SendMessage('id-1', TEST_DATA_INPUT[0], {MetadataType.CONNECTION_ID: 'test-1'})
+        interceptor.intercept(None, message)
+        assert message.data == TEST_DATA_OUTPUT[0]
+        starter.join()
+    finally:
+        if interceptor:
+            interceptor.destroy()
+        if proxy.is_alive():
+            proxy.stop()
+        else:
+            try_close(proxy.server_socket)
+
+
+def test_petep_interceptor_connect_failure():
+    interceptor = None
+    proxy = PetepProxy(interceptor=data_inteceptor, server_socket=bind_free_port())
+    try:
+        config = {
+            'petepPort': proxy.petep_port,
+            'connectRetries': 1,
+            'connectBackoff': 0.01,
+        }
+        interceptor = PetepMessageInterceptor(config)
+        interceptor.init()
+
+        metadata = {MetadataType.CONNECTION_ID: 'test-1'}
+        with pytest.raises(DeluderException):
+            interceptor.intercept(None, SendMessage('id-1', TEST_DATA_INPUT[0], metadata))
+
+        # Failed connection is not kept, so the next message connects again
+        proxy.start()
+        message = SendMessage('id-1', TEST_DATA_INPUT[0], metadata)
+        interceptor.intercept(None, message)
+        assert message.data == TEST_DATA_OUTPUT[0]
+    finally:
+        if interceptor:
+            interceptor.destroy()
+        if proxy.is_alive():
+            proxy.stop()
+        else:
+            try_close(proxy.server_socket)
+
+
+def test_petep_interceptor_warm_sockets():
+    interceptor = None
+    proxy = None
+    try:
+        proxy = PetepProxy(interceptor=data_inteceptor)
+        proxy.start()
+
+        config = {
+            'petepPort': proxy.petep_port,
+            'warmSockets': 2,
+        }
+        interceptor = PetepMessageInterceptor(config)
+        interceptor.init()
+
+        for _ in range(100):
+            if len(proxy.client_sockets) == 2:
+                break
+            time.sleep(0.01)
+        assert len(proxy.client_sockets) == 2
+
+        for i in range(3):
+            message = SendMessage('id-1', TEST_DATA_INPUT[i], {MetadataType.CONNECTION_ID: f'test-{i}'})
+            interceptor.intercept(None, message)
+            assert message.data == TEST_DATA_OUTPUT[i]
+
+        # Used sockets are replaced in the background
+        for _ in range(100):
+            if len(proxy.client_sockets) == 5:
+                break
+            time.sleep(0.01)
+        assert len(proxy.client_sockets) == 5
+
+        # Warm sockets closed by PETEP are not handed out
+        for client_socket in proxy.client_sockets[3:]:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        time.sleep(0.05)
+        message = SendMessage('id-1', TEST_DATA_INPUT[0], {MetadataType.CONNECTION_ID: 'test-3'})
+        interceptor.intercept(None, message)
+        assert message.data == TEST_DATA_OUTPUT[0]
+    finally:
+        if interceptor:
+            interceptor.destroy()
+        if proxy:
+            proxy.stop()
@@ -1,79 +1,115 @@
 import socket
 
-from tests.utils import generate_all_bytes
+from tests.utils import generate_all_bytes, reserve_free_port
 from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 
+from deluder.transport import parse_endpoint
 from deluder.utils import try_close
 
 
 TEST_DATA_INPUT = ['te[replace]st'.encode(), generate_all_bytes(), '[replace]warxim[replace]'.encode()]
 TEST_DATA_OUTPUT = ['te[value]st'.encode(), generate_all_bytes(), '[value]warxim[value]'.encode()]
 
+ENGINES = ['threaded', 'asyncio']
+
 
 class SimpleProxy(Thread):
-    def __init__(self, proxy_port, target_port, buffer_size, interceptor):
+    """
+    Proxy between the proxifier client and server (port 0 listens on free port, which is set to proxy_port on start)
+    """
+    def __init__(self, proxy_port, target_port, buffer_size, interceptor, proxy_host='127.0.0.1', target_host='127.0.0.1', proxy_sock=None):
         Thread.__init__(self)
-        self.proxy_port = proxy_port
+        self.proxy_sock = proxy_sock
+        self.proxy_port = proxy_sock.getsockname()[1] if proxy_sock is not None else proxy_port
+        self.proxy_endpoint = parse_endpoint(proxy_host, proxy_port)
         self.target_port = target_port
+        self.target_endpoint = parse_endpoint(target_host, target_port)
         self.buffer_size = buffer_size
         self.interceptor = interceptor
+        self.sockets = []
+        self.connections = 0
+        self.running = True
+
+    def start(self):
+        # Listen before the thread starts, so that the interceptor cannot connect too early
+        if self.proxy_sock is None:
+            self.proxy_sock = self.proxy_endpoint.listen(16)
+        else:
+            self.proxy_sock.listen(16)
+        if not self.proxy_endpoint.is_unix():
+            self.proxy_port = self.proxy_sock.getsockname()[1]
+        self.proxy_sock.settimeout(0.1)
+        Thread.start(self)
     
     def run(self):
-        self.proxy_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.proxy_sock.settimeout(10)
-        proxy_address = ('127.0.0.1', self.proxy_port)
-        self.proxy_sock.bind(proxy_address)
-        self.proxy_sock.listen(1)
-        
-        self.proxy_client_sock, _ = self.proxy_sock.accept()
-        
-        self.target_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.target_sock.settimeout(10)
-        target_address = ('127.0.0.1', self.target_port)
-        self.target_sock.connect(target_address)
-            
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            executor.submit(self._handle_client_to_proxy)
-            executor.submit(self._handle_server_to_proxy)
-
-    def _handle_client_to_proxy(self):
-        while True:
-            data = self.proxy_client_sock.recv(self.buffer_size)
-            if not data:
-                return
-            data = self.interceptor(data)
-            if not data:
-                return
-            self.target_sock.sendall(data)
-
-    def _handle_server_to_proxy(self):
-        while True:
-            data = self.target_sock.recv(self.buffer_size)
-            if not data:
-                return
-            data = self.interceptor(data)
-            if not data:
-                return
-            self.proxy_client_sock.sendall(data)
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            while self.running:
+                try:
+                    proxy_client_sock, _ = self.proxy_sock.accept()
+                except socket.timeout:
+                    continue
+                except:
+                    break
+                proxy_client_sock.settimeout(None)
+                target_sock = self.target_endpoint.connect()
+                self.sockets.extend([proxy_client_sock, target_sock])
+                self.connections += 1
+
+                executor.submit(self._relay, proxy_client_sock, target_sock)
+                executor.submit(self._relay, target_sock, proxy_client_sock)
+            for sock in self.sockets:
+                self._shutdown(sock)
+
+    def _relay(self, source_sock: socket.socket, destination_sock: socket.socket):
+        try:
+            while True:
+                data = source_sock.recv(self.buffer_size)
+                if not data:
+                    break
+                data = self.interceptor(data)
+                if not data:
+                    break
+                destination_sock.sendall(data)
+        except:
+            pass
+        self._shutdown(destination_sock)
+
+    def _shutdown(self, sock: socket.socket):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
 
     def stop(self):
-        try_close(self.target_sock)
-        try_close(self.proxy_sock)
+        self.running = False
         self.join()
+        try_close(self.proxy_sock)
+        self.proxy_endpoint.remove_socket_file()
+        for sock in self.sockets:
+            try_close(sock)
 
 
-def create_proxy(interceptor=None) -> SimpleProxy:
+def create_proxy(interceptor=None, proxy_sock=None) -> SimpleProxy:
     interceptor = interceptor if interceptor is not None else data_inteceptor
-    return SimpleProxy(proxy_port=18888, target_port=25500, buffer_size=1024, interceptor=interceptor)
+    return SimpleProxy(proxy_port=0, target_port=reserve_free_port(), buffer_size=1024, interceptor=interceptor, proxy_sock=proxy_sock)
+
+
+def bind_free_port() -> socket.socket:
+    """
+    Binds socket to free port without listening, so that connecting to it fails until the proxy is started
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    return sock
 
 
 def data_inteceptor(data: bytes) -> bytes:
     return data.replace(b'[replace]', b'[value]')
 
 
-def create_config() -> dict:
+def create_config(proxy: SimpleProxy) -> dict:
     return {
-        'proxyPort': 18888,
-        'serverPort': 25500,
+        'proxyPort': proxy.proxy_port,
+        'serverPort': proxy.target_port,
     }
@@ -1,17 +1,21 @@
+import pytest
+
 from deluder.interceptors.proxifier.interceptor import ProxifierMessageInterceptor, ProxifierStrategyType
 from deluder.common import RecvMessage, SendMessage
 
-from tests.interceptors.proxifier.common import TEST_DATA_INPUT, TEST_DATA_OUTPUT, create_proxy, create_config, data_inteceptor
+from tests.interceptors.proxifier.common import ENGINES, TEST_DATA_INPUT, TEST_DATA_OUTPUT, create_proxy, create_config, data_inteceptor
 
 
-def test_proxifier_interceptor_length_strategy():
+@pytest.mark.parametrize("engine", ENGINES)
+def test_proxifier_interceptor_length_strategy(engine):
     interceptor = None
     proxy = None
     try:
         proxy = create_proxy(interceptor=data_inteceptor_with_length)
         proxy.start()
 
-        config = create_config()
+        config = create_config(proxy)
+        config['engine'] = engine
         config['strategy'] = ProxifierStrategyType.length.value
         interceptor = ProxifierMessageInterceptor(config)
         interceptor.init()
@@ -0,0 +1,119 @@
+import pytest
+import socket
+import time
+
+from deluder.interceptors.proxifier.interceptor import ProxifierMessageInterceptor, ProxifierStrategyType
+from deluder.common import MetadataType, RecvMessage, SendMessage
+from deluder.utils import try_close
+
+from tests.interceptors.proxifier.common import ENGINES, TEST_DATA_INPUT, TEST_DATA_OUTPUT, bind_free_port, create_proxy, create_config
+
+
+def wait_for_connections(proxy, count: int):
+    for _ in range(100):
+        if proxy.connections >= count:
+            break
+        time.sleep(0.01)
+    return proxy.connections
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_proxifier_interceptor_pool(engine):
+    interceptor = None
+    proxy = None
+    try:
+        proxy = create_proxy()
+        proxy.start()
+
+        config = create_config(proxy)
+        config['engine'] = engine
+        config['strategy'] = ProxifierStrategyType.suffix.value
+        config['poolSize'] = 2
+        interceptor = ProxifierMessageInterceptor(config)
+        interceptor.init()
+
+        # Socket pairs are pre-established before any message arrives
+        assert wait_for_connections(proxy, 2) == 2
+
+        for connection in range(3):
+            metadata = {MetadataType.CONNECTION_ID: f'test-{connection}'}
+            for i in range(len(TEST_DATA_INPUT)):
+                message = SendMessage('id-1', TEST_DATA_INPUT[i], metadata)
+                interceptor.intercept(None, message)
+                assert message.data == TEST_DATA_OUTPUT[i]
+
+                message = RecvMessage('id-1', TEST_DATA_INPUT[i], metadata)
+                interceptor.intercept(None, message)
+                assert message.data == TEST_DATA_OUTPUT[i]
+
+        # Used pairs are replaced in the background
+        assert wait_for_connections(proxy, 5) == 5
+    finally:
+        if interceptor:
+            interceptor.destroy()
+        
+        if proxy:
+            proxy.stop()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_proxifier_interceptor_pool_retry(engine):
+    interceptor = None
+    proxy = create_proxy(proxy_sock=bind_free_port())
+    try:
+        config = create_config(proxy)
+        config['engine'] = engine
+        config['strategy'] = ProxifierStrategyType.suffix.value
+        config['poolSize'] = 2
+        interceptor = ProxifierMessageInterceptor(config)
+        interceptor.init()
+
+        # Pre-establishing fails until the proxy starts and is retried in the background
+        time.sleep(0.2)
+        proxy.start()
+        for _ in range(300):
+            if proxy.connections >= 2:
+                break
+            time.sleep(0.01)
+        assert proxy.connections == 2
+
+        message = SendMessage('id-1', TEST_DATA_INPUT[0], {MetadataType.CONNECTION_ID: 'test-1'})
+        interceptor.intercept(None, message)
+        assert message.data == TEST_DATA_OUTPUT[0]
+    finally:
+        if interceptor:
+            interceptor.destroy()
+        if proxy.is_alive():
+            proxy.stop()
+        else:
+            try_close(proxy.proxy_sock)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_proxifier_interceptor_drops_stale_connections(engine):
+    interceptor = None
+    proxy = None
+    stale_sock = None
+    try:
+        proxy = create_proxy()
+        proxy.start()
+
+        config = create_config(proxy)
+        config['engine'] = engine
+        config['strategy'] = ProxifierStrategyType.suffix.value
+        interceptor = ProxifierMessageInterceptor(config)
+        interceptor.init()
+
+        # Late connection of the proxy (after timed out accept) waits in the backlog of the server
+        stale_sock = socket.create_connection(('127.0.0.1', config['serverPort']))
+        time.sleep(0.1)
+
+        message = SendMessage('id-1', TEST_DATA_INPUT[0], {MetadataType.CONNECTION_ID: 'test-1'})
+        interceptor.intercept(None, message)
+        assert message.data == TEST_DATA_OUTPUT[0]
+    finally:
+        try_close(stale_sock)
+        if interceptor:
+            interceptor.destroy()
+        if proxy:
+            proxy.stop()
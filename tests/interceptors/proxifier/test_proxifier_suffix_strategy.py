@@ -1,17 +1,21 @@
+import pytest
+
 from deluder.interceptors.proxifier.interceptor import ProxifierMessageInterceptor, ProxifierStrategyType
 from deluder.common import RecvMessage, SendMessage
 
-from tests.interceptors.proxifier.common import TEST_DATA_INPUT, TEST_DATA_OUTPUT, create_proxy, create_config
+from tests.interceptors.proxifier.common import ENGINES, TEST_DATA_INPUT, TEST_DATA_OUTPUT, create_proxy, create_config
 
 
-def test_proxifier_interceptor_suffix_strategy():
+@pytest.mark.parametrize("engine", ENGINES)
+def test_proxifier_interceptor_suffix_strategy(engine):
     interceptor = None
     proxy = None
     try:
         proxy = create_proxy()
         proxy.start()
 
-        config = create_config()
+        config = create_config(proxy)
+        config['engine'] = engine
         config['strategy'] = ProxifierStrategyType.suffix.value
         config['strategies'] = {
             'suffix': {
@@ -0,0 +1,60 @@
+import os
+import pytest
+import socket
+import sys
+
+from deluder.interceptors.proxifier.interceptor import ProxifierMessageInterceptor, ProxifierStrategyType
+from deluder.common import MetadataType, RecvMessage, SendMessage
+
+from tests.interceptors.proxifier.common import ENGINES, TEST_DATA_INPUT, TEST_DATA_OUTPUT, SimpleProxy, data_inteceptor
+from tests.utils import unique_unix_host
+
+
+UNIX_KINDS = []
+if hasattr(socket, 'AF_UNIX'):
+    UNIX_KINDS.append('unix')
+if sys.platform == 'linux':
+    UNIX_KINDS.append('unix-abstract')
+
+
+@pytest.mark.skipif(not UNIX_KINDS, reason='Unix domain sockets are not supported')
+@pytest.mark.parametrize("kind", UNIX_KINDS)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_proxifier_interceptor_unix(kind, engine):
+    proxy_host = unique_unix_host('deluder-test-proxy', abstract=kind == 'unix-abstract')
+    server_host = unique_unix_host('deluder-test-server', abstract=kind == 'unix-abstract')
+    interceptor = None
+    proxy = None
+    try:
+        proxy = SimpleProxy(proxy_port=None, target_port=None, buffer_size=1024, interceptor=data_inteceptor,
+                            proxy_host=proxy_host, target_host=server_host)
+        proxy.start()
+
+        interceptor = ProxifierMessageInterceptor({
+            'proxyHost': proxy_host,
+            'serverHost': server_host,
+            'strategy': ProxifierStrategyType.suffix.value,
+            'engine': engine,
+            'poolSize': 1,
+        })
+        interceptor.init()
+
+        for connection in range(2):
+            metadata = {MetadataType.CONNECTION_ID: f'test-{connection}'}
+            for i in range(len(TEST_DATA_INPUT)):
+                message = SendMessage('id-1', TEST_DATA_INPUT[i], metadata)
+                interceptor.intercept(None, message)
+                assert message.data == TEST_DATA_OUTPUT[i]
+
+                message = RecvMessage('id-1', TEST_DATA_INPUT[i], metadata)
+                interceptor.intercept(None, message)
+                assert message.data == TEST_DATA_OUTPUT[i]
+    finally:
+        if interceptor:
+            interceptor.destroy()
+
+        if proxy:
+            proxy.stop()
+
+    if not server_host.startswith('unix:@'):
+        assert not os.path.exists(server_host[len('unix:'):])
@@ -0,0 +1,117 @@
+import struct
+import threading
+
+from typing import Tuple
+
+from deluder.common import *
+from deluder.interceptors.pcap import PcapMessageInterceptor
+
+
+def read_packets(path) -> List[Tuple[bytes, Optional[bytes]]]:
+    data = path.read_bytes()
+    offset = 0
+    packets = []
+    block_types = []
+    while offset < len(data):
+        block_type, length = struct.unpack_from('<II', data, offset)
+        block_types.append(block_type)
+        if block_type == 6:
+            captured_length = struct.unpack_from('<I', data, offset + 20)[0]
+            packet = data[offset + 28:offset + 28 + captured_length]
+            options_offset = offset + 28 + captured_length + (-captured_length % 4)
+            comment = None
+            if options_offset < offset + length - 4:
+                code, option_length = struct.unpack_from('<HH', data, options_offset)
+                comment = data[options_offset + 4:options_offset + 4 + option_length] if code == 1 else None
+            packets.append((packet, comment))
+        assert struct.unpack_from('<I', data, offset + length - 4)[0] == length
+        offset += length
+    assert block_types[:2] == [0x0A0D0D0A, 1]
+    return packets
+
+
+def tcp_payload(packet: bytes) -> bytes:
+    header_length = 40 if packet[0] >> 4 == 6 else 20
+    return packet[header_length + (packet[header_length + 12] >> 4) * 4:]
+
+
+def test_pcap_interceptor_tcp(tmp_path):
+    path = tmp_path / 'test.pcapng'
+    interceptor = PcapMessageInterceptor({'path': str(path)})
+    interceptor.init()
+    metadata = {
+        MetadataType.CONNECTION_ID: 'libc-5',
+        MetadataType.PROTOCOL: 'tcp',
+        MetadataType.CONNECTION_SOURCE_IP: '127.0.0.1',
+        MetadataType.CONNECTION_SOURCE_PORT: 51234,
+        MetadataType.CONNECTION_DESTINATION_IP: '10.0.0.1',
+        MetadataType.CONNECTION_DESTINATION_PORT: 443,
+    }
+    process = Process(pid=10)
+    interceptor.intercept(process, SendMessage('id-1', b'request', metadata))
+    interceptor.intercept(process, RecvMessage('id-2', b'response', metadata))
+    interceptor.intercept(process, CloseMessage('id-3', metadata))
+    interceptor.destroy()
+
+    packets = read_packets(path)
+    assert len(packets) == 8
+    assert b'pid=10 connection=libc-5' in packets[0][1]
+    request = packets[3][0]
+    assert request[12:16] == bytes([127, 0, 0, 1]) and request[16:20] == bytes([10, 0, 0, 1])
+    assert struct.unpack_from('!HH', request, 20) == (51234, 443)
+    assert tcp_payload(request) == b'request'
+    response = packets[4][0]
+    assert struct.unpack_from('!HH', response, 20) == (443, 51234)
+    assert tcp_payload(response) == b'response'
+    # Sequence numbers continue after the handshake and the previous payload
+    assert struct.unpack_from('!II', request, 24) == (2, 2)
+    assert struct.unpack_from('!II', response, 24) == (2, 2 + len(b'request'))
+
+
+def test_pcap_interceptor_unix_and_rotation(tmp_path):
+    path = tmp_path / 'test.pcapng'
+    interceptor = PcapMessageInterceptor({'path': str(path), 'maxFileSize': 200})
+    interceptor.init()
+    metadata = {
+        MetadataType.CONNECTION_ID: 'libc-7',
+        MetadataType.PROTOCOL: 'unix:dgram',
+        MetadataType.CONNECTION_DESTINATION_PATH: '/run/test.sock',
+    }
+    for i in range(3):
+        interceptor.intercept(Process(pid=1), SendMessage(f'id-{i}', b'x' * 100, metadata))
+    interceptor.destroy()
+
+    files = sorted(tmp_path.iterdir())
+    assert [file.name for file in files] == ['test-00001.pcapng', 'test-00002.pcapng', 'test-00003.pcapng']
+    first = read_packets(files[0])[0]
+    second = read_packets(files[1])[0]
+    assert b'path=/run/test.sock' in first[1]
+    assert first[0][9] == 17
+    assert first[0][12:20] == second[0][12:20]
+    assert first[0][28:] == b'x' * 100
+
+
+def test_pcap_interceptor_drops_when_full(tmp_path, monkeypatch):
+    writing = threading.Event()
+    release = threading.Event()
+    write_message = PcapMessageInterceptor._write_message
+
+    def blocking_write_message(self, *args):
+        writing.set()
+        release.wait()
+        write_message(self, *args)
+
+    monkeypatch.setattr(PcapMessageInterceptor, '_write_message', blocking_write_message)
+    interceptor = PcapMessageInterceptor({'path': str(tmp_path / 'test.pcapng'), 'queueSize': 1})
+    interceptor.init()
+    metadata = {MetadataType.CONNECTION_ID: 'libc-1'}
+    try:
+        interceptor.intercept(Process(pid=1), SendMessage('id-1', b'first', metadata))
+        assert writing.wait(5)
+        # Writer is busy with the first message, so the second one fills the queue and the third one is dropped
+        interceptor.intercept(Process(pid=1), SendMessage('id-2', b'second', metadata))
+        interceptor.intercept(Process(pid=1), SendMessage('id-3', b'third', metadata))
+        assert interceptor.stats() == {'queued': 1, 'dropped': 1}
+    finally:
+        release.set()
+        interceptor.destroy()
@@ -0,0 +1,147 @@
+import os
+import pytest
+import time
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.interceptors.pool import ProcessPoolMessageInterceptor, _handle_request
+
+
+class CountingMessageInterceptor(MessageInterceptor):
+    """
+    Upper-cases data and appends number of the message in the connection (loaded by the pool workers)
+    """
+    def intercept(self, process: Process, message: Message):
+        connection = self.get_connection_descriptor(process, message)
+        count = connection.state['count'] = connection.state.get('count', 0) + 1
+        if isinstance(message, DataMessage):
+            if message.data == b'fail':
+                raise ValueError('Failed on purpose')
+            if message.data.startswith(b'sleep'):
+                time.sleep(0.5)
+            message.data = message.data.upper() * self.config.get('repeat', 1) + b'#%d' % count
+            message.metadata['pid'] = os.getpid()
+
+
+def create_interceptor(config: dict) -> ProcessPoolMessageInterceptor:
+    interceptor = ProcessPoolMessageInterceptor(config)
+    interceptor.init()
+    return interceptor
+
+
+def create_metadata(connection: int) -> dict:
+    return {MetadataType.CONNECTION_ID: f'libc-{connection}', MetadataType.CONNECTION_HANDLE: connection}
+
+
+def test_pool_interceptor():
+    interceptor = create_interceptor({
+        'interceptor': 'tests.interceptors.test_pool:CountingMessageInterceptor',
+        'workers': 2,
+        'sharedMemoryThreshold': 16,
+    })
+    process = Process(pid=1)
+    try:
+        pids = set()
+        for i in range(1, 6):
+            for connection in range(4):
+                data = b'abc' * (i * connection)
+                message = SendMessage(f'id-{i}', data, create_metadata(connection))
+                interceptor.intercept(process, message)
+                # Order of messages and per-connection state are kept by the worker of the connection
+                assert message.data == data.upper() + b'#%d' % i
+                pids.add(message.metadata['pid'])
+
+        interceptor.intercept(process, CloseMessage('id-6', create_metadata(0)))
+        message = SendMessage('id-7', b'after-close', create_metadata(0))
+        interceptor.intercept(process, message)
+        assert message.data == b'AFTER-CLOSE#1'
+
+        assert os.getpid() not in pids
+        assert interceptor.stats() == {'workers': 2, 'requests': 22, 'sharedMemoryRequests': 7}
+    finally:
+        interceptor.destroy()
+
+
+def test_pool_interceptor_growing_data():
+    interceptor = create_interceptor({
+        'interceptor': 'tests.interceptors.test_pool:CountingMessageInterceptor',
+        'config': {'repeat': 3},
+        'workers': 1,
+        'sharedMemoryThreshold': 1024,
+    })
+    try:
+        data = os.urandom(100000)
+        message = RecvMessage('id-1', data, create_metadata(1))
+        interceptor.intercept(Process(pid=1), message)
+        assert message.data == data.upper() * 3 + b'#1'
+    finally:
+        interceptor.destroy()
+
+
+def test_pool_interceptor_error():
+    interceptor = create_interceptor({
+        'interceptor': 'tests.interceptors.test_pool:CountingMessageInterceptor',
+        'workers': 1,
+    })
+    try:
+        with pytest.raises(DeluderException, match='Failed on purpose'):
+            interceptor.intercept(Process(pid=1), SendMessage('id-1', b'fail', create_metadata(1)))
+
+        message = SendMessage('id-2', b'ok', create_metadata(1))
+        interceptor.intercept(Process(pid=1), message)
+        assert message.data == b'OK#2'
+
+        # Interceptors can be called without process
+        message = SendMessage('id-3', b'ok', create_metadata(2))
+        interceptor.intercept(None, message)
+        assert message.data == b'OK#1'
+    finally:
+        interceptor.destroy()
+
+
+def test_pool_interceptor_timeout():
+    interceptor = create_interceptor({
+        'interceptor': 'tests.interceptors.test_pool:CountingMessageInterceptor',
+        'workers': 1,
+        'sharedMemoryThreshold': 16,
+        'timeout': 0.1,
+    })
+    try:
+        with pytest.raises(DeluderException, match='did not respond'):
+            interceptor.intercept(Process(pid=1), SendMessage('id-1', b'sleep' * 10, create_metadata(1)))
+        # Shared memory of the timed out request is kept until the worker responds
+        assert len(interceptor.workers[0].abandoned) == 1
+
+        interceptor.config['timeout'] = 5
+        message = SendMessage('id-2', b'ok', create_metadata(1))
+        interceptor.intercept(Process(pid=1), message)
+        assert message.data == b'OK#2'
+        assert not interceptor.workers[0].abandoned
+    finally:
+        interceptor.destroy()
+
+
+def test_pool_interceptor_registry():
+    interceptor = create_interceptor({
+        'interceptor': 'rewrite',
+        'config': {'rules': [{'find': 'cat', 'replace': 'dog'}]},
+        'workers': 1,
+    })
+    try:
+        message = SendMessage('id-1', b'a cat', create_metadata(1))
+        interceptor.intercept(Process(pid=1), message)
+        assert message.data == b'a dog'
+        assert not interceptor.is_read_only()
+    finally:
+        interceptor.destroy()
+
+    with pytest.raises(DeluderException):
+        ProcessPoolMessageInterceptor({'interceptor': 'tests.interceptors.test_pool:Missing'})
+
+
+def test_pool_worker_missing_shared_memory():
+    interceptor = CountingMessageInterceptor({})
+    request = (1, 1, MessageType.SEND.value, 'id-1', create_metadata(1), ('deluder-missing', 10))
+    request_id, error, metadata, result = _handle_request(interceptor, {}, 16, request)
+    assert request_id == 1 and 'FileNotFoundError' in error
+    assert metadata is None and result is None
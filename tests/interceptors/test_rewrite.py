@@ -0,0 +1,69 @@
+import pytest
+
+from deluder.common import *
+from deluder.interceptors.rewrite import RewriteMessageInterceptor
+
+
+def create_interceptor(rules: List[dict]) -> RewriteMessageInterceptor:
+    interceptor = RewriteMessageInterceptor({'rules': rules})
+    interceptor.init()
+    return interceptor
+
+
+def rewrite(interceptor: RewriteMessageInterceptor, message: DataMessage) -> bytes:
+    interceptor.intercept(Process(pid=1), message)
+    return message.data
+
+
+def test_rewrite_single_pass():
+    interceptor = create_interceptor([
+        {'name': 'text', 'find': 'cat', 'replace': 'dog'},
+        {'name': 'hex', 'findHex': '00ff', 'replaceHex': 'aabb'},
+        {'name': 'regex', 'findRegex': r'id=(\d+)', 'replace': r'id=[\1]'},
+        # Replaced data are not matched again
+        {'name': 'chain', 'find': 'dog', 'replace': 'cow'},
+    ])
+
+    data = rewrite(interceptor, SendMessage('id-1', b'cat\x00\xffid=42 dog cat', {}))
+
+    assert data == b'dog\xaa\xbbid=[42] cow dog'
+    assert interceptor.stats() == {'hits': {'text': 2, 'hex': 1, 'regex': 1, 'chain': 1}}
+
+
+def test_rewrite_unchanged_data():
+    interceptor = create_interceptor([{'find': 'cat', 'replace': 'dog'}])
+    data = b'x' * 1000000
+
+    assert rewrite(interceptor, SendMessage('id-1', data, {})) is data
+    assert rewrite(interceptor, SendMessage('id-2', memoryview(b'a cat'), {})) == b'a dog'
+    assert interceptor.stats() == {'hits': {'rule-1': 1}}
+
+
+def test_rewrite_conditions():
+    interceptor = create_interceptor([
+        {'name': 'send', 'find': 'a', 'replace': 'b', 'directions': ['send']},
+        {'name': 'https', 'find': 'c', 'replace': 'd', 'ports': ['440-450'], 'ips': ['10.0.0.0/8']},
+        {'name': 'openssl', 'find': 'e', 'replace': 'f', 'modules': ['openssl']},
+    ])
+    metadata = {
+        MetadataType.MODULE: 'libc',
+        MetadataType.CONNECTION_SOURCE_IP: '127.0.0.1',
+        MetadataType.CONNECTION_SOURCE_PORT: 51234,
+        MetadataType.CONNECTION_DESTINATION_IP: '10.0.0.1',
+        MetadataType.CONNECTION_DESTINATION_PORT: 443,
+    }
+
+    assert rewrite(interceptor, SendMessage('id-1', b'ace', metadata)) == b'bde'
+    assert rewrite(interceptor, RecvMessage('id-2', b'ace', metadata)) == b'ade'
+    assert rewrite(interceptor, SendMessage('id-3', b'ace', {MetadataType.MODULE: 'openssl'})) == b'bcf'
+
+
+@pytest.mark.parametrize('rule', [
+    {'replace': 'x'},
+    {'find': ''},
+    {'findRegex': 'a*'},
+    {'find': 'a', 'directions': ['close']},
+])
+def test_rewrite_invalid_rule(rule):
+    with pytest.raises(DeluderException):
+        create_interceptor([rule])
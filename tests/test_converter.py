@@ -0,0 +1,72 @@
+from deluder.common import *
+from deluder.converter import MessageConverter
+
+
+def test_convert_send_message():
+    message = MessageConverter.convert({'type': 'send', 'payload': {'id': 'id-1', 'type': 's', 'ci': 'libc-1'}}, b'test')
+
+    assert isinstance(message, SendMessage)
+    assert message.id == 'id-1'
+    assert message.data == b'test'
+    assert message.metadata == {MetadataType.CONNECTION_ID: 'libc-1'}
+    assert not hasattr(message, '__dict__')
+
+
+def test_convert_batch():
+    batch = {
+        'type': 'send',
+        'payload': {
+            'type': 'b',
+            'messages': [
+                {'id': 'id-1', 'type': 'c', 'ci': 'libc-1'},
+                {'id': 'id-2', 'type': 's', 'ci': 'libc-2', 'o': 0, 'l': 4},
+                {'id': 'id-3', 'type': 'r', 'ci': 'libc-2', 'o': 4, 'l': 3},
+                {'id': 'id-4', 'type': 'r', 'ci': 'libc-2', 'o': 7, 'l': 0},
+            ],
+        },
+    }
+
+    assert MessageConverter.is_batch(batch)
+    messages = MessageConverter.convert_batch(batch, b'testabc')
+
+    assert [type(message) for message in messages] == [CloseMessage, SendMessage, RecvMessage, RecvMessage]
+    assert [message.id for message in messages] == ['id-1', 'id-2', 'id-3', 'id-4']
+    assert messages[1].data == b'test'
+    assert messages[2].data == b'abc'
+    assert messages[3].data == b''
+    assert all(type(message.data) is bytes for message in messages[1:])
+    assert messages[2].metadata == {MetadataType.CONNECTION_ID: 'libc-2'}
+
+
+def test_convert_non_send_message():
+    assert not MessageConverter.is_batch({'type': 'error', 'description': 'Error'})
+    assert MessageConverter.convert({'type': 'error', 'description': 'Error'}, None) is None
+
+
+def test_convert_resolves_connection_handles():
+    connections = ConnectionTable()
+    full_metadata = {'ci': 'libc-5', 'm': 'libc', 's': 5, 'cdi': '10.0.0.1', 'cdp': 443, 'h': 1}
+
+    first = MessageConverter.convert({'type': 'send', 'payload': dict(full_metadata, id='id-1', type='s')}, b'a', connections)
+    second = MessageConverter.convert({'type': 'send', 'payload': {'h': 1, 'id': 'id-2', 'type': 'r'}}, b'b', connections)
+
+    assert first.metadata == full_metadata
+    assert second.metadata == full_metadata
+    assert second.metadata is not connections.get(1).metadata
+
+    connection = connections.get(1)
+    assert connection.id == 'libc-5'
+    assert connection.module == 'libc'
+    assert connection.destination_ip == '10.0.0.1'
+    assert connection.destination_port == 443
+    assert connection.source_ip is None
+
+
+def test_connection_table_is_bounded():
+    connections = ConnectionTable(max_size=2)
+    for handle in range(1, 4):
+        connections.register({'ci': f'libc-{handle}', 'h': handle})
+
+    assert len(connections) == 2
+    assert connections.get(1) is None
+    assert connections.get(3).id == 'libc-3'
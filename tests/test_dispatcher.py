@@ -0,0 +1,81 @@
+import threading
+
+from deluder.common import *
+from deluder.dispatcher import MessageDispatcher
+
+
+def test_dispatcher_processes_messages_in_order():
+    processed = []
+    dispatcher = MessageDispatcher(lambda process, message: processed.append(message.id), queue_size=100)
+    dispatcher.start()
+
+    for i in range(50):
+        assert dispatcher.dispatch(None, CloseMessage(f'id-{i}', {}))
+    dispatcher.stop()
+
+    assert processed == [f'id-{i}' for i in range(50)]
+    assert dispatcher.dropped == 0
+
+
+def test_dispatcher_drops_messages_when_queue_is_full():
+    release = threading.Event()
+    processed = []
+
+    def handler(process, message):
+        release.wait(10)
+        processed.append(message.id)
+
+    dispatcher = MessageDispatcher(handler, queue_size=2)
+    dispatcher.start()
+
+    results = [dispatcher.dispatch(None, CloseMessage(f'id-{i}', {}), block=False) for i in range(10)]
+    release.set()
+    dispatcher.stop()
+
+    assert results.count(False) == dispatcher.dropped
+    assert dispatcher.dropped >= 7
+    assert len(processed) == 10 - dispatcher.dropped
+
+
+def test_dispatcher_keeps_order_within_connection_and_runs_connections_in_parallel():
+    blocked_connection = 'libc-1'
+    release = threading.Event()
+    processed = {}
+    lock = threading.Lock()
+
+    def handler(process, message):
+        connection_id = message.metadata[MetadataType.CONNECTION_ID]
+        if connection_id == blocked_connection:
+            release.wait(10)
+        with lock:
+            processed.setdefault(connection_id, []).append(message.id)
+
+    dispatcher = MessageDispatcher(handler, queue_size=1000, shards=8)
+    dispatcher.start()
+
+    connection_ids = [f'libc-{i}' for i in range(1, 33)]
+    blocked_worker = dispatcher._get_worker(None, CloseMessage('id', {MetadataType.CONNECTION_ID: blocked_connection}))
+    for i in range(20):
+        for connection_id in connection_ids:
+            dispatcher.dispatch(None, CloseMessage(f'{connection_id}-{i}', {MetadataType.CONNECTION_ID: connection_id}))
+
+    # Connections in other shards finish while the blocked connection still waits
+    other_connection_ids = [
+        connection_id for connection_id in connection_ids 
+        if dispatcher._get_worker(None, CloseMessage('id', {MetadataType.CONNECTION_ID: connection_id})) is not blocked_worker
+    ]
+    for _ in range(100):
+        with lock:
+            if all(len(processed.get(connection_id, [])) == 20 for connection_id in other_connection_ids):
+                break
+        threading.Event().wait(0.05)
+    with lock:
+        assert blocked_connection not in processed
+        assert all(len(processed.get(connection_id, [])) == 20 for connection_id in other_connection_ids)
+    assert blocked_worker.depth() > 0
+
+    release.set()
+    dispatcher.stop()
+
+    for connection_id in connection_ids:
+        assert processed[connection_id] == [f'{connection_id}-{i}' for i in range(20)]
@@ -0,0 +1,84 @@
+import logging
+import queue
+
+from deluder.common import SendMessage
+from deluder.log import BoundedQueueHandler, LogOverflowPolicy, LogPipeline
+from deluder.utils import LazyFormattedBytes
+
+
+class CountingArgument:
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'argument'
+
+
+def create_record(message: str, *args) -> logging.LogRecord:
+    return logging.LogRecord('test', logging.INFO, __file__, 1, message, args, None)
+
+
+def test_bounded_queue_handler_drop_new():
+    handler = BoundedQueueHandler(queue.Queue(2), LogOverflowPolicy.drop_new)
+    for i in range(5):
+        handler.handle(create_record('record %d', i))
+
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().getMessage() for _ in range(2)] == ['record 0', 'record 1']
+
+
+def test_bounded_queue_handler_drop_oldest():
+    handler = BoundedQueueHandler(queue.Queue(2), LogOverflowPolicy.drop_oldest)
+    for i in range(5):
+        handler.handle(create_record('record %d', i))
+
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().getMessage() for _ in range(2)] == ['record 3', 'record 4']
+
+
+def test_bounded_queue_handler_defers_formatting():
+    handler = BoundedQueueHandler(queue.Queue(2), LogOverflowPolicy.block)
+    argument = CountingArgument()
+    metadata = {'key': 'value'}
+    handler.handle(create_record('%s %s', argument, metadata))
+    metadata['key'] = 'changed'
+
+    assert argument.formatted == 0
+    assert handler.queue.get_nowait().getMessage() == "argument {'key': 'value'}"
+
+
+def test_bounded_queue_handler_snapshots_messages():
+    handler = BoundedQueueHandler(queue.Queue(2), LogOverflowPolicy.block)
+    message = SendMessage('id-1', b'original', {'key': 'value'})
+    expected = str(message)
+    handler.handle(create_record('%s', message))
+    # Following interceptors modify the message before the log thread formats it
+    message.data = b'changed'
+    message.metadata['key'] = 'changed'
+
+    assert handler.queue.get_nowait().getMessage() == expected
+
+
+def test_bounded_queue_handler_snapshots_lazy_bytes():
+    handler = BoundedQueueHandler(queue.Queue(2), LogOverflowPolicy.block)
+    data = bytearray(b'original')
+    expected = str(LazyFormattedBytes(bytes(data)))
+    handler.handle(create_record('%s', LazyFormattedBytes(data)))
+    # Buffers received by interceptors can be reused before the log thread formats them
+    data[:] = b'changed!'
+
+    assert handler.queue.get_nowait().getMessage() == expected
+
+
+def test_log_pipeline_file(tmp_path):
+    path = tmp_path / 'deluder.log'
+    pipeline = LogPipeline(file=str(path))
+    pipeline.start()
+    try:
+        logging.getLogger('test').info('Message %d', 1)
+    finally:
+        pipeline.stop()
+
+    assert path.read_text().endswith('[INFO] (test) Message 1\n')
+    assert pipeline.snapshot() == {'depth': 0, 'dropped': 0}
@@ -0,0 +1,48 @@
+from deluder.common import *
+from deluder.recording import RecordingReader, RecordingWriter
+
+
+def create_metadata(connection_id: str, port: int) -> Dict[str, any]:
+    return {
+        MetadataType.CONNECTION_ID: connection_id,
+        MetadataType.CONNECTION_DESTINATION_PORT: port,
+        MetadataType.CONNECTION_HANDLE: 1,
+    }
+
+
+def test_recording_write_read(tmp_path):
+    path = str(tmp_path / 'test.rec')
+    writer = RecordingWriter(path)
+    writer.write(1, SendMessage('id-1', b'first', create_metadata('c-1', 80)), timestamp=10.0)
+    writer.write(1, RecvMessage('id-2', memoryview(b'second'), create_metadata('c-2', 443)), timestamp=11.0)
+    writer.write(1, RecvMessage('id-3', b'third', create_metadata('c-1', 80)), timestamp=12.0)
+    writer.write(2, SendMessage('id-4', None, create_metadata('c-1', 8080)), timestamp=13.0)
+    writer.write(1, CloseMessage('id-5', create_metadata('c-1', 80)), timestamp=14.0)
+    writer.close()
+
+    with RecordingReader(path) as reader:
+        assert len(reader) == 5
+        messages = list(reader)
+        assert [message.type for message in messages] == [MessageType.SEND, MessageType.RECV, MessageType.RECV, MessageType.SEND, MessageType.CLOSE]
+        assert [message.data for message in messages] == [b'first', b'second', b'third', b'', b'']
+        assert messages[2].metadata == {'ci': 'c-1', 'cdp': 80}
+        assert messages[3].pid == 2 and messages[3].metadata == {'ci': 'c-1', 'cdp': 8080}
+
+        assert reader.find_time(11.5) == 2
+        assert [message.data for message in reader.iter_time(11.0, 13.0)] == [b'second', b'third']
+        assert [message.data for message in reader.iter_connection('c-1', pid=1)] == [b'first', b'third', b'']
+        assert len(list(reader.iter_connection('c-1'))) == 4
+        assert reader.connections() == {0: (1, 'c-1'), 1: (1, 'c-2'), 2: (2, 'c-1')}
+
+
+def test_recording_metadata_stored_once(tmp_path):
+    path = str(tmp_path / 'test.rec')
+    writer = RecordingWriter(path)
+    for i in range(100):
+        writer.write(1, SendMessage(f'id-{i}', b'x', create_metadata('c-1', 80)))
+    writer.close()
+
+    with RecordingReader(path) as reader:
+        assert len(reader) == 100
+        assert reader.read(99).metadata == {'ci': 'c-1', 'cdp': 80}
+    assert (tmp_path / 'test.rec').stat().st_size < 100 * 32
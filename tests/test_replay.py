@@ -0,0 +1,42 @@
+import os
+import pytest
+import subprocess
+import sys
+
+from deluder.common import *
+from deluder.interceptors.record import RecordMessageInterceptor
+from deluder.recording import RecordingReader
+from deluder.replay import Replayer
+
+
+def test_replay_recording(tmp_path):
+    original_path = str(tmp_path / 'original.rec')
+    replayed_path = str(tmp_path / 'replayed.rec')
+    metadata = {MetadataType.CONNECTION_ID: 'c-1', MetadataType.MODULE: 'libc'}
+
+    interceptor = RecordMessageInterceptor({'path': original_path})
+    interceptor.init()
+    interceptor.intercept(Process(pid=5), SendMessage('id-1', b'request', metadata))
+    interceptor.intercept(Process(pid=5), RecvMessage('id-2', b'response', metadata))
+    interceptor.intercept(Process(pid=5), CloseMessage('id-3', metadata))
+    interceptor.destroy()
+
+    config = create_default_config()
+    config.interceptors = [DeluderInterceptorConfig('record', {'path': replayed_path})]
+    snapshot = Replayer(original_path, config=config, paced=True, speed=100).replay()
+
+    assert snapshot['messages'] == {'send': 1, 'recv': 1, 'close': 1}
+    with RecordingReader(original_path) as original, RecordingReader(replayed_path) as replayed:
+        assert [(m.pid, m.type, m.metadata, m.data) for m in original] == [(m.pid, m.type, m.metadata, m.data) for m in replayed]
+
+
+def test_replay_failure(tmp_path):
+    missing_path = str(tmp_path / 'missing.rec')
+    with pytest.raises(Exception):
+        Replayer(missing_path).replay()
+
+    # Failed replay exits with error status
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-m', 'deluder', 'replay', missing_path], capture_output=True, cwd=root)
+    assert result.returncode == 1
+    assert b'Replay' in result.stderr + result.stdout
@@ -0,0 +1,233 @@
+import json
+import threading
+
+from deluder.common import *
+from deluder.interceptor import MessageInterceptor
+from deluder.router import MessageRouter
+
+
+class RecordingScript:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, message, data=None):
+        self.posts.append((json.loads(json.dumps(message)), data))
+
+
+class ReplaceMessageInterceptor(MessageInterceptor):
+    def intercept(self, process: Process, message: Message):
+        if isinstance(message, DataMessage):
+            message.data = message.data.replace(b'[replace]', b'[value]')
+
+
+def create_message(type: MessageType, id: str='id-1', metadata: dict=None) -> dict:
+    payload = dict(metadata or {})
+    payload['id'] = id
+    payload['type'] = type.value
+    return {'type': 'send', 'payload': payload}
+
+
+def test_router_binary_response():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[ReplaceMessageInterceptor()], binary_responses=True)
+
+    router.route(process, create_message(MessageType.SEND), b'te[replace]st')
+
+    response, data = process.script.posts[0]
+    assert response['id'] == 'id-1'
+    assert 'data' not in response
+    assert data == b'te[value]st'
+
+
+def test_router_json_response():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[ReplaceMessageInterceptor()], binary_responses=False)
+
+    router.route(process, create_message(MessageType.RECV), b'te[replace]st')
+
+    response, data = process.script.posts[0]
+    assert data is None
+    assert bytes(response['data']) == b'te[value]st'
+
+
+def test_router_close_message_has_no_response():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[ReplaceMessageInterceptor()])
+
+    router.route(process, create_message(MessageType.CLOSE), None)
+
+    assert process.script.posts == []
+
+
+class MetadataMessageInterceptor(MessageInterceptor):
+    def intercept(self, process: Process, message: Message):
+        message.metadata['tag'] = 'modified'
+
+
+def test_router_unchanged_response():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[ReplaceMessageInterceptor()])
+
+    router.route(process, create_message(MessageType.SEND, metadata={MetadataType.CONNECTION_ID: 'libc-1'}), b'test')
+
+    response, data = process.script.posts[0]
+    assert response == {'type': 'id-1', 'id': 'id-1', 'unchanged': True}
+    assert data is None
+
+
+def test_router_changed_metadata_response():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[MetadataMessageInterceptor()])
+
+    router.route(process, create_message(MessageType.RECV), b'test')
+
+    response, data = process.script.posts[0]
+    assert 'unchanged' not in response
+    assert response['metadata']['tag'] == 'modified'
+    assert data == b'test'
+
+
+def test_router_observe_only():
+    process = Process(pid=1, script=RecordingScript())
+    observed = []
+
+    class ObservingMessageInterceptor(MessageInterceptor):
+        def is_read_only(self) -> bool:
+            return True
+
+        def intercept(self, process: Process, message: Message):
+            observed.append(message.id)
+
+    router = MessageRouter(interceptors=[ObservingMessageInterceptor()], observe_only=True)
+    router.start()
+    router.route(process, create_message(MessageType.SEND, id='id-1'), b'test')
+    router.route(process, create_message(MessageType.CLOSE, id='id-2'), None)
+    router.stop()
+
+    assert observed == ['id-1', 'id-2']
+    assert process.script.posts == []
+
+
+def test_router_observe_only_never_drops_close():
+    process = Process(pid=1, script=RecordingScript())
+    observed = []
+    entered = threading.Event()
+    release = threading.Event()
+
+    class SlowObservingMessageInterceptor(MessageInterceptor):
+        def is_read_only(self) -> bool:
+            return True
+
+        def intercept(self, process: Process, message: Message):
+            entered.set()
+            release.wait(5)
+            observed.append(message.id)
+
+    router = MessageRouter(interceptors=[SlowObservingMessageInterceptor()], observe_only=True, queue_size=1)
+    router.start()
+    metadata = {'ci': 'libc-1', 'm': 'libc', 'h': 1}
+    router.route(process, create_message(MessageType.SEND, id='id-1', metadata=metadata), b'test')
+    assert entered.wait(5)
+    router.route(process, create_message(MessageType.SEND, id='id-2', metadata=metadata), b'test')
+    router.route(process, create_message(MessageType.SEND, id='id-3', metadata=metadata), b'test')
+
+    # Data message is dropped, while close waits for space in the full queue
+    close = create_message(MessageType.CLOSE, id='id-4', metadata={'h': 1})
+    closer = threading.Thread(target=router.route, args=(process, close, None))
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive()
+    release.set()
+    closer.join()
+    router.stop()
+
+    assert observed == ['id-1', 'id-2', 'id-4']
+    assert process.connections.get(1) is None
+
+
+def test_router_shards():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[ReplaceMessageInterceptor()], shards=4)
+    router.start()
+    for i in range(100):
+        router.route(process, create_message(MessageType.SEND, id=f'id-{i}', metadata={MetadataType.CONNECTION_ID: f'libc-{i % 10}'}), b'te[replace]st')
+    router.stop()
+
+    assert sorted(response['id'] for response, data in process.script.posts) == sorted(f'id-{i}' for i in range(100))
+    assert all(data == b'te[value]st' for response, data in process.script.posts)
+
+
+def test_router_batch():
+    process = Process(pid=1, script=RecordingScript())
+    observed = []
+
+    class ObservingMessageInterceptor(MessageInterceptor):
+        def intercept(self, process: Process, message: Message):
+            observed.append((message.id, message.data if isinstance(message, DataMessage) else None))
+
+    router = MessageRouter(interceptors=[ObservingMessageInterceptor()], observe_only=True)
+    router.start()
+    router.route(process, {'type': 'send', 'payload': {'type': 'b', 'messages': [
+        {'id': 'id-1', 'type': 's', 'o': 0, 'l': 2},
+        {'id': 'id-2', 'type': 'r', 'o': 2, 'l': 2},
+        {'id': 'id-3', 'type': 'c'},
+    ]}}, b'abcd')
+    router.stop()
+
+    assert observed == [('id-1', b'ab'), ('id-2', b'cd'), ('id-3', None)]
+
+
+def test_router_releases_closed_connections():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[])
+
+    router.route(process, create_message(MessageType.SEND, id='id-1', metadata={'ci': 'libc-1', 'm': 'libc', 'h': 1}), b'test')
+    assert process.connections.get(1).id == 'libc-1'
+
+    router.route(process, create_message(MessageType.CLOSE, id='id-2', metadata={'h': 1}), None)
+    assert process.connections.get(1) is None
+
+
+def test_router_stats():
+    process = Process(pid=1, script=RecordingScript())
+    router = MessageRouter(interceptors=[ReplaceMessageInterceptor(), ReplaceMessageInterceptor()], shards=2)
+    router.start()
+    router.route(process, create_message(MessageType.SEND, id='id-1'), b'te[replace]st')
+    router.route(process, create_message(MessageType.RECV, id='id-2'), b'test')
+    router.stop()
+
+    snapshot = router.snapshot()
+    assert snapshot['messages'] == {'send': 1, 'recv': 1}
+    assert snapshot['bytes'] == {'send': 13, 'recv': 4}
+    assert set(snapshot['interceptors']) == {'Replace', 'Replace#2'}
+    assert snapshot['dispatcher']['wait']['count'] == 2
+
+
+def test_router_fan_out():
+    process = Process(pid=1, script=RecordingScript())
+    observed = []
+    release = threading.Event()
+
+    class SlowObservingMessageInterceptor(MessageInterceptor):
+        def is_read_only(self) -> bool:
+            return True
+
+        def intercept(self, process: Process, message: Message):
+            release.wait(5)
+            observed.append((message.id, message.data if isinstance(message, DataMessage) else None))
+
+    router = MessageRouter(interceptors=[SlowObservingMessageInterceptor(), ReplaceMessageInterceptor()], shards=0, fan_out=True)
+    router.start()
+    router.route(process, create_message(MessageType.SEND, id='id-1', metadata={'ci': 'libc-1', 'm': 'libc', 'h': 1}), b'te[replace]st')
+    router.route(process, create_message(MessageType.CLOSE, id='id-2', metadata={'h': 1}), None)
+
+    # Response does not wait for the read-only interceptor, which also keeps the connection until it sees the close
+    assert process.script.posts[0][1] == b'te[value]st'
+    assert process.connections.get(1).id == 'libc-1'
+
+    release.set()
+    router.stop()
+
+    assert observed == [('id-1', b'te[replace]st'), ('id-2', None)]
+    assert process.connections.get(1) is None
+    assert router.snapshot()['fanOut']['SlowObserving']['dropped'] == 0
@@ -0,0 +1,13 @@
+from deluder.common import *
+from deluder.script import load_scripts
+
+
+def test_load_scripts_config_changes():
+    config = create_default_config()
+    config.filters = [{'name': 'dns', 'ports': [53], 'protocols': ['udp', 'udp6']}]
+
+    source = load_scripts(config, observe_only=True)
+
+    assert 'config.observeOnly = true;' in source
+    assert 'config.filters = [{"name": "dns", "ports": [53], "protocols": ["udp", "udp6"]}];' in source
+    assert source.index('config.filters =') < source.index('compileFilterRules(config.filters)')
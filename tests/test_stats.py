@@ -0,0 +1,49 @@
+import random
+
+from deluder.common import *
+from deluder.stats import LatencyHistogram, RouterStats, StatsReporter
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    values = list(range(1, 100001))
+    random.shuffle(values)
+    for value in values:
+        histogram.record(value * 1000)
+
+    assert histogram.count == 100000
+    assert histogram.max == 100000 * 1000
+    for percentile in (50, 95, 99):
+        expected = percentile * 1000 * 1000
+        assert abs(histogram.percentile(percentile) - expected) / expected < 0.125
+
+
+def test_latency_histogram_small_values():
+    histogram = LatencyHistogram()
+    for value in range(16):
+        histogram.record(value)
+
+    assert histogram.percentile(100) == 15
+    assert histogram.percentile(50) == 7
+
+
+def test_router_stats_snapshot():
+    stats = RouterStats()
+    stats.record_message(1, SendMessage('id-1', b'abcd', {}))
+    stats.record_message(1, RecvMessage('id-2', b'ab', {}))
+    stats.record_message(2, RecvMessage('id-3', b'abc', {}))
+    stats.record_message(2, CloseMessage('id-4', {}))
+    stats.record_interceptor('Log', 1, SendMessage('id-1', b'abcd', {}), 2000000)
+    stats.record_interceptor('Log', 2, RecvMessage('id-3', b'abc', {}), 4000000)
+    stats.record_route(1, SendMessage('id-1', b'abcd', {}), 3000000)
+
+    snapshot = stats.snapshot()
+
+    assert snapshot['messages'] == {'send': 1, 'recv': 2, 'close': 1}
+    assert snapshot['bytes'] == {'send': 4, 'recv': 5}
+    assert snapshot['interceptors']['Log']['send']['count'] == 1
+    assert snapshot['interceptors']['Log']['recv']['max'] == 4.0
+    assert snapshot['route']['send']['count'] == 1
+    assert snapshot['processes'][2]['messages'] == {'recv': 1, 'close': 1}
+    assert snapshot['processes'][2]['interceptors']['Log']['recv']['count'] == 1
+    assert 'Log[send]' in StatsReporter(1, stats.snapshot).format(snapshot)
@@ -0,0 +1,129 @@
+import pytest
+
+from typing import Tuple
+
+from deluder.common import *
+from deluder.stream import StreamBuffer, StreamError, StreamMessageInterceptor, StreamReassembler, create_framer_factory
+
+
+class RecordingCallback:
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, process: Process, message: Message, data: bytes):
+        self.messages.append((message.metadata[MetadataType.CONNECTION_ID], message.type, data))
+
+
+def create_reassembler(framing: dict, max_buffer_size: int=1024) -> Tuple[StreamReassembler, RecordingCallback]:
+    callback = RecordingCallback()
+    return StreamReassembler(create_framer_factory(framing), callback, max_buffer_size), callback
+
+
+def feed(reassembler: StreamReassembler, chunks: List[bytes], type: MessageType=MessageType.SEND, connection: str='libc-1'):
+    process = Process(pid=1)
+    for chunk in chunks:
+        clazz = SendMessage if type == MessageType.SEND else RecvMessage
+        reassembler.feed(process, clazz('id', chunk, {MetadataType.CONNECTION_ID: connection}))
+
+
+def test_stream_buffer():
+    buffer = StreamBuffer(max_size=8)
+    buffer.append(b'abcd')
+    buffer.append(b'ef')
+    assert buffer.find(b'cd') == 2
+    assert buffer.consume(3) == b'abc'
+    assert buffer.find(b'cd') == -1
+    assert buffer.peek(2, 1) == b'ef'
+    buffer.append(b'ghijk')
+    assert len(buffer) == 8
+    with pytest.raises(StreamError):
+        buffer.append(b'l')
+    assert buffer.consume(8) == b'defghijk'
+    assert len(buffer.data) == 0
+
+
+def test_stream_length_framing():
+    reassembler, callback = create_reassembler({'type': 'length', 'lengthSize': 2})
+
+    feed(reassembler, [b'\x00', b'\x03ab', b'c\x00\x01d\x00', b'\x00\x00\x02'])
+    feed(reassembler, [b'\x00\x02xy'], MessageType.RECV)
+
+    assert [data for _, _, data in callback.messages] == [b'\x00\x03abc', b'\x00\x01d', b'\x00\x00', b'\x00\x02xy']
+    assert callback.messages[-1][1] == MessageType.RECV
+    assert reassembler.snapshot() == {'streams': 2, 'bufferedBytes': 2, 'messages': 4, 'errors': 0}
+
+
+def test_stream_delimiter_framing():
+    reassembler, callback = create_reassembler({'type': 'delimiter', 'delimiter': '\r\n'})
+
+    feed(reassembler, [b'first\r', b'\nsecond\r\nthi', b'rd\r\n'])
+    feed(reassembler, [b'other\r\n'], connection='libc-2')
+
+    assert callback.messages == [
+        ('libc-1', MessageType.SEND, b'first\r\n'),
+        ('libc-1', MessageType.SEND, b'second\r\n'),
+        ('libc-1', MessageType.SEND, b'third\r\n'),
+        ('libc-2', MessageType.SEND, b'other\r\n'),
+    ]
+
+
+def test_stream_http_framing():
+    reassembler, callback = create_reassembler({'type': 'http'})
+    request = b'POST /a HTTP/1.1\r\nHost: test\r\nContent-Length: 4\r\n\r\nbody'
+    chunked = b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n2;x=y\r\nde\r\n0\r\n\r\n'
+    no_content = b'HTTP/1.1 204 No Content\r\n\r\n'
+    until_close = b'HTTP/1.0 200 OK\r\nServer: test\r\n\r\nrest of the data'
+
+    feed(reassembler, [request[:10], request[10:40], request[40:] + b'GET / HTTP/1.1\r\n\r\n'])
+    feed(reassembler, [chunked[:50], chunked[50:] + no_content + until_close[:20], until_close[20:]], MessageType.RECV)
+    assert [data for _, _, data in callback.messages] == [request, b'GET / HTTP/1.1\r\n\r\n', chunked, no_content]
+
+    # Response without length is completed by closing of the connection, which also releases the buffers
+    reassembler.feed(Process(pid=1), CloseMessage('id', {MetadataType.CONNECTION_ID: 'libc-1'}))
+    assert callback.messages[-1] == ('libc-1', MessageType.CLOSE, until_close)
+    assert reassembler.snapshot()['streams'] == 0
+
+
+def test_stream_http_head_framing():
+    reassembler, callback = create_reassembler({'type': 'http'})
+    head = b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\n'
+    get = b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello'
+
+    feed(reassembler, [b'HEAD / HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\n\r\n'])
+    feed(reassembler, [b'HTTP/1.1 100 Continue\r\n\r\n' + head + get], MessageType.RECV)
+
+    # Response to HEAD has no body even with Content-Length
+    assert [data for _, _, data in callback.messages][2:] == [b'HTTP/1.1 100 Continue\r\n\r\n', head, get]
+
+
+def test_stream_errors():
+    reassembler, callback = create_reassembler({'type': 'http'}, max_buffer_size=64)
+
+    feed(reassembler, [b'HTTP/1.1 OK\r\n\r\n'])
+    feed(reassembler, [b'x' * 65], MessageType.RECV)
+    feed(reassembler, [b'GET / HTTP/1.1\r\n\r\n'])
+
+    assert [data for _, _, data in callback.messages] == [b'GET / HTTP/1.1\r\n\r\n']
+    assert reassembler.snapshot()['errors'] == 2
+
+    with pytest.raises(StreamError):
+        create_framer_factory({'type': 'unknown'})
+    with pytest.raises(StreamError):
+        create_framer_factory({'type': 'length', 'lengthSize': 3})
+
+
+def test_stream_interceptor():
+    received = []
+
+    class LinesMessageInterceptor(StreamMessageInterceptor):
+        def intercept_stream(self, process: Process, message: Message, data: bytes):
+            received.append(data)
+
+    interceptor = LinesMessageInterceptor({'framing': {'type': 'delimiter', 'delimiterHex': '00'}})
+    interceptor.init()
+    for chunk in (b'ab', b'c\x00d', b'\x00e'):
+        interceptor.intercept(Process(pid=1), SendMessage('id', chunk, {MetadataType.CONNECTION_ID: 'libc-1'}))
+
+    assert interceptor.is_read_only()
+    assert received == [b'abc\x00', b'd\x00']
+    assert interceptor.stats()['bufferedBytes'] == 1
@@ -0,0 +1,15 @@
+import pytest
+
+from deluder.common import DeluderException
+from deluder.transport import Endpoint, parse_endpoint
+
+
+def test_parse_endpoint():
+    assert parse_endpoint('127.0.0.1', 8008) == Endpoint(host='127.0.0.1', port=8008)
+    assert parse_endpoint('unix:/tmp/petep.sock', 8008) == Endpoint(path='/tmp/petep.sock')
+    assert parse_endpoint('unix:@petep').get_address() == '\0petep'
+    assert str(parse_endpoint('unix:/tmp/petep.sock')) == 'unix:/tmp/petep.sock'
+    assert str(parse_endpoint('localhost', 8008)) == 'localhost:8008'
+
+    with pytest.raises(DeluderException):
+        parse_endpoint('unix:')
@@ -1,5 +1,10 @@
+import pytest
+import socket
+
+from threading import Thread
+
 from tests.utils import generate_all_bytes, load_file
-from deluder.utils import format_bytes
+from deluder.utils import LazyFormattedBytes, format_bytes, recv_n, recv_until, send_all
 
 
 def test_format_bytes():
@@ -8,3 +13,59 @@ def test_format_bytes():
     actual_text = format_bytes(all_bytes)
 
     assert actual_text == expected_text.replace("\r", "")
+
+
+def test_format_bytes_max_bytes():
+    data = bytes(range(100))
+    lines = format_bytes(data, 40).splitlines()
+
+    assert lines[1].startswith('00000000  00 01 02')
+    assert lines[2] == '... 64 bytes omitted ...'
+    assert lines[3].startswith('00000050  50 51 52')
+    assert lines[4].startswith('00000060  60 61 62 63 ')
+    assert len(lines) == 5
+    assert format_bytes(data, 100) == format_bytes(data)
+    assert format_bytes(bytearray(data), 40) == format_bytes(memoryview(data), 40) == '\n'.join(lines) + '\n'
+
+
+def test_lazy_formatted_bytes():
+    assert str(LazyFormattedBytes(b'test', 0)) == format_bytes(b'test')
+
+
+def test_send_all_recv_n():
+    sending_sock, receiving_sock = socket.socketpair()
+    try:
+        data = generate_all_bytes() * 4096
+        sender = Thread(target=send_all, args=(sending_sock, b'head', b'', memoryview(data)))
+        sender.start()
+        assert recv_n(receiving_sock, 4) == b'head'
+        assert recv_n(receiving_sock, len(data)) == data
+        sender.join()
+
+        sending_sock.close()
+        with pytest.raises(Exception):
+            recv_n(receiving_sock, 1)
+    finally:
+        sending_sock.close()
+        receiving_sock.close()
+
+
+def test_recv_until():
+    sending_sock, receiving_sock = socket.socketpair()
+    try:
+        data = generate_all_bytes() * 1024
+        sender = Thread(target=send_all, args=(sending_sock, data, b'[D_END]'))
+        sender.start()
+        assert recv_until(receiving_sock, b'[D_END]', 1000) == data
+        sender.join()
+
+        # Suffix split between multiple reads
+        send_all(sending_sock, b'second[D_END]')
+        assert recv_until(receiving_sock, b'[D_END]', 3) == b'second'
+
+        # Empty data
+        send_all(sending_sock, b'[D_END]')
+        assert recv_until(receiving_sock, b'[D_END]', 1) == b''
+    finally:
+        sending_sock.close()
+        receiving_sock.close()
@@ -1,3 +1,8 @@
+import os
+import socket
+import tempfile
+import uuid
+
 from pathlib import Path
 
 
@@ -16,3 +21,22 @@ def generate_all_bytes() -> bytes:
         byte += 0x01
     byte_array.append(byte)
     return bytes(byte_array)
+
+
+def unique_unix_host(name: str, abstract: bool=False) -> str:
+    """
+    Creates unix host with unique socket path (or abstract name), so that tests never share sockets
+    """
+    name = f'{name}-{uuid.uuid4().hex}'
+    if abstract:
+        return 'unix:@' + name
+    return 'unix:' + os.path.join(tempfile.gettempdir(), name + '.sock')
+
+
+def reserve_free_port() -> int:
+    """
+    Finds free local port for servers, which are bound by the code under test
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]